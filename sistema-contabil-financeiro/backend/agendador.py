@@ -0,0 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from flask import current_app, has_app_context
+from src.services.instrumentacao import Instrumentacao
+import time
+
+class AgendadorCalculo:
+    """
+    Executa um grafo de cálculos (nós com dependências) uma única vez por nó,
+    rodando em paralelo os nós cujas dependências já foram concluídas.
+    Cada nó roda em um app context próprio, com sua própria sessão do banco.
+    """
+    
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self._nos = {}
+    
+    def adicionar(self, nome, funcao, dependencias=()):
+        """Registra um nó: funcao() só é chamada após todas as dependências"""
+        self._nos[nome] = (funcao, tuple(dependencias))
+    
+    def executar(self):
+        """
+        Executa o grafo e retorna os resultados, o tempo de cada nó (em segundos)
+        e os erros. Um nó cuja dependência falhou não é executado.
+        """
+        self._validar()
+        
+        app = current_app._get_current_object() if has_app_context() else None
+        resultados = {}
+        tempos = {}
+        erros = {}
+        pendentes = dict(self._nos)
+        em_execucao = {}
+        inicio_total = time.perf_counter()
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pendentes or em_execucao:
+                # Descartar nós cujas dependências falharam
+                for nome, (funcao, dependencias) in list(pendentes.items()):
+                    falhas = [dependencia for dependencia in dependencias if dependencia in erros]
+                    if falhas:
+                        erros[nome] = f'Dependência não calculada: {", ".join(falhas)}'
+                        del pendentes[nome]
+                
+                # Submeter os nós prontos
+                for nome, (funcao, dependencias) in list(pendentes.items()):
+                    if all(dependencia in resultados for dependencia in dependencias):
+                        # Os nós somam na medição da requisição que executa o grafo
+                        futuro = executor.submit(AgendadorCalculo._executar_no, app, Instrumentacao.vincular(funcao))
+                        em_execucao[futuro] = nome
+                        del pendentes[nome]
+                
+                if not em_execucao:
+                    continue
+                
+                concluidos, _ = wait(em_execucao, return_when=FIRST_COMPLETED)
+                for futuro in concluidos:
+                    nome = em_execucao.pop(futuro)
+                    resultado, duracao, erro = futuro.result()
+                    tempos[nome] = duracao
+                    if erro is None:
+                        resultados[nome] = resultado
+                    else:
+                        erros[nome] = str(erro)
+        
+        tempos['total'] = time.perf_counter() - inicio_total
+        
+        return {
+            'resultados': resultados,
+            'tempos': tempos,
+            'erros': erros
+        }
+    
+    def _validar(self):
+        """Verifica dependências inexistentes e ciclos no grafo"""
+        for nome, (funcao, dependencias) in self._nos.items():
+            for dependencia in dependencias:
+                if dependencia not in self._nos:
+                    raise ValueError(f'Nó {nome} depende de {dependencia}, que não foi registrado')
+        
+        visitados = set()
+        restantes = dict(self._nos)
+        while restantes:
+            prontos = [
+                nome for nome, (funcao, dependencias) in restantes.items()
+                if all(dependencia in visitados for dependencia in dependencias)
+            ]
+            if not prontos:
+                raise ValueError(f'Ciclo de dependências entre: {", ".join(sorted(restantes))}')
+            for nome in prontos:
+                visitados.add(nome)
+                del restantes[nome]
+    
+    @staticmethod
+    def _executar_no(app, funcao):
+        inicio = time.perf_counter()
+        try:
+            if app is None:
+                resultado = funcao()
+            else:
+                with app.app_context():
+                    resultado = funcao()
+            return resultado, time.perf_counter() - inicio, None
+        except Exception as e:
+            return None, time.perf_counter() - inicio, e
@@ -0,0 +1,164 @@
+from src.models.balancete import Balancete
+from src.models.user import db
+import numpy as np
+
+# Faixas de classificação usadas pelas análises (limites inferiores exclusivos)
+FAIXAS_TENDENCIA = (
+    (10.0, 'crescimento_forte'),
+    (0.0, 'crescimento_moderado'),
+    (-10.0, 'decrescimo_moderado')
+)
+TENDENCIA_PADRAO = 'decrescimo_forte'
+
+FAIXAS_RELEVANCIA = (
+    (20.0, 'muito_relevante'),
+    (10.0, 'relevante'),
+    (5.0, 'moderadamente_relevante')
+)
+RELEVANCIA_PADRAO = 'pouco_relevante'
+
+
+class BalanceteColunar:
+    """
+    Balancetes de um ou mais períodos em representação colunar: um índice de
+    contas alinhado (ordem de primeira ocorrência) e uma matriz de saldos
+    contas x períodos, carregados em uma única consulta.
+    """
+    
+    def __init__(self, periodos, codigos, nomes, saldos, presentes, linhas):
+        self.periodos = list(periodos)
+        self.codigos = codigos  # Lista de códigos (posição = linha da matriz)
+        self.nomes = nomes
+        self.saldos = saldos  # np.ndarray float64 (contas x períodos)
+        self.presentes = presentes  # np.ndarray bool: conta consta do balancete do período
+        self.linhas = linhas  # Linhas brutas por período: periodo -> (codigos, nomes, saldos)
+    
+    @classmethod
+    def carregar(cls, periodos, versao_balancete='1.0'):
+        """
+        Carrega os balancetes dos períodos informados. Quando uma conta aparece
+        mais de uma vez no mesmo período, prevalece a última linha importada.
+        """
+        periodos = list(dict.fromkeys(periodos))
+        
+        resultado = db.session.query(
+            Balancete.periodo, Balancete.codigo_conta, Balancete.nome_conta, Balancete.saldo_final
+        ).filter(
+            Balancete.periodo.in_(periodos),
+            Balancete.versao_balancete == versao_balancete
+        ).order_by(Balancete.id).all()
+        
+        return cls._montar(periodos, resultado)
+    
+    @classmethod
+    def carregar_intervalo(cls, periodo_inicial, periodo_final, versao_balancete='1.0'):
+        """
+        Carrega em uma única consulta os balancetes de todos os períodos do
+        intervalo (YYYY-MM, inclusive); os períodos ficam em ordem cronológica
+        e apenas os que possuem balancete são incluídos.
+        """
+        resultado = db.session.query(
+            Balancete.periodo, Balancete.codigo_conta, Balancete.nome_conta, Balancete.saldo_final
+        ).filter(
+            Balancete.periodo >= periodo_inicial,
+            Balancete.periodo <= periodo_final,
+            Balancete.versao_balancete == versao_balancete
+        ).order_by(Balancete.id).all()
+        
+        periodos = sorted({linha.periodo for linha in resultado})
+        return cls._montar(periodos, resultado)
+    
+    @classmethod
+    def _montar(cls, periodos, resultado):
+        coluna_por_periodo = {periodo: coluna for coluna, periodo in enumerate(periodos)}
+        
+        # Agrupar as linhas por período, preservando a ordem de importação
+        linhas = {periodo: ([], [], []) for periodo in periodos}
+        for periodo, codigo_conta, nome_conta, saldo_final in resultado:
+            codigos_periodo, nomes_periodo, saldos_periodo = linhas[periodo]
+            codigos_periodo.append(codigo_conta)
+            nomes_periodo.append(nome_conta)
+            saldos_periodo.append(float(saldo_final) if saldo_final else 0.0)
+        
+        # Índice de contas alinhado: ordem de primeira ocorrência, período a período
+        posicao_por_codigo = {}
+        codigos = []
+        nomes = []
+        for periodo in periodos:
+            codigos_periodo, nomes_periodo, saldos_periodo = linhas[periodo]
+            for codigo_conta, nome_conta in zip(codigos_periodo, nomes_periodo):
+                if codigo_conta not in posicao_por_codigo:
+                    posicao_por_codigo[codigo_conta] = len(codigos)
+                    codigos.append(codigo_conta)
+                    nomes.append(nome_conta)
+        
+        saldos = np.zeros((len(codigos), len(periodos)), dtype=np.float64)
+        presentes = np.zeros((len(codigos), len(periodos)), dtype=bool)
+        
+        for periodo, (codigos_periodo, nomes_periodo, saldos_periodo) in linhas.items():
+            if not codigos_periodo:
+                continue
+            posicoes = np.fromiter(
+                (posicao_por_codigo[codigo] for codigo in codigos_periodo), dtype=np.int64, count=len(codigos_periodo)
+            )
+            coluna = coluna_por_periodo[periodo]
+            # Atribuição em ordem: a última linha de uma conta repetida prevalece
+            saldos[posicoes, coluna] = np.asarray(saldos_periodo, dtype=np.float64)
+            presentes[posicoes, coluna] = True
+        
+        return cls(periodos, codigos, nomes, saldos, presentes, {
+            periodo: (codigos_periodo, nomes_periodo, np.asarray(saldos_periodo, dtype=np.float64))
+            for periodo, (codigos_periodo, nomes_periodo, saldos_periodo) in linhas.items()
+        })
+    
+    def coluna(self, periodo):
+        """Vetor de saldos do período, alinhado ao índice de contas"""
+        return self.saldos[:, self.periodos.index(periodo)]
+    
+    def possui_periodo(self, periodo):
+        """Indica se há linhas de balancete carregadas para o período"""
+        return periodo in self.linhas and len(self.linhas[periodo][0]) > 0
+
+
+def variacao_percentual(saldo_base, saldo_comparacao):
+    """
+    Variação percentual vetorizada em relação a abs(saldo_base); quando a base
+    é zero, 100% se houve saldo na comparação e 0% caso contrário
+    """
+    saldo_base = np.asarray(saldo_base, dtype=np.float64)
+    saldo_comparacao = np.asarray(saldo_comparacao, dtype=np.float64)
+    variacao_absoluta = saldo_comparacao - saldo_base
+    
+    base_abs = np.abs(saldo_base)
+    com_base = base_abs != 0
+    percentual = np.where(saldo_comparacao != 0, 100.0, 0.0)
+    np.divide(variacao_absoluta, base_abs, out=percentual, where=com_base)
+    np.multiply(percentual, 100, out=percentual, where=com_base)
+    
+    return variacao_absoluta, percentual
+
+
+def classificar(valores, faixas, padrao):
+    """Classifica os valores pelas faixas (limite, rótulo), da maior para a menor"""
+    valores = np.asarray(valores, dtype=np.float64)
+    return np.select([valores > limite for limite, rotulo in faixas], [rotulo for limite, rotulo in faixas], padrao)
+
+
+def indices_maiores(valores, k=None):
+    """
+    Índices dos k maiores valores em ordem decrescente (empates pela posição).
+    Usa seleção parcial (np.partition) quando k é menor que o total, sem
+    ordenar todo o vetor.
+    """
+    valores = np.asarray(valores, dtype=np.float64)
+    total = len(valores)
+    
+    if k is None or k >= total:
+        return np.argsort(-valores, kind='stable')
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    
+    limite = np.partition(valores, total - k)[total - k]
+    candidatos = np.flatnonzero(valores >= limite)
+    ordem = np.lexsort((candidatos, -valores[candidatos]))
+    return candidatos[ordem][:k]
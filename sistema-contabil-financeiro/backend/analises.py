@@ -1,67 +1,57 @@
-from src.models.balancete import Balancete
-from src.models.plano_contas import PlanoContas
-from src.models.demonstracoes import DemonstracaoFinanceira
+from src.models.demonstracoes import DemonstracaoFinanceira, LinhaDemonstracao
 from src.models.user import db
-import json
+from src.models.roteamento import Roteamento
+from src.services.plano_contas_cache import PlanoContasCache
+from src.services.analise_colunar import (
+    BalanceteColunar, FAIXAS_TENDENCIA, TENDENCIA_PADRAO, FAIXAS_RELEVANCIA, RELEVANCIA_PADRAO,
+    variacao_percentual, classificar, indices_maiores
+)
+from src.services.instrumentacao import Instrumentacao
 from decimal import Decimal
 from datetime import datetime
+import numpy as np
 
 class AnaliseFinanceiraService:
     
     @staticmethod
-    def calcular_analise_horizontal(periodo_base, periodo_comparacao, versao_balancete='1.0'):
+    @Instrumentacao.servico('calcular_analise_horizontal')
+    @Roteamento.somente_leitura()
+    def calcular_analise_horizontal(periodo_base, periodo_comparacao, versao_balancete='1.0', limite=None):
         """
-        Calcula a análise horizontal comparando dois períodos
+        Calcula a análise horizontal comparando dois períodos.
+        Com limite, retorna apenas as limite contas de maior variação percentual
+        (o resumo continua considerando todas as contas).
         """
         try:
-            # Obter balancetes dos dois períodos
-            balancete_base = Balancete.get_by_periodo(periodo_base, versao_balancete)
-            balancete_comparacao = Balancete.get_by_periodo(periodo_comparacao, versao_balancete)
+            # Obter balancetes dos dois períodos em uma única consulta
+            colunar = BalanceteColunar.carregar([periodo_base, periodo_comparacao], versao_balancete)
             
-            if not balancete_base or not balancete_comparacao:
+            if not colunar.possui_periodo(periodo_base) or not colunar.possui_periodo(periodo_comparacao):
                 return {
                     'success': False,
                     'message': 'Balancetes não encontrados para os períodos especificados'
                 }
             
-            # Criar dicionários para facilitar comparação
-            saldos_base = {b.codigo_conta: float(b.saldo_final) for b in balancete_base}
-            saldos_comparacao = {b.codigo_conta: float(b.saldo_final) for b in balancete_comparacao}
+            # Calcular variações sobre os vetores de saldos alinhados por conta
+            saldos_base = colunar.coluna(periodo_base)
+            saldos_comparacao = colunar.coluna(periodo_comparacao)
+            variacoes_absolutas, variacoes_percentuais = variacao_percentual(saldos_base, saldos_comparacao)
+            tendencias = classificar(variacoes_percentuais, FAIXAS_TENDENCIA, TENDENCIA_PADRAO)
             
-            # Calcular variações
-            analise_horizontal = []
-            
-            # Obter todas as contas únicas
-            todas_contas = set(saldos_base.keys()) | set(saldos_comparacao.keys())
-            
-            for codigo_conta in todas_contas:
-                saldo_base = saldos_base.get(codigo_conta, 0.0)
-                saldo_comparacao = saldos_comparacao.get(codigo_conta, 0.0)
-                
-                # Calcular variação absoluta e percentual
-                variacao_absoluta = saldo_comparacao - saldo_base
-                
-                if saldo_base != 0:
-                    variacao_percentual = (variacao_absoluta / abs(saldo_base)) * 100
-                else:
-                    variacao_percentual = 100.0 if saldo_comparacao != 0 else 0.0
-                
-                # Obter nome da conta
-                conta = Balancete.query.filter_by(codigo_conta=codigo_conta).first()
-                nome_conta = conta.nome_conta if conta else codigo_conta
-                
-                analise_horizontal.append({
-                    'codigo_conta': codigo_conta,
-                    'nome_conta': nome_conta,
-                    'saldo_base': saldo_base,
-                    'saldo_comparacao': saldo_comparacao,
-                    'variacao_absoluta': variacao_absoluta,
-                    'variacao_percentual': variacao_percentual,
-                    'tendencia': AnaliseFinanceiraService._classificar_tendencia(variacao_percentual)
-                })
+            def linha(posicao):
+                return {
+                    'codigo_conta': colunar.codigos[posicao],
+                    'nome_conta': colunar.nomes[posicao],
+                    'saldo_base': float(saldos_base[posicao]),
+                    'saldo_comparacao': float(saldos_comparacao[posicao]),
+                    'variacao_absoluta': float(variacoes_absolutas[posicao]),
+                    'variacao_percentual': float(variacoes_percentuais[posicao]),
+                    'tendencia': str(tendencias[posicao])
+                }
             
-            # Ordenar por variação percentual (maior para menor)
-            analise_horizontal.sort(key=lambda x: abs(x['variacao_percentual']), reverse=True)
+            # Ordenar por variação percentual (maior para menor, em módulo)
+            ordem = indices_maiores(np.abs(variacoes_percentuais), limite)
+            analise_horizontal = [linha(posicao) for posicao in ordem.tolist()]
             
             return {
                 'success': True,
@@ -69,7 +59,7 @@ class AnaliseFinanceiraService:
                     'periodo_base': periodo_base,
                     'periodo_comparacao': periodo_comparacao,
                     'analise_horizontal': analise_horizontal,
-                    'resumo': AnaliseFinanceiraService._gerar_resumo_horizontal(analise_horizontal)
+                    'resumo': AnaliseFinanceiraService._gerar_resumo_horizontal(variacoes_percentuais, linha)
                 }
             }
             
@@ -80,77 +70,165 @@ class AnaliseFinanceiraService:
             }
     
     @staticmethod
-    def calcular_analise_vertical(periodo, versao_balancete='1.0'):
+    @Instrumentacao.servico('calcular_matriz_tendencia')
+    @Roteamento.somente_leitura()
+    def calcular_matriz_tendencia(periodo_inicial, periodo_final, versao_balancete='1.0', periodo_base=None, limite=None):
+        """
+        Calcula a análise horizontal de N períodos (matriz contas x períodos):
+        saldos, variações em relação ao período base e ao período anterior e a
+        tendência de cada conta, a partir de uma única carga dos balancetes.
+        Com limite, retorna apenas as contas de maior variação no intervalo.
+        """
+        try:
+            colunar = BalanceteColunar.carregar_intervalo(periodo_inicial, periodo_final, versao_balancete)
+            periodos = colunar.periodos
+            
+            if len(periodos) < 2:
+                return {
+                    'success': False,
+                    'message': 'São necessários balancetes de ao menos dois períodos no intervalo especificado'
+                }
+            
+            periodo_base = periodo_base or periodos[0]
+            if periodo_base not in periodos:
+                return {
+                    'success': False,
+                    'message': 'Balancete não encontrado para o período base especificado'
+                }
+            
+            saldos = colunar.saldos
+            
+            # Variações em relação ao período base (todas as colunas)
+            saldos_base = np.broadcast_to(colunar.coluna(periodo_base)[:, None], saldos.shape)
+            variacoes_base, percentuais_base = variacao_percentual(saldos_base, saldos)
+            
+            # Variações em relação ao período anterior (a partir da segunda coluna)
+            variacoes_anterior, percentuais_anterior = variacao_percentual(saldos[:, :-1], saldos[:, 1:])
+            tendencias_anterior = classificar(percentuais_anterior, FAIXAS_TENDENCIA, TENDENCIA_PADRAO)
+            
+            # Tendência da conta no intervalo: do período base até o último período
+            percentuais_intervalo = percentuais_base[:, -1]
+            tendencias = classificar(percentuais_intervalo, FAIXAS_TENDENCIA, TENDENCIA_PADRAO)
+            
+            # Converter as matrizes de uma vez (bem mais rápido que elemento a elemento)
+            saldos_lista = saldos.tolist()
+            variacoes_base_lista = variacoes_base.tolist()
+            percentuais_base_lista = percentuais_base.tolist()
+            variacoes_anterior_lista = variacoes_anterior.tolist()
+            percentuais_anterior_lista = percentuais_anterior.tolist()
+            tendencias_anterior_lista = tendencias_anterior.tolist()
+            tendencias_lista = tendencias.tolist()
+            
+            contas = []
+            for posicao in indices_maiores(np.abs(percentuais_intervalo), limite).tolist():
+                contas.append({
+                    'codigo_conta': colunar.codigos[posicao],
+                    'nome_conta': colunar.nomes[posicao],
+                    'saldos': saldos_lista[posicao],
+                    'variacao_base': {
+                        'absoluta': variacoes_base_lista[posicao],
+                        'percentual': percentuais_base_lista[posicao]
+                    },
+                    'variacao_anterior': {
+                        'absoluta': [None] + variacoes_anterior_lista[posicao],
+                        'percentual': [None] + percentuais_anterior_lista[posicao]
+                    },
+                    'tendencias': [None] + tendencias_anterior_lista[posicao],
+                    'tendencia': tendencias_lista[posicao]
+                })
+            
+            return {
+                'success': True,
+                'data': {
+                    'periodos': periodos,
+                    'periodo_base': periodo_base,
+                    'contas': contas,
+                    'resumo': {
+                        'total_contas': len(colunar.codigos),
+                        'total_periodos': len(periodos),
+                        'contas_crescimento': int(np.count_nonzero(percentuais_intervalo > 0)),
+                        'contas_decrescimo': int(np.count_nonzero(percentuais_intervalo < 0))
+                    }
+                }
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'message': f'Erro ao calcular matriz de tendência: {str(e)}'
+            }
+    
+    @staticmethod
+    @Instrumentacao.servico('calcular_analise_vertical')
+    @Roteamento.somente_leitura()
+    def calcular_analise_vertical(periodo, versao_balancete='1.0', limite=None):
         """
-        Calcula a análise vertical para um período específico
+        Calcula a análise vertical para um período específico.
+        Com limite, retorna apenas as limite contas de maior participação em cada
+        elemento (o resumo continua considerando todas as contas).
         """
         try:
             # Obter balancete do período
-            balancete = Balancete.get_by_periodo(periodo, versao_balancete)
+            colunar = BalanceteColunar.carregar([periodo], versao_balancete)
             
-            if not balancete:
+            if not colunar.possui_periodo(periodo):
                 return {
                     'success': False,
                     'message': 'Balancete não encontrado para o período especificado'
                 }
             
-            # Separar contas por tipo (ativo, passivo, receita, etc.)
-            contas_por_tipo = {}
-            totais_por_tipo = {}
+            codigos, nomes, saldos = colunar.linhas[periodo]
             
-            for conta in balancete:
-                # Obter informações do plano de contas
-                plano_conta = PlanoContas.get_by_codigo(conta.codigo_conta)
-                
-                if plano_conta:
-                    elemento = plano_conta.elemento_conta
-                    saldo = float(conta.saldo_final)
-                    
-                    if elemento not in contas_por_tipo:
-                        contas_por_tipo[elemento] = []
-                        totais_por_tipo[elemento] = 0.0
-                    
-                    contas_por_tipo[elemento].append({
-                        'codigo_conta': conta.codigo_conta,
-                        'nome_conta': conta.nome_conta,
-                        'saldo': saldo
-                    })
-                    
-                    totais_por_tipo[elemento] += abs(saldo)
+            # Separar as linhas por elemento (ativo, passivo, receita, etc.) pelo plano em cache
+            plano = PlanoContasCache.obter()
+            elementos_linhas = [plano.get_elemento(codigo) for codigo in codigos]
+            elementos = list(dict.fromkeys(elemento for elemento in elementos_linhas if elemento is not None))
+            indice_elemento = {elemento: indice for indice, elemento in enumerate(elementos)}
+            indices_linhas = np.fromiter(
+                (indice_elemento.get(elemento, -1) for elemento in elementos_linhas), dtype=np.int64, count=len(codigos)
+            )
             
             # Calcular percentuais
             analise_vertical = {}
+            resumo = {}
             
-            for elemento, contas in contas_por_tipo.items():
-                total_elemento = totais_por_tipo[elemento]
+            for indice, elemento in enumerate(elementos):
+                posicoes = np.flatnonzero(indices_linhas == indice)
+                valores = np.abs(saldos[posicoes])
+                total_elemento = float(valores.sum())
+                
+                if total_elemento != 0:
+                    percentuais = (valores / total_elemento) * 100
+                else:
+                    percentuais = np.zeros(len(posicoes))
                 
-                contas_com_percentual = []
-                for conta in contas:
-                    if total_elemento != 0:
-                        percentual = (abs(conta['saldo']) / total_elemento) * 100
-                    else:
-                        percentual = 0.0
-                    
-                    contas_com_percentual.append({
-                        **conta,
-                        'percentual': percentual,
-                        'classificacao': AnaliseFinanceiraService._classificar_relevancia(percentual)
-                    })
+                classificacoes = classificar(percentuais, FAIXAS_RELEVANCIA, RELEVANCIA_PADRAO)
+                
+                def linha(i):
+                    posicao = posicoes[i]
+                    return {
+                        'codigo_conta': codigos[posicao],
+                        'nome_conta': nomes[posicao],
+                        'saldo': float(saldos[posicao]),
+                        'percentual': float(percentuais[i]),
+                        'classificacao': str(classificacoes[i])
+                    }
                 
                 # Ordenar por percentual (maior para menor)
-                contas_com_percentual.sort(key=lambda x: x['percentual'], reverse=True)
+                ordem = indices_maiores(percentuais, limite).tolist()
                 
                 analise_vertical[elemento] = {
-                    'contas': contas_com_percentual,
+                    'contas': [linha(i) for i in ordem],
                     'total': total_elemento
                 }
+                resumo[elemento] = AnaliseFinanceiraService._gerar_resumo_vertical(percentuais, linha)
             
             return {
                 'success': True,
                 'data': {
                     'periodo': periodo,
                     'analise_vertical': analise_vertical,
-                    'resumo': AnaliseFinanceiraService._gerar_resumo_vertical(analise_vertical)
+                    'resumo': resumo
                 }
             }
             
@@ -161,6 +239,8 @@ class AnaliseFinanceiraService:
             }
     
     @staticmethod
+    @Instrumentacao.servico('calcular_indicadores_financeiros')
+    @Roteamento.somente_leitura()
     def calcular_indicadores_financeiros(periodo, versao_balancete='1.0'):
         """
         Calcula indicadores financeiros para um período
@@ -176,8 +256,8 @@ class AnaliseFinanceiraService:
                     'message': 'Demonstrações necessárias não encontradas. Gere o BP e DRE primeiro.'
                 }
             
-            dados_bp = json.loads(bp.dados_json)
-            dados_dre = json.loads(dre.dados_json)
+            dados_bp = bp.get_dados()
+            dados_dre = dre.get_dados()
             
             # Extrair valores necessários
             ativo_total = dados_bp['ativo']['total']
@@ -220,64 +300,96 @@ class AnaliseFinanceiraService:
             }
     
     @staticmethod
-    def _classificar_tendencia(variacao_percentual):
-        """Classifica a tendência baseada na variação percentual"""
-        if variacao_percentual > 10:
-            return 'crescimento_forte'
-        elif variacao_percentual > 0:
-            return 'crescimento_moderado'
-        elif variacao_percentual > -10:
-            return 'decrescimo_moderado'
-        else:
-            return 'decrescimo_forte'
+    @Roteamento.somente_leitura()
+    def obter_series_demonstracao(tipo_demonstracao, codigos, periodo_inicial=None, periodo_final=None, versao_balancete='1.0'):
+        """
+        Valores de linhas de uma demonstração (ex.: DRE 'indicadores.lucro_operacional')
+        em todos os períodos gerados do intervalo, lidos da tabela de linhas em uma
+        única consulta, sem carregar as demonstrações completas
+        """
+        try:
+            if not codigos:
+                return {
+                    'success': False,
+                    'message': 'Informe ao menos um código de linha'
+                }
+            
+            series = {codigo: {} for codigo in codigos}
+            periodos = set()
+            for codigo_linha, periodo, valor in LinhaDemonstracao.get_series(
+                tipo_demonstracao, codigos, periodo_inicial, periodo_final, versao_balancete
+            ):
+                series[codigo_linha][periodo] = valor
+                periodos.add(periodo)
+            
+            return {
+                'success': True,
+                'data': {
+                    'tipo_demonstracao': tipo_demonstracao,
+                    'periodos': sorted(periodos),
+                    'series': series
+                }
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'message': f'Erro ao obter séries da demonstração: {str(e)}'
+            }
     
     @staticmethod
-    def _classificar_relevancia(percentual):
-        """Classifica a relevância baseada no percentual"""
-        if percentual > 20:
-            return 'muito_relevante'
-        elif percentual > 10:
-            return 'relevante'
-        elif percentual > 5:
-            return 'moderadamente_relevante'
-        else:
-            return 'pouco_relevante'
+    @Roteamento.somente_leitura()
+    def listar_linhas_demonstracao(tipo_demonstracao, periodo, versao_balancete='1.0'):
+        """Linhas (código, descrição, nível e valor) de uma demonstração gerada"""
+        try:
+            linhas = LinhaDemonstracao.get_linhas(tipo_demonstracao, periodo, versao_balancete)
+            
+            if not linhas:
+                return {
+                    'success': False,
+                    'message': f'{tipo_demonstracao} não encontrada para o período especificado'
+                }
+            
+            return {
+                'success': True,
+                'data': [linha.to_dict() for linha in linhas]
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'message': f'Erro ao listar linhas da demonstração: {str(e)}'
+            }
     
     @staticmethod
-    def _gerar_resumo_horizontal(analise_horizontal):
-        """Gera resumo da análise horizontal"""
-        total_contas = len(analise_horizontal)
-        crescimento = len([a for a in analise_horizontal if a['variacao_percentual'] > 0])
-        decrescimo = len([a for a in analise_horizontal if a['variacao_percentual'] < 0])
+    def _gerar_resumo_horizontal(variacoes_percentuais, linha):
+        """Gera resumo da análise horizontal a partir do vetor de variações percentuais"""
+        crescimento = np.flatnonzero(variacoes_percentuais > 0)
+        decrescimo = np.flatnonzero(variacoes_percentuais < 0)
         
-        # Maiores variações
-        maiores_crescimentos = [a for a in analise_horizontal if a['variacao_percentual'] > 0][:5]
-        maiores_decrescimos = [a for a in analise_horizontal if a['variacao_percentual'] < 0][:5]
+        # Maiores variações (seleção parcial, sem ordenar todas as contas)
+        maiores_crescimentos = crescimento[indices_maiores(np.abs(variacoes_percentuais[crescimento]), 5)]
+        maiores_decrescimos = decrescimo[indices_maiores(np.abs(variacoes_percentuais[decrescimo]), 5)]
         
         return {
-            'total_contas': total_contas,
-            'contas_crescimento': crescimento,
-            'contas_decrescimo': decrescimo,
-            'maiores_crescimentos': maiores_crescimentos,
-            'maiores_decrescimos': maiores_decrescimos
+            'total_contas': len(variacoes_percentuais),
+            'contas_crescimento': len(crescimento),
+            'contas_decrescimo': len(decrescimo),
+            'maiores_crescimentos': [linha(posicao) for posicao in maiores_crescimentos.tolist()],
+            'maiores_decrescimos': [linha(posicao) for posicao in maiores_decrescimos.tolist()]
         }
     
     @staticmethod
-    def _gerar_resumo_vertical(analise_vertical):
-        """Gera resumo da análise vertical"""
-        resumo = {}
-        
-        for elemento, dados in analise_vertical.items():
-            contas_relevantes = [c for c in dados['contas'] if c['percentual'] > 10]
-            
-            resumo[elemento] = {
-                'total_contas': len(dados['contas']),
-                'contas_relevantes': len(contas_relevantes),
-                'maior_conta': dados['contas'][0] if dados['contas'] else None,
-                'concentracao_top3': sum(c['percentual'] for c in dados['contas'][:3])
-            }
+    def _gerar_resumo_vertical(percentuais, linha):
+        """Gera resumo da análise vertical de um elemento a partir do vetor de percentuais"""
+        top3 = indices_maiores(percentuais, 3).tolist()
         
-        return resumo
+        return {
+            'total_contas': len(percentuais),
+            'contas_relevantes': int(np.count_nonzero(percentuais > 10)),
+            'maior_conta': linha(top3[0]) if top3 else None,
+            'concentracao_top3': sum(float(percentuais[i]) for i in top3)
+        }
     
     @staticmethod
     def _obter_ativo_circulante(dados_bp):
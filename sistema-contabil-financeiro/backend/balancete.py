@@ -1,9 +1,16 @@
 from flask_sqlalchemy import SQLAlchemy
 from src.models.user import db
+from src.models.centavos import coluna_em_centavos
+from src.models.perfil_banco import leitura_em_lote
+from sqlalchemy import func
 from datetime import datetime
 
 class Balancete(db.Model):
     __tablename__ = 'balancete'
+    __table_args__ = (
+        # Consultas por período/versão (e conta) usadas por todas as demonstrações
+        db.Index('ix_balancete_periodo_versao_conta', 'periodo', 'versao_balancete', 'codigo_conta'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     codigo_conta = db.Column(db.String(20), nullable=False, index=True)
@@ -53,10 +60,35 @@ class Balancete(db.Model):
         ).first()
         return float(balancete.saldo_final) if balancete and balancete.saldo_final else 0.0
     
+    @classmethod
+    def get_saldos_periodo(cls, periodo, versao_balancete='1.0'):
+        """
+        Linhas (codigo_conta, saldo_final em centavos) de todas as contas do período,
+        em uma única consulta lida em lotes (percorrer uma vez)
+        """
+        return leitura_em_lote(db.session.query(cls.codigo_conta, coluna_em_centavos(cls.saldo_final)).filter_by(
+            periodo=periodo,
+            versao_balancete=versao_balancete
+        ).order_by(cls.id))
+    
+    @classmethod
+    def get_saldos_intervalo(cls, periodo_inicial, periodo_final, versao_balancete='1.0'):
+        """
+        Linhas (periodo, codigo_conta, saldo_final em centavos) de todos os períodos
+        do intervalo, em uma única consulta lida em lotes (percorrer uma vez)
+        """
+        return leitura_em_lote(db.session.query(cls.periodo, cls.codigo_conta, coluna_em_centavos(cls.saldo_final)).filter(
+            cls.periodo >= periodo_inicial,
+            cls.periodo <= periodo_final,
+            cls.versao_balancete == versao_balancete
+        ).order_by(cls.periodo, cls.id))
+    
     @classmethod
     def verificar_totalizador_zero(cls, periodo, versao_balancete='1.0'):
-        """Verifica se o somatório de todos os saldos finais é zero"""
-        balancetes = cls.get_by_periodo(periodo, versao_balancete)
-        total = sum(float(b.saldo_final) if b.saldo_final else 0.0 for b in balancetes)
-        return abs(total) < 0.01  # Tolerância para arredondamentos
+        """Verifica se o somatório de todos os saldos finais é zero (exato, em centavos)"""
+        total = db.session.query(func.sum(coluna_em_centavos(cls.saldo_final))).filter_by(
+            periodo=periodo,
+            versao_balancete=versao_balancete
+        ).scalar()
+        return not total
 
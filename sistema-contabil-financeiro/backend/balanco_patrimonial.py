@@ -1,82 +1,45 @@
-from src.models.balancete import Balancete
-from src.models.plano_contas import PlanoContas
 from src.models.demonstracoes import DemonstracaoFinanceira
 from src.models.user import db
-import json
-from decimal import Decimal
+from src.models.centavos import converter_valores, para_reais
+from src.models.roteamento import Roteamento
+from src.services.contexto_calculo import ContextoCalculo
+from src.services.plano_contas_cache import PlanoContasCache
+from src.services.instrumentacao import Instrumentacao
 
 class BalancoPatrimonialService:
     
     @staticmethod
-    def gerar_balanco_patrimonial(periodo, versao_balancete='1.0', versao_plano_contas='1.0'):
+    @Instrumentacao.servico('gerar_balanco_patrimonial')
+    def gerar_balanco_patrimonial(periodo, versao_balancete='1.0', versao_plano_contas='1.0', contexto=None):
         """
         Gera o Balanço Patrimonial para um período específico
         """
         try:
-            # Verificar se o totalizador está zerado
-            if not Balancete.verificar_totalizador_zero(periodo, versao_balancete):
-                return {
-                    'success': False,
-                    'message': 'Erro: O balancete não está balanceado (totalizador não é zero)'
-                }
-            
-            # Obter contas do ativo
-            ativo = BalancoPatrimonialService._obter_grupo_contas('ativo', periodo, versao_balancete, versao_plano_contas)
-            
-            # Obter contas do passivo
-            passivo = BalancoPatrimonialService._obter_grupo_contas('passivo', periodo, versao_balancete, versao_plano_contas)
-            
-            # Obter contas do patrimônio líquido
-            patrimonio_liquido = BalancoPatrimonialService._obter_grupo_contas('patrimonio_liquido', periodo, versao_balancete, versao_plano_contas)
-            
-            # Calcular totais
-            total_ativo = BalancoPatrimonialService._calcular_total_grupo(ativo)
-            total_passivo = BalancoPatrimonialService._calcular_total_grupo(passivo)
-            total_patrimonio_liquido = BalancoPatrimonialService._calcular_total_grupo(patrimonio_liquido)
+            contexto = contexto or ContextoCalculo(versao_balancete, versao_plano_contas)
             
-            # Verificar se Ativo = Passivo + PL
-            diferenca = abs(total_ativo - (total_passivo + total_patrimonio_liquido))
-            if diferenca > 0.01:  # Tolerância para arredondamentos
+            # Reaproveitar a demonstração gravada se as entradas do cálculo não mudaram
+            assinatura = contexto.assinatura('BP', (periodo,))
+            existente = DemonstracaoFinanceira.get_atualizada('BP', periodo, contexto.versao_balancete, assinatura)
+            if existente:
                 return {
-                    'success': False,
-                    'message': f'Erro: Balanço não está equilibrado. Diferença: {diferenca:.2f}'
+                    'success': True,
+                    'data': existente.get_dados(),
+                    'reaproveitada': True,
+                    'message': 'Balanço Patrimonial sem alterações no balancete e no plano de contas; versão gravada reaproveitada'
                 }
             
-            # Estruturar dados do balanço
-            balanco_data = {
-                'ativo': {
-                    'grupos': ativo,
-                    'total': float(total_ativo)
-                },
-                'passivo': {
-                    'grupos': passivo,
-                    'total': float(total_passivo)
-                },
-                'patrimonio_liquido': {
-                    'grupos': patrimonio_liquido,
-                    'total': float(total_patrimonio_liquido)
-                },
-                'total_passivo_pl': float(total_passivo + total_patrimonio_liquido),
-                'equilibrado': True
-            }
+            resultado = BalancoPatrimonialService.calcular_balanco_patrimonial(periodo, contexto)
+            if not resultado['success']:
+                return resultado
             
-            # Salvar demonstração no banco
-            demonstracao_existente = DemonstracaoFinanceira.get_demonstracao('BP', periodo, versao_balancete)
+            balanco_data = resultado['data']
             
-            if demonstracao_existente:
-                demonstracao_existente.dados_json = json.dumps(balanco_data)
-                demonstracao_existente.data_geracao = db.func.now()
-            else:
-                nova_demonstracao = DemonstracaoFinanceira(
-                    tipo_demonstracao='BP',
-                    periodo=periodo,
-                    versao_balancete=versao_balancete,
-                    versao_plano_contas=versao_plano_contas,
-                    dados_json=json.dumps(balanco_data)
+            # Salvar demonstração no banco
+            with Instrumentacao.etapa('persistencia'):
+                DemonstracaoFinanceira.salvar(
+                    'BP', periodo, contexto.versao_balancete, contexto.versao_plano_contas, balanco_data, assinatura
                 )
-                db.session.add(nova_demonstracao)
-            
-            db.session.commit()
+                db.session.commit()
             
             return {
                 'success': True,
@@ -92,9 +55,83 @@ class BalancoPatrimonialService:
             }
     
     @staticmethod
-    def _obter_grupo_contas(elemento_conta, periodo, versao_balancete, versao_plano_contas):
+    def calcular_balanco_patrimonial(periodo, contexto):
+        """
+        Calcula o Balanço Patrimonial do período sem gravá-lo
+        """
+        return contexto.memorizar(
+            ('BP', periodo), lambda: BalancoPatrimonialService._calcular_balanco_patrimonial(periodo, contexto)
+        )
+    
+    @staticmethod
+    def _calcular_balanco_patrimonial(periodo, contexto):
+        saldos = contexto.saldos(periodo)
+        versao_plano_contas = contexto.versao_plano_contas
+        
+        # Verificar se o totalizador está zerado
+        if not saldos.verificar_totalizador_zero():
+            return {
+                'success': False,
+                'message': 'Erro: O balancete não está balanceado (totalizador não é zero)'
+            }
+        
+        # Obter contas do ativo
+        ativo = BalancoPatrimonialService._obter_grupo_contas('ativo', saldos, versao_plano_contas)
+        
+        # Obter contas do passivo
+        passivo = BalancoPatrimonialService._obter_grupo_contas('passivo', saldos, versao_plano_contas)
+        
+        # Obter contas do patrimônio líquido
+        patrimonio_liquido = BalancoPatrimonialService._obter_grupo_contas('patrimonio_liquido', saldos, versao_plano_contas)
+        
+        return BalancoPatrimonialService._montar_balanco(ativo, passivo, patrimonio_liquido)
+    
+    @staticmethod
+    @Instrumentacao.etapa('estrutura')
+    def _montar_balanco(ativo, passivo, patrimonio_liquido):
+        """
+        Monta os dados do balanço a partir dos grupos de cada elemento (saldos em
+        centavos), verificando se Ativo = Passivo + PL sem tolerância
+        """
+        # Calcular totais
+        total_ativo = BalancoPatrimonialService._calcular_total_grupo(ativo)
+        total_passivo = BalancoPatrimonialService._calcular_total_grupo(passivo)
+        total_patrimonio_liquido = BalancoPatrimonialService._calcular_total_grupo(patrimonio_liquido)
+        
+        # Verificar se Ativo = Passivo + PL
+        diferenca = abs(total_ativo - (total_passivo + total_patrimonio_liquido))
+        if diferenca != 0:
+            return {
+                'success': False,
+                'message': f'Erro: Balanço não está equilibrado. Diferença: {para_reais(diferenca):.2f}'
+            }
+        
+        # Estruturar dados do balanço (valores convertidos para reais)
+        balanco_data = {
+            'ativo': {
+                'grupos': converter_valores(ativo),
+                'total': para_reais(total_ativo)
+            },
+            'passivo': {
+                'grupos': converter_valores(passivo),
+                'total': para_reais(total_passivo)
+            },
+            'patrimonio_liquido': {
+                'grupos': converter_valores(patrimonio_liquido),
+                'total': para_reais(total_patrimonio_liquido)
+            },
+            'total_passivo_pl': para_reais(total_passivo + total_patrimonio_liquido),
+            'equilibrado': True
+        }
+        
+        return {'success': True, 'data': balanco_data}
+    
+    @staticmethod
+    @Instrumentacao.etapa('consolidacao')
+    def _obter_grupo_contas(elemento_conta, saldos, versao_plano_contas):
         """
-        Obtém as contas de um elemento específico (ativo, passivo, patrimonio_liquido)
+        Obtém as contas de um elemento específico (ativo, passivo, patrimonio_liquido),
+        com os saldos em centavos
         """
         # Mapear elemento_conta para o valor correto no banco
         elemento_map = {
@@ -106,17 +143,18 @@ class BalancoPatrimonialService:
         elemento_db = elemento_map.get(elemento_conta, elemento_conta)
         
         # Obter contas do plano de contas para o elemento
-        contas_plano = PlanoContas.get_contas_por_elemento(elemento_db, versao_plano_contas)
+        plano = PlanoContasCache.obter(versao_plano_contas)
+        contas_plano = plano.get_contas_por_elemento(elemento_db)
         
         # Organizar por níveis hierárquicos
         grupos = {}
         
         for conta in contas_plano:
             # Obter saldo da conta no balancete
-            saldo = Balancete.get_saldo_por_conta(conta.codigo, periodo, versao_balancete)
+            saldo = saldos.get_saldo(conta.codigo)
             
             # Pular contas com saldo zero
-            if abs(saldo) < 0.01:
+            if saldo == 0:
                 continue
             
             # Organizar hierarquicamente
@@ -125,18 +163,26 @@ class BalancoPatrimonialService:
                     grupos[conta.codigo] = {
                         'codigo': conta.codigo,
                         'nome': conta.nome,
-                        'saldo': 0.0,
+                        'saldo': 0,
                         'subgrupos': {}
                     }
                 grupos[conta.codigo]['saldo'] += saldo
+                continue
+            
+            # Ancestrais da conta (raiz -> pai imediato), resolvidos no plano em cache
+            ancestrais = conta.get_codigos_ancestrais()
             
-            elif conta.nivel == 2 and conta.conta_pai:
-                pai_codigo = conta.conta_pai.codigo
+            if conta.nivel == 2 and ancestrais:
+                conta_pai = plano.get_by_codigo(ancestrais[-1])
+                if not conta_pai:
+                    continue
+                
+                pai_codigo = conta_pai.codigo
                 if pai_codigo not in grupos:
                     grupos[pai_codigo] = {
                         'codigo': pai_codigo,
-                        'nome': conta.conta_pai.nome,
-                        'saldo': 0.0,
+                        'nome': conta_pai.nome,
+                        'saldo': 0,
                         'subgrupos': {}
                     }
                 
@@ -144,66 +190,60 @@ class BalancoPatrimonialService:
                     grupos[pai_codigo]['subgrupos'][conta.codigo] = {
                         'codigo': conta.codigo,
                         'nome': conta.nome,
-                        'saldo': 0.0,
+                        'saldo': 0,
                         'contas': {}
                     }
                 grupos[pai_codigo]['subgrupos'][conta.codigo]['saldo'] += saldo
                 grupos[pai_codigo]['saldo'] += saldo
             
             # Para contas analíticas (níveis 3, 4, 5)
-            elif conta.eh_analitica:
-                # Encontrar o grupo pai (nível 1 ou 2)
-                conta_atual = conta
-                while conta_atual.conta_pai and conta_atual.conta_pai.nivel > 2:
-                    conta_atual = conta_atual.conta_pai
+            elif conta.eh_analitica and len(ancestrais) >= 2:
+                # Grupo (nível 1) e subgrupo (nível 2) da conta
+                pai_nivel1 = plano.get_by_codigo(ancestrais[0])
+                pai_nivel2 = plano.get_by_codigo(ancestrais[1])
+                if not pai_nivel1 or not pai_nivel2:
+                    continue
+                
+                # Garantir estrutura do grupo nível 1
+                if pai_nivel1.codigo not in grupos:
+                    grupos[pai_nivel1.codigo] = {
+                        'codigo': pai_nivel1.codigo,
+                        'nome': pai_nivel1.nome,
+                        'saldo': 0,
+                        'subgrupos': {}
+                    }
+                
+                # Garantir estrutura do subgrupo nível 2
+                if pai_nivel2.codigo not in grupos[pai_nivel1.codigo]['subgrupos']:
+                    grupos[pai_nivel1.codigo]['subgrupos'][pai_nivel2.codigo] = {
+                        'codigo': pai_nivel2.codigo,
+                        'nome': pai_nivel2.nome,
+                        'saldo': 0,
+                        'contas': {}
+                    }
+                
+                # Adicionar conta analítica
+                grupos[pai_nivel1.codigo]['subgrupos'][pai_nivel2.codigo]['contas'][conta.codigo] = {
+                    'codigo': conta.codigo,
+                    'nome': conta.nome,
+                    'saldo': saldo
+                }
                 
-                if conta_atual.conta_pai:
-                    pai_nivel2 = conta_atual.conta_pai
-                    if pai_nivel2.conta_pai:
-                        pai_nivel1 = pai_nivel2.conta_pai
-                        
-                        # Garantir estrutura do grupo nível 1
-                        if pai_nivel1.codigo not in grupos:
-                            grupos[pai_nivel1.codigo] = {
-                                'codigo': pai_nivel1.codigo,
-                                'nome': pai_nivel1.nome,
-                                'saldo': 0.0,
-                                'subgrupos': {}
-                            }
-                        
-                        # Garantir estrutura do subgrupo nível 2
-                        if pai_nivel2.codigo not in grupos[pai_nivel1.codigo]['subgrupos']:
-                            grupos[pai_nivel1.codigo]['subgrupos'][pai_nivel2.codigo] = {
-                                'codigo': pai_nivel2.codigo,
-                                'nome': pai_nivel2.nome,
-                                'saldo': 0.0,
-                                'contas': {}
-                            }
-                        
-                        # Adicionar conta analítica
-                        grupos[pai_nivel1.codigo]['subgrupos'][pai_nivel2.codigo]['contas'][conta.codigo] = {
-                            'codigo': conta.codigo,
-                            'nome': conta.nome,
-                            'saldo': saldo
-                        }
-                        
-                        # Atualizar saldos dos pais
-                        grupos[pai_nivel1.codigo]['subgrupos'][pai_nivel2.codigo]['saldo'] += saldo
-                        grupos[pai_nivel1.codigo]['saldo'] += saldo
+                # Atualizar saldos dos pais
+                grupos[pai_nivel1.codigo]['subgrupos'][pai_nivel2.codigo]['saldo'] += saldo
+                grupos[pai_nivel1.codigo]['saldo'] += saldo
         
         return list(grupos.values())
     
     @staticmethod
     def _calcular_total_grupo(grupos):
         """
-        Calcula o total de um grupo de contas
+        Calcula o total de um grupo de contas (em centavos)
         """
-        total = Decimal('0.00')
-        for grupo in grupos:
-            total += Decimal(str(grupo['saldo']))
-        return total
+        return sum(grupo['saldo'] for grupo in grupos)
     
     @staticmethod
+    @Roteamento.somente_leitura()
     def obter_balanco_patrimonial(periodo, versao_balancete='1.0'):
         """
         Obtém o Balanço Patrimonial já gerado para um período
@@ -213,7 +253,7 @@ class BalancoPatrimonialService:
         if demonstracao:
             return {
                 'success': True,
-                'data': json.loads(demonstracao.dados_json),
+                'data': demonstracao.get_dados(),
                 'data_geracao': demonstracao.data_geracao.isoformat()
             }
         else:
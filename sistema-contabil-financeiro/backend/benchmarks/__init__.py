@@ -0,0 +1,4 @@
+"""
+Benchmarks de desempenho do backend, executados fora da aplicação.
+Cada módulo é um script: python -m benchmarks.<modulo> --help
+"""
@@ -0,0 +1,314 @@
+"""
+Geradores de dados sintéticos para os benchmarks.
+
+Plano de contas de 5 níveis, com os nomes que as regras de classificação
+(REGRAS_TAGS) reconhecem, de modo que DFC, DVA, DRA e DMPL encontrem suas
+contas, e balancetes balanceados para N períodos e versões. Os dados são
+determinísticos para a mesma semente, o que permite comparar execuções.
+"""
+import csv
+import random
+from decimal import Decimal
+from sqlalchemy import insert, func
+from src.models.user import db
+from src.models.balancete import Balancete
+from src.models.plano_contas import PlanoContas, PlanoContasTag
+
+# Estrutura fixa dos níveis 1 a 3: (código, nome, elemento, grupos de nível 2).
+# Cada grupo de nível 2 tem (nome, contas de nível 3); cada conta de nível 3 é
+# (nome, redutora). As contas de nível 3 recebem as contas de nível 4 e 5
+# geradas até atingir o tamanho pedido e repassam o nome (e as tags) a elas.
+ESTRUTURA = (
+    ('1', 'Ativo', 'ativo', (
+        ('Ativo Circulante', (
+            ('Caixa e Equivalentes de Caixa', False),
+            ('Bancos Conta Movimento', False),
+            ('Clientes circulante', False),
+            ('Estoques circulante', False),
+            ('Impostos a Recuperar circulante', False)
+        )),
+        ('Ativo Não Circulante', (
+            ('Investimentos não circulante', False),
+            ('Imobilizado não circulante', False),
+            ('Depreciação Acumulada', True),
+            ('Intangível não circulante', False),
+            ('Amortização Acumulada', True),
+            ('Exaustão Acumulada', True)
+        ))
+    )),
+    ('2', 'Passivo', 'passivo', (
+        ('Passivo Circulante', (
+            ('Fornecedores circulante', False),
+            ('Salários a Pagar circulante', False),
+            ('Impostos a Recolher circulante', False),
+            ('Empréstimos circulante', False),
+            ('Provisão de Férias circulante', False)
+        )),
+        ('Passivo Não Circulante', (
+            ('Empréstimos e Financiamentos não circulante', False),
+            ('Provisão para Contingências não circulante', False)
+        ))
+    )),
+    ('3', 'Patrimônio Líquido', 'patrimonio_liquido', (
+        ('Capital', (
+            ('Capital Social', False),
+            ('Reserva de Capital - Ágio', False)
+        )),
+        ('Reservas e Resultados', (
+            ('Reserva Legal de Lucros', False),
+            ('Lucros Acumulados', False),
+            ('Ajuste de Avaliação Patrimonial', False),
+            ('Ajuste Acumulado de Conversão', False)
+        ))
+    )),
+    ('4', 'Receitas', 'receita', (
+        ('Receita Operacional', (
+            ('Venda de Produtos', False),
+            ('Prestação de Serviços', False),
+            ('Venda de Mercadorias', False)
+        )),
+        ('Receitas Financeiras', (
+            ('Receita Financeira de Aplicações', False),
+            ('Juros Ativos - Receita Financeira', False)
+        ))
+    )),
+    ('5', 'Custos', 'custo', (
+        ('Custo dos Produtos Vendidos', (
+            ('Custo de Material Direto', False),
+            ('Custo de Mão de Obra Direta', False),
+            ('Custo de Depreciação Fabril', False)
+        )),
+    )),
+    ('6', 'Despesas', 'despesa', (
+        ('Despesas com Pessoal', (
+            ('Salários', False),
+            ('Encargos Sociais', False),
+            ('Benefícios', False),
+            ('Férias', False),
+            ('13º Salário', False)
+        )),
+        ('Despesas Administrativas', (
+            ('Energia Elétrica', False),
+            ('Telefone', False),
+            ('Água e Esgoto', False),
+            ('Material de Escritório', False),
+            ('Manutenção', False),
+            ('Serviços Terceirizados', False),
+            ('Consultoria', False),
+            ('Auditoria', False),
+            ('Aluguel', False)
+        )),
+        ('Despesas Tributárias', (
+            ('Impostos e Taxas', False),
+            ('Contribuição Sindical', False)
+        )),
+        ('Despesas Financeiras', (
+            ('Juros Passivos - Despesa Financeira', False),
+        )),
+        ('Outras Despesas Operacionais', (
+            ('Despesa de Depreciação', False),
+            ('Despesa de Amortização', False),
+            ('Despesa de Exaustão', False),
+            ('Provisão para Perdas', False)
+        ))
+    ))
+)
+
+ELEMENTOS_RESULTADO = ('receita', 'custo', 'despesa')
+
+# Contas analíticas de nível 5 por conta de nível 4
+CONTAS_POR_GRUPO = 20
+
+# Contas que fecham o balancete (ver gerar_saldos)
+CONTA_FECHAMENTO_PL = 'Lucros Acumulados'
+CONTA_FECHAMENTO_RESULTADO = 'Venda de Produtos'
+
+# Faixa dos saldos sorteados, em centavos
+SALDO_MINIMO = 100
+SALDO_MAXIMO = 10000000
+
+
+def gerar_periodos(quantidade, ano_inicial=2020):
+    """Períodos mensais consecutivos no formato YYYY-MM"""
+    return [f'{ano_inicial + mes // 12}-{mes % 12 + 1:02d}' for mes in range(quantidade)]
+
+
+def tamanho_minimo_plano():
+    """Quantidade de contas da estrutura fixa (níveis 1 a 3)"""
+    return sum(
+        1 + sum(1 + len(contas) for nome, contas in grupos)
+        for codigo, nome, elemento, grupos in ESTRUTURA
+    )
+
+
+def gerar_plano_contas(quantidade, versao='1.0', primeiro_id=1):
+    """
+    Plano de contas sintético com quantidade contas (no mínimo a estrutura
+    fixa): dicionários com as colunas de plano_contas, ids a partir de
+    primeiro_id e conta_pai_id preenchido. As contas geradas são distribuídas
+    igualmente entre as contas de nível 3, em grupos de nível 4 com até
+    CONTAS_POR_GRUPO contas analíticas de nível 5.
+    """
+    contas = []
+    
+    def adicionar(codigo, nome, elemento, nivel, pai, redutora=False):
+        conta = {
+            'id': primeiro_id + len(contas),
+            'codigo': codigo,
+            'nome': nome,
+            'tipo_conta': 'resultado' if elemento in ELEMENTOS_RESULTADO else 'patrimonial',
+            'elemento_conta': elemento,
+            'nivel': nivel,
+            'conta_pai_id': pai['id'] if pai else None,
+            'eh_analitica': False,
+            'versao': versao,
+            'ativo': True,
+            'redutora': redutora
+        }
+        contas.append(conta)
+        return conta
+    
+    nivel3 = []
+    for codigo, nome, elemento, grupos in ESTRUTURA:
+        raiz = adicionar(codigo, nome, elemento, 1, None)
+        for indice_grupo, (nome_grupo, contas_grupo) in enumerate(grupos, start=1):
+            grupo = adicionar(f'{codigo}.{indice_grupo}', nome_grupo, elemento, 2, raiz)
+            for indice_conta, (nome_conta, redutora) in enumerate(contas_grupo, start=1):
+                nivel3.append(adicionar(
+                    f'{grupo["codigo"]}.{indice_conta}', nome_conta, elemento, 3, grupo, redutora
+                ))
+    
+    # Distribuir as contas restantes entre as contas de nível 3
+    restantes = max(quantidade - len(contas), 0)
+    for posicao, conta_nivel3 in enumerate(nivel3):
+        cota = restantes // len(nivel3) + (1 if posicao < restantes % len(nivel3) else 0)
+        if cota == 0:
+            conta_nivel3['eh_analitica'] = True
+            continue
+        
+        quantidade_grupos = -(-cota // (CONTAS_POR_GRUPO + 1))
+        analiticas = cota - quantidade_grupos
+        for indice_grupo in range(1, quantidade_grupos + 1):
+            grupo = adicionar(
+                f'{conta_nivel3["codigo"]}.{indice_grupo:03d}',
+                f'{conta_nivel3["nome"]} - Unidade {indice_grupo:03d}',
+                conta_nivel3['elemento_conta'], 4, conta_nivel3, conta_nivel3['redutora']
+            )
+            # Grupos sem contas de nível 5 (sobra da divisão) são analíticos
+            quantidade_analiticas = analiticas // quantidade_grupos + (
+                1 if indice_grupo <= analiticas % quantidade_grupos else 0
+            )
+            if quantidade_analiticas == 0:
+                grupo['eh_analitica'] = True
+            for indice_analitica in range(1, quantidade_analiticas + 1):
+                adicionar(
+                    f'{grupo["codigo"]}.{indice_analitica:04d}',
+                    f'{grupo["nome"]} - Centro {indice_analitica:04d}',
+                    conta_nivel3['elemento_conta'], 5, grupo, conta_nivel3['redutora']
+                )['eh_analitica'] = True
+    
+    return contas
+
+
+def inserir_plano_contas(contas, lote=10000):
+    """
+    Grava o plano gerado com INSERT em lote e materializa caminhos e tags, como
+    nas importações em lote. Os ids gerados são usados como estão: o plano deve
+    ser gerado com primeiro_id acima do maior id existente (ver proximo_id_plano).
+    """
+    colunas = [coluna.name for coluna in PlanoContas.__table__.columns]
+    linhas = [{chave: valor for chave, valor in conta.items() if chave in colunas} for conta in contas]
+    for inicio in range(0, len(linhas), lote):
+        db.session.execute(insert(PlanoContas), linhas[inicio:inicio + lote])
+    
+    for versao in {conta['versao'] for conta in contas}:
+        PlanoContas.reconstruir_caminhos(versao)
+        PlanoContasTag.reconstruir(versao)
+    db.session.commit()
+
+
+def proximo_id_plano():
+    return (db.session.query(func.max(PlanoContas.id)).scalar() or 0) + 1
+
+
+def gerar_saldos(contas, semente=0):
+    """
+    Saldos finais (centavos) das contas analíticas: codigo -> saldo. Os sinais
+    seguem o que as demonstrações esperam (Ativo = Passivo + PL com saldos
+    positivos; receitas credoras, custos e despesas devedores) e duas contas
+    fecham o balancete: Lucros Acumulados iguala o balanço e Venda de Produtos
+    zera o somatório de todas as linhas.
+    """
+    sorteio = random.Random(semente)
+    saldos = {}
+    totais = {}
+    fechamento = {}
+    
+    for conta in contas:
+        if not conta['eh_analitica']:
+            continue
+        
+        elemento = conta['elemento_conta']
+        nome_base = conta['nome'].split(' - ')[0]
+        if nome_base in (CONTA_FECHAMENTO_PL, CONTA_FECHAMENTO_RESULTADO) and nome_base not in fechamento:
+            fechamento[nome_base] = conta['codigo']
+            continue
+        
+        saldo = sorteio.randint(SALDO_MINIMO, SALDO_MAXIMO)
+        if conta['redutora']:
+            saldo = -saldo // 10
+        if elemento == 'receita':
+            saldo = -saldo
+        
+        saldos[conta['codigo']] = saldo
+        totais[elemento] = totais.get(elemento, 0) + saldo
+    
+    saldo_pl = totais.get('ativo', 0) - totais.get('passivo', 0) - totais.get('patrimonio_liquido', 0)
+    saldos[fechamento[CONTA_FECHAMENTO_PL]] = saldo_pl
+    totais['patrimonio_liquido'] = totais.get('patrimonio_liquido', 0) + saldo_pl
+    saldos[fechamento[CONTA_FECHAMENTO_RESULTADO]] = -sum(totais.values())
+    
+    return saldos
+
+
+def linhas_balancete(contas, saldos, periodo, versao_balancete='1.0'):
+    """Linhas de balancete (dicionários para INSERT) a partir dos saldos em centavos"""
+    nomes = {conta['codigo']: conta['nome'] for conta in contas}
+    return [
+        {
+            'codigo_conta': codigo,
+            'nome_conta': nomes[codigo],
+            'saldo_final': Decimal(saldo).scaleb(-2),
+            'periodo': periodo,
+            'versao_balancete': versao_balancete,
+            'versao_plano_contas': contas[0]['versao']
+        }
+        for codigo, saldo in saldos.items()
+    ]
+
+
+def inserir_balancetes(contas, periodos, versoes=('1.0',), semente=0, lote=10000):
+    """
+    Insere um balancete balanceado por período e versão. Cada combinação usa
+    uma semente própria, derivada de semente. Retorna a quantidade de linhas.
+    """
+    total = 0
+    for indice_versao, versao in enumerate(versoes):
+        for indice_periodo, periodo in enumerate(periodos):
+            saldos = gerar_saldos(contas, semente + indice_versao * 10007 + indice_periodo)
+            linhas = linhas_balancete(contas, saldos, periodo, versao)
+            for inicio in range(0, len(linhas), lote):
+                db.session.execute(insert(Balancete), linhas[inicio:inicio + lote])
+            total += len(linhas)
+        db.session.commit()
+    return total
+
+
+def escrever_balancete_csv(caminho, contas, saldos):
+    """Arquivo CSV (separador ';' e vírgula decimal) aceito pela importação de balancetes"""
+    nomes = {conta['codigo']: conta['nome'] for conta in contas}
+    with open(caminho, 'w', newline='', encoding='utf-8') as arquivo:
+        escritor = csv.writer(arquivo, delimiter=';')
+        escritor.writerow(['codigo_conta', 'nome_conta', 'saldo_final'])
+        for codigo, saldo in saldos.items():
+            escritor.writerow([codigo, nomes[codigo], str(Decimal(saldo).scaleb(-2)).replace('.', ',')])
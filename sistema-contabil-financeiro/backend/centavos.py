@@ -0,0 +1,56 @@
+"""
+Aritmética de ponto fixo dos valores monetários: centavos em inteiros.
+
+Os saldos do balancete são lidos já em centavos (calculados pelo banco) e todos
+os cálculos das demonstrações (agrupamentos, totais e verificações de equilíbrio)
+são feitos com inteiros, exatos e sem as conversões float/Decimal/str. A
+conversão para reais (float) acontece somente na montagem dos dados exibidos e
+gravados (para_reais e converter_valores).
+"""
+from sqlalchemy import BigInteger, cast, func
+from decimal import Decimal, ROUND_HALF_UP
+
+CENTAVOS_POR_REAL = 100
+
+# Chaves que guardam valores monetários nas estruturas das demonstrações
+CHAVES_VALORES = ('saldo', 'valor', 'total')
+
+def para_centavos(valor):
+    """Converte um valor em reais (Decimal, float, int, str ou None) para centavos inteiros"""
+    if not valor:
+        return 0
+    if isinstance(valor, float):
+        return int(round(valor * CENTAVOS_POR_REAL))
+    if not isinstance(valor, Decimal):
+        valor = Decimal(str(valor))
+    return int((valor * CENTAVOS_POR_REAL).to_integral_value(rounding=ROUND_HALF_UP))
+
+def para_reais(centavos):
+    """Valor de exibição (float, em reais) de um valor em centavos"""
+    return centavos / CENTAVOS_POR_REAL
+
+def coluna_em_centavos(coluna):
+    """Expressão SQL com o valor da coluna monetária em centavos (inteiro)"""
+    return cast(func.round(coluna * CENTAVOS_POR_REAL), BigInteger)
+
+def converter_valores(estrutura, converter=para_reais, chaves=CHAVES_VALORES):
+    """
+    Cópia de uma estrutura (dicionários e listas aninhados, ex.: grupos ->
+    subgrupos -> contas) com os valores das chaves monetárias convertidos.
+    Não deve ser aplicada duas vezes à mesma estrutura.
+    """
+    if isinstance(estrutura, list):
+        return [converter_valores(item, converter, chaves) for item in estrutura]
+    
+    if not isinstance(estrutura, dict):
+        return estrutura
+    
+    convertida = {}
+    for chave, valor in estrutura.items():
+        if isinstance(valor, (dict, list)):
+            convertida[chave] = converter_valores(valor, converter, chaves)
+        elif chave in chaves and valor is not None and not isinstance(valor, bool):
+            convertida[chave] = converter(valor)
+        else:
+            convertida[chave] = valor
+    return convertida
@@ -0,0 +1,83 @@
+"""
+Codificação dos dados das demonstrações gravadas (DemonstracaoFinanceira).
+
+Formatos:
+    json          texto JSON em dados_json (formato original)
+    json+zlib     JSON compactado com zlib em dados_binario (biblioteca padrão)
+    msgpack+zstd  MessagePack compactado com Zstandard em dados_binario
+                  (requer os pacotes msgpack e zstandard)
+
+O formato das novas gravações vem da configuração FORMATO_DADOS_DEMONSTRACOES:
+'json' (padrão), 'json+zlib', 'msgpack+zstd' ou 'compactado' (sinônimo de
+json+zlib). O formato nunca é escolhido pelos pacotes instalados: todos os
+processos que leem o banco (workers, réplicas) precisam decodificá-lo, então
+msgpack+zstd só deve ser configurado quando os pacotes estão em todos eles.
+A leitura aceita qualquer formato, de modo que bancos com demonstrações
+gravadas em formatos diferentes continuam legíveis.
+"""
+from flask import current_app, has_app_context
+import json
+import zlib
+
+try:
+    import msgpack
+    import zstandard
+except ImportError:
+    msgpack = None
+    zstandard = None
+
+FORMATO_JSON = 'json'
+FORMATO_JSON_ZLIB = 'json+zlib'
+FORMATO_MSGPACK_ZSTD = 'msgpack+zstd'
+FORMATO_COMPACTADO = 'compactado'
+
+NIVEL_ZLIB = 6
+NIVEL_ZSTD = 3
+
+def formato_configurado():
+    """Formato das novas gravações, conforme a configuração da aplicação (padrão: json)"""
+    configuracao = FORMATO_JSON
+    if has_app_context():
+        configuracao = current_app.config.get('FORMATO_DADOS_DEMONSTRACOES') or FORMATO_JSON
+    
+    if configuracao == FORMATO_COMPACTADO:
+        return FORMATO_JSON_ZLIB
+    if configuracao in (FORMATO_JSON, FORMATO_JSON_ZLIB, FORMATO_MSGPACK_ZSTD):
+        return configuracao
+    raise ValueError(f'FORMATO_DADOS_DEMONSTRACOES inválido: {configuracao}')
+
+def codificar(dados, formato=None):
+    """Retorna (formato, texto para dados_json, bytes para dados_binario)"""
+    formato = formato or formato_configurado()
+    
+    if formato == FORMATO_JSON:
+        return formato, json.dumps(dados), None
+    
+    if formato == FORMATO_MSGPACK_ZSTD:
+        if msgpack is None:
+            raise ValueError('O formato msgpack+zstd requer os pacotes msgpack e zstandard')
+        empacotado = msgpack.packb(dados, use_bin_type=True)
+        return formato, '', zstandard.ZstdCompressor(level=NIVEL_ZSTD).compress(empacotado)
+    
+    if formato == FORMATO_JSON_ZLIB:
+        texto = json.dumps(dados, separators=(',', ':'))
+        return formato, '', zlib.compress(texto.encode('utf-8'), NIVEL_ZLIB)
+    
+    raise ValueError(f'Formato de dados desconhecido: {formato}')
+
+def decodificar(formato, texto, binario):
+    """Dados da demonstração a partir das colunas gravadas (formato None = json)"""
+    if not formato or formato == FORMATO_JSON:
+        return json.loads(texto) if texto else {}
+    
+    if formato == FORMATO_JSON_ZLIB:
+        return json.loads(zlib.decompress(binario).decode('utf-8'))
+    
+    if formato == FORMATO_MSGPACK_ZSTD:
+        if msgpack is None:
+            raise ValueError('Demonstração gravada em msgpack+zstd: instale os pacotes msgpack e zstandard')
+        return msgpack.unpackb(
+            zstandard.ZstdDecompressor().decompress(binario), raw=False, strict_map_key=False
+        )
+    
+    raise ValueError(f'Formato de dados desconhecido: {formato}')
@@ -0,0 +1,127 @@
+from flask import Blueprint, jsonify, request
+from src.services.analises import AnaliseFinanceiraService
+from src.services.demonstracoes_service import DemonstracoesService
+
+consultas_bp = Blueprint('consultas', __name__)
+
+@consultas_bp.route('/analises/tendencia', methods=['POST'])
+def analise_tendencia():
+    """
+    Análise horizontal de N períodos (matriz contas x períodos) em uma única requisição
+    """
+    try:
+        data = request.get_json() or {}
+        
+        periodo_inicial = data.get('periodo_inicial')
+        periodo_final = data.get('periodo_final')
+        
+        if not periodo_inicial or not periodo_final:
+            return jsonify({
+                'success': False,
+                'message': 'Período inicial e período final são obrigatórios'
+            }), 400
+        
+        resultado = AnaliseFinanceiraService.calcular_matriz_tendencia(
+            periodo_inicial,
+            periodo_final,
+            data.get('versao_balancete', '1.0'),
+            data.get('periodo_base'),
+            data.get('limite')
+        )
+        
+        return jsonify(resultado), 200 if resultado['success'] else 400
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao calcular matriz de tendência: {str(e)}'
+        }), 500
+
+@consultas_bp.route('/demonstracoes/linhas/series', methods=['POST'])
+def series_demonstracao():
+    """
+    Valores de linhas de uma demonstração em vários períodos (ex.: lucro líquido
+    de todos os meses). JSON: tipo_demonstracao, codigos (lista de códigos de
+    linha), periodo_inicial, periodo_final e versao_balancete.
+    """
+    try:
+        data = request.get_json() or {}
+        
+        tipo_demonstracao = data.get('tipo_demonstracao')
+        codigos = data.get('codigos') or ([data['codigo']] if data.get('codigo') else [])
+        
+        if not tipo_demonstracao or not codigos:
+            return jsonify({
+                'success': False,
+                'message': 'Tipo da demonstração e códigos das linhas são obrigatórios'
+            }), 400
+        
+        resultado = AnaliseFinanceiraService.obter_series_demonstracao(
+            tipo_demonstracao,
+            codigos,
+            data.get('periodo_inicial'),
+            data.get('periodo_final'),
+            data.get('versao_balancete', '1.0')
+        )
+        
+        return jsonify(resultado), 200 if resultado['success'] else 400
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao obter séries da demonstração: {str(e)}'
+        }), 500
+
+@consultas_bp.route('/demonstracoes/linhas', methods=['GET'])
+def linhas_demonstracao():
+    """Linhas de uma demonstração gerada (códigos disponíveis para as séries)"""
+    try:
+        tipo_demonstracao = request.args.get('tipo_demonstracao')
+        periodo = request.args.get('periodo')
+        
+        if not tipo_demonstracao or not periodo:
+            return jsonify({
+                'success': False,
+                'message': 'Tipo da demonstração e período são obrigatórios'
+            }), 400
+        
+        resultado = AnaliseFinanceiraService.listar_linhas_demonstracao(
+            tipo_demonstracao,
+            periodo,
+            request.args.get('versao_balancete', '1.0')
+        )
+        
+        return jsonify(resultado), 200 if resultado['success'] else 404
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao listar linhas da demonstração: {str(e)}'
+        }), 500
+
+@consultas_bp.route('/demonstracoes', methods=['GET'])
+def listar_demonstracoes():
+    """
+    Demonstrações geradas, paginadas e sem os dados (para listas). Parâmetros:
+    tipo (um ou mais, separados por vírgula), periodo_inicial, periodo_final,
+    versao_balancete, limite e cursor (paginacao.proximo_cursor da página anterior).
+    """
+    try:
+        tipos = [tipo for tipo in request.args.get('tipo', '').split(',') if tipo]
+        
+        resultado = DemonstracoesService.listar(
+            tipos or None,
+            request.args.get('periodo_inicial'),
+            request.args.get('periodo_final'),
+            request.args.get('versao_balancete'),
+            request.args.get('limite', type=int),
+            request.args.get('cursor')
+        )
+        
+        return jsonify(resultado), 200 if resultado['success'] else 400
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao listar demonstrações: {str(e)}'
+        }), 500
@@ -0,0 +1,209 @@
+"""
+Registro de consultas lentas: comandos SQL acima de um limite de duração são
+gravados em um log local rotativo (uma linha JSON por consulta) com o texto, os
+parâmetros (ocultáveis), a duração, a função de serviço e o endpoint que os
+emitiram e o plano de execução do banco (EXPLAIN QUERY PLAN no SQLite, EXPLAIN
+no PostgreSQL).
+
+Desligado por padrão. Configuração do app:
+    CONSULTAS_LENTAS                    True para ativar
+    CONSULTAS_LENTAS_LIMITE_MS          duração mínima registrada (padrão 200)
+    CONSULTAS_LENTAS_ARQUIVO            caminho do log (padrão logs/consultas_lentas.log)
+    CONSULTAS_LENTAS_TAMANHO_MAXIMO     bytes por arquivo antes da rotação (padrão 10 MB)
+    CONSULTAS_LENTAS_ARQUIVOS           arquivos antigos mantidos (padrão 5)
+    CONSULTAS_LENTAS_OCULTAR_PARAMETROS grava só o tipo dos parâmetros (padrão True)
+
+Fora do app (scripts, benchmarks): ConsultasLentas.ativar(engine, ...).
+"""
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from sqlalchemy import event
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+class ConsultasLentas:
+    
+    LIMITE_MS = 200
+    ARQUIVO = os.path.join('logs', 'consultas_lentas.log')
+    TAMANHO_MAXIMO = 10 * 1024 * 1024
+    ARQUIVOS = 5
+    
+    # O plano de um mesmo comando é obtido no máximo uma vez neste intervalo (s)
+    INTERVALO_EXPLAIN = 300
+    MAXIMO_PLANOS = 500
+    
+    # Comandos para os quais o banco aceita EXPLAIN
+    COMANDOS_EXPLICAVEIS = ('select', 'with', 'insert', 'update', 'delete')
+    
+    _planos = {}
+    _lock = threading.Lock()
+    
+    @staticmethod
+    def init_app(app):
+        """Ativa o registro no engine do db do app se CONSULTAS_LENTAS estiver ligado"""
+        from src.models.user import db
+        
+        if not app.config.get('CONSULTAS_LENTAS', False):
+            return None
+        
+        with app.app_context():
+            return ConsultasLentas.ativar(
+                db.engine,
+                limite_ms=app.config.get('CONSULTAS_LENTAS_LIMITE_MS', ConsultasLentas.LIMITE_MS),
+                arquivo=app.config.get('CONSULTAS_LENTAS_ARQUIVO', ConsultasLentas.ARQUIVO),
+                tamanho_maximo=app.config.get('CONSULTAS_LENTAS_TAMANHO_MAXIMO', ConsultasLentas.TAMANHO_MAXIMO),
+                arquivos=app.config.get('CONSULTAS_LENTAS_ARQUIVOS', ConsultasLentas.ARQUIVOS),
+                ocultar_parametros=app.config.get('CONSULTAS_LENTAS_OCULTAR_PARAMETROS', True)
+            )
+    
+    @staticmethod
+    def ativar(engine, limite_ms=None, arquivo=None, tamanho_maximo=None, arquivos=None, ocultar_parametros=True):
+        """
+        Registra os eventos no engine e retorna o logger. Cada engine é
+        instrumentado uma única vez (chamadas repetidas só retornam o logger).
+        """
+        limite = (ConsultasLentas.LIMITE_MS if limite_ms is None else limite_ms) / 1000
+        logger = ConsultasLentas._criar_logger(
+            arquivo or ConsultasLentas.ARQUIVO,
+            tamanho_maximo or ConsultasLentas.TAMANHO_MAXIMO,
+            ConsultasLentas.ARQUIVOS if arquivos is None else arquivos
+        )
+        
+        if getattr(engine, '_consultas_lentas', False):
+            return logger
+        engine._consultas_lentas = True
+        
+        @event.listens_for(engine, 'before_cursor_execute')
+        def _iniciar(conexao, cursor, comando, parametros, contexto, executemany):
+            if contexto is not None:
+                contexto._inicio_consulta_lenta = time.perf_counter()
+        
+        @event.listens_for(engine, 'after_cursor_execute')
+        def _verificar(conexao, cursor, comando, parametros, contexto, executemany):
+            inicio = getattr(contexto, '_inicio_consulta_lenta', None)
+            if inicio is None:
+                return
+            duracao = time.perf_counter() - inicio
+            if duracao < limite:
+                return
+            
+            try:
+                ConsultasLentas._registrar(
+                    logger, conexao, comando, parametros, executemany, duracao, ocultar_parametros
+                )
+            except Exception:
+                # O registro nunca deve derrubar a consulta que já foi executada
+                logger.exception('Falha ao registrar consulta lenta')
+        
+        return logger
+    
+    @staticmethod
+    def _criar_logger(arquivo, tamanho_maximo, arquivos):
+        logger = logging.getLogger('indicium360.consultas_lentas')
+        caminho = os.path.abspath(arquivo)
+        if not any(getattr(handler, 'baseFilename', None) == caminho for handler in logger.handlers):
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            handler = RotatingFileHandler(caminho, maxBytes=tamanho_maximo, backupCount=arquivos, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        return logger
+    
+    @staticmethod
+    def _registrar(logger, conexao, comando, parametros, executemany, duracao, ocultar_parametros):
+        # Em executemany, o plano e o log usam o primeiro conjunto de parâmetros
+        primeiro = parametros[0] if executemany and parametros else parametros
+        
+        registro = {
+            'data': datetime.now().isoformat(timespec='milliseconds'),
+            'duracao_ms': round(duracao * 1000, 3),
+            'banco': conexao.dialect.name,
+            'sql': comando,
+            'parametros': ConsultasLentas._parametros_log(primeiro, ocultar_parametros),
+            'lote': len(parametros) if executemany and parametros else None,
+            'servico': ConsultasLentas._servico_chamador(),
+            'endpoint': ConsultasLentas._endpoint(),
+            'plano': ConsultasLentas._plano(conexao, comando, primeiro)
+        }
+        logger.info(json.dumps(registro, ensure_ascii=False, default=str))
+    
+    @staticmethod
+    def _parametros_log(parametros, ocultar):
+        if not ocultar or parametros is None:
+            return parametros
+        if isinstance(parametros, dict):
+            return {nome: f'<{type(valor).__name__}>' for nome, valor in parametros.items()}
+        return [f'<{type(valor).__name__}>' for valor in parametros]
+    
+    @staticmethod
+    def _servico_chamador():
+        """Primeira função de src.services na pilha (fora da instrumentação)"""
+        quadro = sys._getframe(1)
+        while quadro is not None:
+            modulo = quadro.f_globals.get('__name__', '')
+            if (modulo.startswith('src.services.')
+                    and modulo not in ('src.services.consultas_lentas', 'src.services.instrumentacao')):
+                codigo = quadro.f_code
+                return f'{modulo}.{getattr(codigo, "co_qualname", codigo.co_name)}:{quadro.f_lineno}'
+            quadro = quadro.f_back
+        return None
+    
+    @staticmethod
+    def _endpoint():
+        from flask import has_request_context, request
+        
+        if has_request_context():
+            return f'{request.method} {request.path}'
+        return None
+    
+    @staticmethod
+    def _plano(conexao, comando, parametros):
+        """
+        Plano de execução do comando, obtido em um cursor separado da mesma conexão
+        (na mesma transação, sem disparar os eventos do SQLAlchemy). Memorizado
+        por INTERVALO_EXPLAIN segundos por texto de comando.
+        """
+        if comando.lstrip().split(None, 1)[0].lower() not in ConsultasLentas.COMANDOS_EXPLICAVEIS:
+            return None
+        
+        agora = time.monotonic()
+        with ConsultasLentas._lock:
+            memorizado = ConsultasLentas._planos.get(comando)
+            if memorizado and agora - memorizado[0] < ConsultasLentas.INTERVALO_EXPLAIN:
+                return memorizado[1]
+        
+        dialeto = conexao.dialect.name
+        prefixo = 'EXPLAIN QUERY PLAN ' if dialeto == 'sqlite' else 'EXPLAIN '
+        # No PostgreSQL, um erro no EXPLAIN abortaria a transação da consulta
+        savepoint = dialeto == 'postgresql'
+        
+        cursor = conexao.connection.cursor()
+        try:
+            if savepoint:
+                cursor.execute('SAVEPOINT consultas_lentas_explain')
+            try:
+                cursor.execute(prefixo + comando, parametros or ())
+                plano = [
+                    ' | '.join(str(coluna) for coluna in linha) if len(linha) > 1 else str(linha[0])
+                    for linha in cursor.fetchall()
+                ]
+            except Exception as e:
+                if savepoint:
+                    cursor.execute('ROLLBACK TO SAVEPOINT consultas_lentas_explain')
+                plano = [f'EXPLAIN indisponível: {str(e)}']
+            if savepoint:
+                cursor.execute('RELEASE SAVEPOINT consultas_lentas_explain')
+        finally:
+            cursor.close()
+        
+        with ConsultasLentas._lock:
+            if len(ConsultasLentas._planos) >= ConsultasLentas.MAXIMO_PLANOS:
+                ConsultasLentas._planos.clear()
+            ConsultasLentas._planos[comando] = (agora, plano)
+        
+        return plano
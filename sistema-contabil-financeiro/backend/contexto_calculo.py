@@ -0,0 +1,73 @@
+from src.services.saldos import SaldosPeriodo
+from src.services.plano_contas_cache import PlanoContasCache
+import hashlib
+import json
+
+class ContextoCalculo:
+    """
+    Estado compartilhado entre as demonstrações calculadas em uma mesma requisição:
+    saldos de cada período, plano de contas e resultados intermediários (ex.: a DRE
+    usada por DRA, DVA e DFC), de modo que cada um seja obtido uma única vez.
+    """
+    
+    # Incrementar quando a lógica de cálculo das demonstrações mudar, para que as
+    # demonstrações gravadas com a lógica anterior sejam recalculadas
+    VERSAO_CALCULO = 2
+    
+    def __init__(self, versao_balancete='1.0', versao_plano_contas='1.0'):
+        self.versao_balancete = versao_balancete
+        self.versao_plano_contas = versao_plano_contas
+        self._saldos = {}
+        self._resultados = {}
+    
+    def saldos(self, periodo):
+        """Saldos do balancete do período (carregados uma vez por contexto)"""
+        if periodo not in self._saldos:
+            self._saldos[periodo] = SaldosPeriodo.carregar(periodo, self.versao_balancete)
+        return self._saldos[periodo]
+    
+    def carregar_intervalo(self, periodo_inicial, periodo_final):
+        """
+        Carrega de uma vez os saldos de todos os períodos do intervalo e retorna
+        a lista ordenada dos períodos que possuem balancete
+        """
+        carregados = SaldosPeriodo.carregar_intervalo(periodo_inicial, periodo_final, self.versao_balancete)
+        self._saldos.update(carregados)
+        return sorted(carregados)
+    
+    def usar_saldos(self, saldos_periodo):
+        """
+        Usa os saldos informados para o período deles no lugar dos gravados no
+        banco (ex.: a fotografia do balancete anterior a uma reimportação)
+        """
+        self._saldos[saldos_periodo.periodo] = saldos_periodo
+    
+    def plano(self):
+        """Plano de contas da versão do contexto"""
+        return PlanoContasCache.obter(self.versao_plano_contas)
+    
+    def assinatura(self, tipo_demonstracao, periodos, *parametros):
+        """
+        Impressão digital das entradas de uma demonstração: conteúdo dos balancetes
+        dos períodos lidos, carimbo do plano de contas (quantidade de contas e última
+        atualização) e parâmetros do cálculo. Se não mudou, a demonstração gravada
+        continua válida e não precisa ser recalculada.
+        """
+        conteudo = json.dumps([
+            ContextoCalculo.VERSAO_CALCULO,
+            tipo_demonstracao,
+            self.versao_balancete,
+            self.versao_plano_contas,
+            [str(item) for item in self.plano().carimbo],
+            [self.saldos(periodo).assinatura() for periodo in periodos],
+            list(parametros)
+        ])
+        return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+    
+    def memorizar(self, chave, calcular):
+        """
+        Retorna o resultado já calculado para a chave ou executa calcular() e o guarda
+        """
+        if chave not in self._resultados:
+            self._resultados[chave] = calcular()
+        return self._resultados[chave]
@@ -1,32 +1,103 @@
 from flask_sqlalchemy import SQLAlchemy
 from src.models.user import db
+from src.models.codificacao_dados import codificar, decodificar
+from sqlalchemy import and_, delete, event, or_
+from sqlalchemy.orm import Session, load_only
 from datetime import datetime
+import base64
 
 class DemonstracaoFinanceira(db.Model):
     __tablename__ = 'demonstracao_financeira'
+    __table_args__ = (
+        # Uma demonstração por tipo, período e versão do balancete (chave de get_demonstracao)
+        db.Index('uq_demonstracao_tipo_periodo_versao', 'tipo_demonstracao', 'periodo', 'versao_balancete', unique=True),
+        # Listagem paginada por período (listar)
+        db.Index('ix_demonstracao_versao_periodo', 'versao_balancete', 'periodo', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     tipo_demonstracao = db.Column(db.String(50), nullable=False)  # BP, DRE, DRA, DMPL, DFC, DVA
     periodo = db.Column(db.String(7), nullable=False)  # YYYY-MM
     versao_balancete = db.Column(db.String(50), default='1.0')
     versao_plano_contas = db.Column(db.String(50), default='1.0')
-    dados_json = db.Column(db.Text, nullable=False)  # JSON com os dados da demonstração
+    dados_json = db.Column(db.Text, nullable=False)  # JSON com os dados da demonstração (formato json)
+    dados_binario = db.Column(db.LargeBinary)  # Dados compactados (demais formatos, ver codificacao_dados)
+    formato_dados = db.Column(db.String(20), default='json')
+    assinatura_entrada = db.Column(db.String(64))  # Impressão digital do balancete e do plano usados no cálculo
     data_geracao = db.Column(db.DateTime, default=datetime.utcnow)
     
+    linhas = db.relationship('LinhaDemonstracao', cascade='all, delete-orphan', lazy='select')
+    
+    # Campos gravados como referência a outra demonstração do mesmo período e
+    # versão, em vez de uma cópia embutida: tipo -> {campo: tipo referenciado}
+    REFERENCIAS = {
+        'DRA': {'dre_base': 'DRE'}
+    }
+    CHAVE_REFERENCIA = '$ref'
+    
     def __repr__(self):
         return f'<DemonstracaoFinanceira {self.tipo_demonstracao} - {self.periodo}>'
     
-    def to_dict(self):
-        import json
-        return {
+    # Colunas carregadas pela listagem (sem os dados da demonstração)
+    COLUNAS_RESUMO = ('id', 'tipo_demonstracao', 'periodo', 'versao_balancete', 'versao_plano_contas', 'data_geracao')
+    
+    def to_dict(self, incluir_dados=True):
+        dados = {
             'id': self.id,
             'tipo_demonstracao': self.tipo_demonstracao,
             'periodo': self.periodo,
             'versao_balancete': self.versao_balancete,
             'versao_plano_contas': self.versao_plano_contas,
-            'dados': json.loads(self.dados_json) if self.dados_json else {},
             'data_geracao': self.data_geracao.isoformat() if self.data_geracao else None
         }
+        if incluir_dados:
+            dados['dados'] = self.get_dados()
+        return dados
+    
+    @classmethod
+    def listar(cls, tipos=None, periodo_inicial=None, periodo_final=None, versao_balancete=None, limite=50, cursor=None):
+        """
+        Página da listagem de demonstrações, da mais recente para a mais antiga
+        (período e id decrescentes), carregando apenas as colunas de COLUNAS_RESUMO.
+        A paginação é por cursor (posição após o último item da página anterior).
+        Retorna (demonstrações, cursor da próxima página ou None).
+        """
+        consulta = cls.query.options(load_only(*(getattr(cls, coluna) for coluna in cls.COLUNAS_RESUMO)))
+        
+        if tipos:
+            consulta = consulta.filter(cls.tipo_demonstracao.in_(set(tipos)))
+        if periodo_inicial:
+            consulta = consulta.filter(cls.periodo >= periodo_inicial)
+        if periodo_final:
+            # Demonstrações de intervalo (inicio_fim) entram pelo período inicial
+            consulta = consulta.filter(cls.periodo <= f'{periodo_final}_~')
+        if versao_balancete:
+            consulta = consulta.filter(cls.versao_balancete == versao_balancete)
+        
+        if cursor:
+            periodo_cursor, id_cursor = cls._ler_cursor(cursor)
+            consulta = consulta.filter(or_(
+                cls.periodo < periodo_cursor,
+                and_(cls.periodo == periodo_cursor, cls.id < id_cursor)
+            ))
+        
+        demonstracoes = consulta.order_by(cls.periodo.desc(), cls.id.desc()).limit(limite + 1).all()
+        
+        proximo_cursor = None
+        if len(demonstracoes) > limite:
+            demonstracoes = demonstracoes[:limite]
+            ultima = demonstracoes[-1]
+            proximo_cursor = base64.urlsafe_b64encode(f'{ultima.periodo}|{ultima.id}'.encode('utf-8')).decode('ascii')
+        
+        return demonstracoes, proximo_cursor
+    
+    @staticmethod
+    def _ler_cursor(cursor):
+        try:
+            periodo, identificador = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('|', 1)
+            return periodo, int(identificador)
+        except (ValueError, UnicodeError):
+            raise ValueError('Cursor de paginação inválido')
     
     @classmethod
     def get_demonstracao(cls, tipo_demonstracao, periodo, versao_balancete='1.0'):
@@ -35,6 +106,390 @@ class DemonstracaoFinanceira(db.Model):
             periodo=periodo,
             versao_balancete=versao_balancete
         ).first()
+    
+    @classmethod
+    def get_demonstracoes(cls, tipos, periodos, versao_balancete='1.0'):
+        """
+        Demonstrações gravadas para as combinações de tipos e períodos, em uma
+        única consulta: dicionário (tipo_demonstracao, periodo) -> demonstração
+        """
+        return {
+            (demonstracao.tipo_demonstracao, demonstracao.periodo): demonstracao
+            for demonstracao in cls.query.filter(
+                cls.tipo_demonstracao.in_(set(tipos)),
+                cls.periodo.in_(set(periodos)),
+                cls.versao_balancete == versao_balancete
+            ).order_by(cls.id.desc())
+        }
+    
+    @classmethod
+    def get_intervalos_com_periodo(cls, periodo, versao_balancete='1.0'):
+        """
+        Demonstrações de intervalo (DFC e DMPL, chave 'inicio_fim') que começam
+        ou terminam no período informado
+        """
+        return cls.query.filter(
+            cls.tipo_demonstracao.in_(('DFC', 'DMPL')),
+            cls.versao_balancete == versao_balancete,
+            cls.periodo.startswith(f'{periodo}_', autoescape=True) | cls.periodo.endswith(f'_{periodo}', autoescape=True)
+        ).order_by(cls.id).all()
+    
+    @classmethod
+    def get_atualizada(cls, tipo_demonstracao, periodo, versao_balancete, assinatura_entrada):
+        """
+        Retorna a demonstração gravada somente se ela foi calculada a partir das
+        mesmas entradas (mesma assinatura); caso contrário, None
+        """
+        demonstracao = cls.get_demonstracao(tipo_demonstracao, periodo, versao_balancete)
+        if demonstracao and demonstracao.esta_atualizada(assinatura_entrada):
+            return demonstracao
+        return None
+    
+    def esta_atualizada(self, assinatura_entrada):
+        return assinatura_entrada is not None and self.assinatura_entrada == assinatura_entrada
+    
+    def get_dados(self, resolver_referencias=True, referenciadas=None):
+        """
+        Dados da demonstração, em qualquer formato gravado. Os campos gravados como
+        referência (REFERENCIAS) são substituídos pelos dados da demonstração
+        referenciada, buscada em referenciadas (dicionário (tipo, periodo) ->
+        demonstração, quando já carregadas) ou no banco; None se ela não existe
+        mais ou não é a mesma (id e assinatura) da gravação.
+        """
+        dados = decodificar(self.formato_dados, self.dados_json, self.dados_binario)
+        
+        if resolver_referencias:
+            for campo, tipo in DemonstracaoFinanceira.REFERENCIAS.get(self.tipo_demonstracao, {}).items():
+                valor = dados.get(campo)
+                if DemonstracaoFinanceira._eh_referencia(valor):
+                    referenciada = self._referenciada(tipo, referenciadas)
+                    if DemonstracaoFinanceira._referencia_vale(valor, referenciada):
+                        dados[campo] = referenciada.get_dados(resolver_referencias=False)
+                    else:
+                        dados[campo] = None
+        
+        return dados
+    
+    def definir_dados(self, dados, referenciadas=None):
+        """
+        Codifica os dados no formato configurado. Um campo de REFERENCIAS é gravado
+        como referência (tipo, id e assinatura da referenciada) quando a
+        demonstração referenciada (buscada em referenciadas, dicionário
+        (tipo, periodo) -> demonstração, ou no banco) tem exatamente os mesmos
+        dados; caso contrário, a cópia continua embutida.
+        """
+        gravados = dados
+        for campo, tipo in DemonstracaoFinanceira.REFERENCIAS.get(self.tipo_demonstracao, {}).items():
+            if not isinstance(dados.get(campo), dict):
+                continue
+            
+            referenciada = self._referenciada(tipo, referenciadas)
+            if (referenciada is not None and referenciada.id is not None
+                    and referenciada.get_dados(resolver_referencias=False) == dados[campo]):
+                if gravados is dados:
+                    gravados = dict(dados)
+                gravados[campo] = {
+                    DemonstracaoFinanceira.CHAVE_REFERENCIA: tipo,
+                    'id': referenciada.id,
+                    'assinatura': referenciada.assinatura_entrada
+                }
+        
+        self.formato_dados, self.dados_json, self.dados_binario = codificar(gravados)
+        self.reconstruir_linhas(dados)
+    
+    @staticmethod
+    def _eh_referencia(valor):
+        return isinstance(valor, dict) and DemonstracaoFinanceira.CHAVE_REFERENCIA in valor
+    
+    @staticmethod
+    def _referencia_vale(referencia, referenciada):
+        """
+        A referência aponta para a demonstração gravada atualmente (mesmo id e
+        assinatura). Referências sem id (gravadas antes da fixação) valem para a atual.
+        """
+        if referenciada is None:
+            return False
+        if 'id' not in referencia:
+            return True
+        return referencia['id'] == referenciada.id and referencia.get('assinatura') == referenciada.assinatura_entrada
+    
+    def _preservar_referencias(self, dados, assinatura_entrada, referenciadas=None, excluida=False):
+        """
+        Antes de substituir os dados desta demonstração (ou de excluí-la), ajusta
+        as demonstrações que a referenciam (REFERENCIAS): se os dados mudam ou ela
+        é excluída, a cópia anterior passa a ficar embutida nelas; se não (ou
+        dados None), a referência é fixada na nova assinatura.
+        """
+        if self.id is None:
+            return
+        
+        anteriores = None
+        for tipo_referente, campos in DemonstracaoFinanceira.REFERENCIAS.items():
+            for campo, tipo in campos.items():
+                if tipo != self.tipo_demonstracao:
+                    continue
+                
+                referente = self._referenciada(tipo_referente, referenciadas)
+                if referente is None or referente is self:
+                    continue
+                gravados = decodificar(referente.formato_dados, referente.dados_json, referente.dados_binario)
+                referencia = gravados.get(campo)
+                if not DemonstracaoFinanceira._eh_referencia(referencia) or not DemonstracaoFinanceira._referencia_vale(referencia, self):
+                    continue
+                
+                if (excluida or dados is not None) and anteriores is None:
+                    anteriores = self.get_dados(resolver_referencias=False)
+                if not excluida and (dados is None or anteriores == dados):
+                    gravados[campo] = dict(referencia, id=self.id, assinatura=assinatura_entrada)
+                else:
+                    gravados[campo] = anteriores
+                # Campos de referência não geram linhas: as linhas do referente continuam valendo
+                referente.formato_dados, referente.dados_json, referente.dados_binario = codificar(gravados)
+    
+    def reconstruir_linhas(self, dados=None):
+        """
+        Substitui as linhas normalizadas (LinhaDemonstracao) pelas extraídas dos
+        dados, com um único INSERT (executemany) em vez de um por linha. Uma
+        demonstração nova é adicionada à sessão e gravada antes, para obter o id.
+        """
+        if dados is None:
+            dados = self.get_dados(resolver_referencias=False)
+        
+        if self.id is None:
+            db.session.add(self)
+            db.session.flush()
+        else:
+            db.session.execute(delete(LinhaDemonstracao).where(LinhaDemonstracao.demonstracao_id == self.id))
+        
+        versao_balancete = self.versao_balancete or '1.0'
+        registros = [
+            {
+                'demonstracao_id': self.id,
+                'tipo_demonstracao': self.tipo_demonstracao,
+                'periodo': self.periodo,
+                'versao_balancete': versao_balancete,
+                'codigo_linha': codigo_linha,
+                'descricao': descricao,
+                'nivel': nivel,
+                'valor': valor
+            }
+            for codigo_linha, descricao, nivel, valor in LinhaDemonstracao.extrair(self.tipo_demonstracao, dados)
+        ]
+        if registros:
+            db.session.execute(LinhaDemonstracao.__table__.insert(), registros)
+        
+        # A coleção em memória não acompanha o INSERT direto: recarregar quando acessada
+        db.session.expire(self, ['linhas'])
+    
+    def _referenciada(self, tipo, referenciadas=None):
+        if referenciadas is not None and (tipo, self.periodo) in referenciadas:
+            return referenciadas[(tipo, self.periodo)]
+        return DemonstracaoFinanceira.get_demonstracao(tipo, self.periodo, self.versao_balancete)
+    
+    def atualizar_dados(self, versao_plano_contas, dados, assinatura_entrada=None, referenciadas=None):
+        """Substitui os dados gravados pelos de um novo cálculo (sem commit)"""
+        self._preservar_referencias(dados, assinatura_entrada, referenciadas)
+        self.versao_plano_contas = versao_plano_contas
+        self.definir_dados(dados, referenciadas)
+        self.assinatura_entrada = assinatura_entrada
+        self.data_geracao = db.func.now()
+    
+    def atualizar_assinatura(self, assinatura_entrada):
+        """Troca a assinatura de uma demonstração cujos dados não mudam (sem commit)"""
+        self._preservar_referencias(None, assinatura_entrada)
+        self.assinatura_entrada = assinatura_entrada
+    
+    @classmethod
+    def salvar(cls, tipo_demonstracao, periodo, versao_balancete, versao_plano_contas, dados, assinatura_entrada=None):
+        """
+        Grava a demonstração gerada, atualizando a existente para a mesma chave.
+        Não confirma a transação: o chamador decide quando fazer o commit.
+        """
+        demonstracao = cls.get_demonstracao(tipo_demonstracao, periodo, versao_balancete)
+        
+        if demonstracao:
+            demonstracao.atualizar_dados(versao_plano_contas, dados, assinatura_entrada)
+        else:
+            demonstracao = cls(
+                tipo_demonstracao=tipo_demonstracao,
+                periodo=periodo,
+                versao_balancete=versao_balancete,
+                versao_plano_contas=versao_plano_contas,
+                assinatura_entrada=assinatura_entrada
+            )
+            demonstracao.definir_dados(dados)
+            db.session.add(demonstracao)
+        
+        return demonstracao
+    
+    @classmethod
+    def salvar_lote(cls, demonstracoes, versao_balancete, versao_plano_contas):
+        """
+        Grava várias demonstrações de uma vez. demonstracoes é uma lista de
+        (tipo_demonstracao, periodo, dados, assinatura_entrada); as existentes
+        são buscadas em uma única consulta. Não confirma a transação.
+        """
+        if not demonstracoes:
+            return []
+        
+        existentes = cls.get_demonstracoes(
+            [tipo for tipo, periodo, dados, assinatura in demonstracoes],
+            [periodo for tipo, periodo, dados, assinatura in demonstracoes],
+            versao_balancete
+        )
+        
+        gravadas = []
+        for tipo_demonstracao, periodo, dados, assinatura_entrada in demonstracoes:
+            demonstracao = existentes.get((tipo_demonstracao, periodo))
+            
+            if demonstracao:
+                demonstracao.atualizar_dados(versao_plano_contas, dados, assinatura_entrada, existentes)
+            else:
+                demonstracao = cls(
+                    tipo_demonstracao=tipo_demonstracao,
+                    periodo=periodo,
+                    versao_balancete=versao_balancete,
+                    versao_plano_contas=versao_plano_contas,
+                    assinatura_entrada=assinatura_entrada
+                )
+                demonstracao.definir_dados(dados, existentes)
+                db.session.add(demonstracao)
+                existentes[(tipo_demonstracao, periodo)] = demonstracao
+            
+            gravadas.append(demonstracao)
+        
+        return gravadas
+
+@event.listens_for(Session, 'before_flush')
+def _preservar_referencias_excluidas(sessao, contexto, instancias):
+    """Embute a cópia de uma demonstração excluída nas que a referenciam"""
+    excluidas = [objeto for objeto in sessao.deleted if isinstance(objeto, DemonstracaoFinanceira)]
+    with sessao.no_autoflush:
+        for demonstracao in excluidas:
+            demonstracao._preservar_referencias(None, None, excluida=True)
+
+class LinhaDemonstracao(db.Model):
+    """
+    Linhas numéricas de uma demonstração gravada, normalizadas para consulta em SQL
+    (ex.: lucro líquido de todos os meses em uma única consulta indexada). São
+    regravadas junto com os dados da demonstração (definir_dados).
+    
+    Códigos de linha:
+        campos numéricos      caminho das chaves: 'indicadores.lucro_liquido',
+                              'ativo.total', 'fluxo_operacional.total'
+        contas e itens        seção + código: 'receitas/4.1.1', 'ativo/1.1',
+                              'geracao_valor_adicionado.receitas/4.1.1'
+    """
+    __tablename__ = 'linha_demonstracao'
+    __table_args__ = (
+        # Série de uma linha ao longo dos períodos (get_series)
+        db.Index('ix_linha_demonstracao_tipo_codigo', 'tipo_demonstracao', 'codigo_linha', 'versao_balancete', 'periodo'),
+    )
+    
+    # Chaves que agrupam contas/itens e não entram no código da linha
+    AGRUPADORES = ('grupos', 'subgrupos', 'contas', 'itens')
+    
+    id = db.Column(db.Integer, primary_key=True)
+    demonstracao_id = db.Column(db.Integer, db.ForeignKey('demonstracao_financeira.id'), nullable=False, index=True)
+    tipo_demonstracao = db.Column(db.String(50), nullable=False)
+    periodo = db.Column(db.String(15), nullable=False)  # YYYY-MM ou YYYY-MM_YYYY-MM (DFC e DMPL)
+    versao_balancete = db.Column(db.String(50), default='1.0')
+    codigo_linha = db.Column(db.String(150), nullable=False)
+    descricao = db.Column(db.String(255))
+    nivel = db.Column(db.Integer)
+    valor = db.Column(db.Float)
+    
+    def __repr__(self):
+        return f'<LinhaDemonstracao {self.tipo_demonstracao} {self.periodo} {self.codigo_linha}>'
+    
+    def to_dict(self):
+        return {
+            'tipo_demonstracao': self.tipo_demonstracao,
+            'periodo': self.periodo,
+            'codigo_linha': self.codigo_linha,
+            'descricao': self.descricao,
+            'nivel': self.nivel,
+            'valor': self.valor
+        }
+    
+    @classmethod
+    def get_series(cls, tipo_demonstracao, codigos, periodo_inicial=None, periodo_final=None, versao_balancete='1.0'):
+        """Valores das linhas informadas em todos os períodos do intervalo: lista de (codigo_linha, periodo, valor)"""
+        consulta = db.session.query(cls.codigo_linha, cls.periodo, cls.valor).filter(
+            cls.tipo_demonstracao == tipo_demonstracao,
+            cls.codigo_linha.in_(set(codigos)),
+            cls.versao_balancete == versao_balancete
+        )
+        if periodo_inicial:
+            consulta = consulta.filter(cls.periodo >= periodo_inicial)
+        if periodo_final:
+            consulta = consulta.filter(cls.periodo <= periodo_final)
+        return consulta.order_by(cls.codigo_linha, cls.periodo).all()
+    
+    @classmethod
+    def get_linhas(cls, tipo_demonstracao, periodo, versao_balancete='1.0'):
+        return cls.query.filter_by(
+            tipo_demonstracao=tipo_demonstracao,
+            periodo=periodo,
+            versao_balancete=versao_balancete
+        ).order_by(cls.id).all()
+    
+    @staticmethod
+    def extrair(tipo_demonstracao, dados):
+        """
+        Linhas numéricas dos dados de uma demonstração: lista de (codigo_linha,
+        descricao, nivel, valor). Estruturas de apresentação (estrutura_*) e campos
+        de referência a outra demonstração (ex.: dre_base da DRA) não geram linhas.
+        """
+        ignorados = set(DemonstracaoFinanceira.REFERENCIAS.get(tipo_demonstracao, {}))
+        linhas = {}
+        
+        def adicionar(codigo_linha, descricao, nivel, valor):
+            if codigo_linha not in linhas:
+                linhas[codigo_linha] = (codigo_linha, descricao, nivel, float(valor))
+        
+        def itens(valores, secao, nivel):
+            for item in valores:
+                if not LinhaDemonstracao._eh_item(item):
+                    continue
+                valor = item['saldo'] if 'saldo' in item else item['valor']
+                if LinhaDemonstracao._eh_numero(valor):
+                    adicionar(f"{secao}/{item['codigo']}", item.get('nome') or item.get('descricao'), nivel, valor)
+                for chave in LinhaDemonstracao.AGRUPADORES:
+                    filhos = item.get(chave)
+                    if isinstance(filhos, dict):
+                        itens(filhos.values(), secao, nivel + 1)
+                    elif isinstance(filhos, list):
+                        itens(filhos, secao, nivel + 1)
+        
+        def percorrer(no, caminho):
+            for chave, valor in no.items():
+                if not caminho and (chave in ignorados or chave.startswith('estrutura')):
+                    continue
+                
+                secao = caminho + ([] if chave in LinhaDemonstracao.AGRUPADORES else [chave])
+                if LinhaDemonstracao._eh_numero(valor):
+                    adicionar('.'.join(caminho + [chave]), None, len(caminho) + 1, valor)
+                elif isinstance(valor, list):
+                    itens(valor, '.'.join(secao), 1)
+                elif isinstance(valor, dict):
+                    if valor and all(LinhaDemonstracao._eh_item(filho) for filho in valor.values()):
+                        itens(valor.values(), '.'.join(secao), 1)
+                    else:
+                        percorrer(valor, secao)
+        
+        if isinstance(dados, dict):
+            percorrer(dados, [])
+        return list(linhas.values())
+    
+    @staticmethod
+    def _eh_numero(valor):
+        return isinstance(valor, (int, float)) and not isinstance(valor, bool)
+    
+    @staticmethod
+    def _eh_item(valor):
+        """Conta ou item de demonstração: dicionário com código e saldo/valor"""
+        return isinstance(valor, dict) and 'codigo' in valor and ('saldo' in valor or 'valor' in valor)
 
 class NotaExplicativa(db.Model):
     __tablename__ = 'nota_explicativa'
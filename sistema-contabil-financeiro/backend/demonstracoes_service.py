@@ -0,0 +1,301 @@
+from src.models.demonstracoes import DemonstracaoFinanceira
+from src.models.user import db
+from src.models.roteamento import Roteamento
+from src.services.contexto_calculo import ContextoCalculo
+from src.services.agendador import AgendadorCalculo
+from src.services.balanco_patrimonial import BalancoPatrimonialService
+from src.services.dre import DREService
+from src.services.dra import DRAService
+from src.services.dva import DVAService
+from src.services.dfc import DFCService
+from src.services.dmpl import DMPLService
+from src.services.instrumentacao import Instrumentacao
+
+class DemonstracoesService:
+    
+    # Demonstrações geradas por gerar_todas, na ordem em que são gravadas
+    TIPOS = ('BP', 'DRE', 'DRA', 'DVA', 'DFC', 'DMPL')
+    
+    # Demonstrações de um único período aceitas por gerar_lote
+    CALCULOS_MENSAIS = {
+        'DRE': DREService.calcular_dre,
+        'BP': BalancoPatrimonialService.calcular_balanco_patrimonial,
+        'DRA': DRAService.calcular_dra,
+        'DVA': DVAService.calcular_dva
+    }
+    
+    # Quantidade máxima de períodos por lote (36 meses)
+    LIMITE_PERIODOS_LOTE = 36
+    
+    # Tamanho padrão e máximo da página da listagem
+    TAMANHO_PAGINA = 50
+    TAMANHO_PAGINA_MAXIMO = 500
+    
+    @staticmethod
+    @Instrumentacao.servico('gerar_todas')
+    def gerar_todas(periodo_inicial, periodo_final, versao_balancete='1.0', versao_plano_contas='1.0', metodo_dfc='indireto', max_workers=4):
+        """
+        Gera as seis demonstrações (BP, DRE, DRA, DVA, DFC e DMPL) em uma única passagem.
+        Saldos, plano de contas e DRE são obtidos uma vez e compartilhados entre elas;
+        os cálculos independentes rodam em paralelo e a gravação acontece em uma única
+        transação, somente se todas forem geradas. Retorna também o tempo de cada etapa.
+        """
+        try:
+            contexto = ContextoCalculo(versao_balancete, versao_plano_contas)
+            periodo_chave = f"{periodo_inicial}_{periodo_final}"
+            
+            # Assinatura das entradas de cada demonstração: se nenhuma mudou desde a
+            # última geração, as demonstrações gravadas são devolvidas sem recálculo
+            assinaturas = {}
+            for tipo_demonstracao in DemonstracoesService.TIPOS:
+                if tipo_demonstracao in ('DFC', 'DMPL'):
+                    periodos = (periodo_inicial, periodo_final)
+                    parametros = (metodo_dfc,) if tipo_demonstracao == 'DFC' else ()
+                    assinaturas[tipo_demonstracao] = (
+                        periodo_chave, contexto.assinatura(tipo_demonstracao, periodos, *parametros)
+                    )
+                else:
+                    assinaturas[tipo_demonstracao] = (
+                        periodo_final, contexto.assinatura(tipo_demonstracao, (periodo_final,))
+                    )
+            
+            existentes = DemonstracaoFinanceira.get_demonstracoes(
+                DemonstracoesService.TIPOS, (periodo_final, periodo_chave), versao_balancete
+            )
+            atualizadas = {
+                tipo: existentes[(tipo, periodo)]
+                for tipo, (periodo, assinatura) in assinaturas.items()
+                if (tipo, periodo) in existentes and existentes[(tipo, periodo)].esta_atualizada(assinatura)
+            }
+            if len(atualizadas) == len(DemonstracoesService.TIPOS):
+                return {
+                    'success': True,
+                    'data': {
+                        tipo: atualizadas[tipo].get_dados(referenciadas=existentes) for tipo in DemonstracoesService.TIPOS
+                    },
+                    'tempos_ms': {},
+                    'reaproveitada': True,
+                    'message': 'Demonstrações sem alterações nas entradas; versões gravadas reaproveitadas'
+                }
+            
+            agendador = DemonstracoesService.montar_grafo(periodo_inicial, periodo_final, contexto, metodo_dfc, max_workers)
+            execucao = agendador.executar()
+            
+            tempos_ms = {nome: round(segundos * 1000, 2) for nome, segundos in execucao['tempos'].items()}
+            
+            demonstracoes = {}
+            erros = dict(execucao['erros'])
+            
+            for tipo_demonstracao in DemonstracoesService.TIPOS:
+                resultado = execucao['resultados'].get(tipo_demonstracao)
+                if resultado is None:
+                    continue
+                if resultado['success']:
+                    periodo = periodo_chave if tipo_demonstracao in ('DFC', 'DMPL') else periodo_final
+                    demonstracoes[tipo_demonstracao] = (periodo, resultado['data'])
+                else:
+                    erros[tipo_demonstracao] = resultado['message']
+            
+            if erros:
+                return {
+                    'success': False,
+                    'erros': erros,
+                    'tempos_ms': tempos_ms,
+                    'message': 'Erro ao gerar demonstrações: ' + '; '.join(
+                        f'{tipo}: {mensagem}' for tipo, mensagem in erros.items()
+                    )
+                }
+            
+            # Salvar todas as demonstrações em uma única transação
+            with Instrumentacao.etapa('persistencia'):
+                DemonstracaoFinanceira.salvar_lote(
+                    [(tipo, periodo, dados, assinaturas[tipo][1]) for tipo, (periodo, dados) in demonstracoes.items()],
+                    versao_balancete, versao_plano_contas
+                )
+                db.session.commit()
+            
+            return {
+                'success': True,
+                'data': {tipo: dados for tipo, (periodo, dados) in demonstracoes.items()},
+                'tempos_ms': tempos_ms,
+                'message': 'Demonstrações geradas com sucesso'
+            }
+            
+        except Exception as e:
+            db.session.rollback()
+            return {
+                'success': False,
+                'message': f'Erro ao gerar demonstrações: {str(e)}'
+            }
+    
+    @staticmethod
+    @Instrumentacao.servico('gerar_lote')
+    def gerar_lote(periodo_inicial, periodo_final, tipos=('DRE', 'BP'), versao_balancete='1.0', versao_plano_contas='1.0', progresso=None):
+        """
+        Gera as demonstrações mensais (DRE, BP, DRA e/ou DVA) de todos os períodos
+        do intervalo. Os balancetes do intervalo são lidos em uma única consulta e
+        todas as demonstrações são gravadas em uma única transação; os períodos
+        com erro são informados sem impedir a gravação dos demais. Demonstrações
+        cujas entradas não mudaram desde a última geração não são recalculadas.
+        progresso, se informado, é chamado a cada período calculado com (percentual,
+        mensagem); uma exceção levantada por ele interrompe o lote sem gravar nada.
+        """
+        try:
+            tipos_invalidos = [tipo for tipo in tipos if tipo not in DemonstracoesService.CALCULOS_MENSAIS]
+            if tipos_invalidos:
+                return {
+                    'success': False,
+                    'message': f'Demonstrações não suportadas no lote: {", ".join(tipos_invalidos)}'
+                }
+            
+            if periodo_inicial > periodo_final:
+                return {
+                    'success': False,
+                    'message': 'O período inicial deve ser anterior ao período final'
+                }
+            
+            contexto = ContextoCalculo(versao_balancete, versao_plano_contas)
+            periodos = contexto.carregar_intervalo(periodo_inicial, periodo_final)
+            
+            if not periodos:
+                return {
+                    'success': False,
+                    'message': 'Nenhum balancete encontrado no intervalo informado'
+                }
+            
+            if len(periodos) > DemonstracoesService.LIMITE_PERIODOS_LOTE:
+                return {
+                    'success': False,
+                    'message': f'O lote aceita no máximo {DemonstracoesService.LIMITE_PERIODOS_LOTE} períodos'
+                }
+            
+            demonstracoes = []
+            dados_por_periodo = {}
+            erros = {}
+            reaproveitadas = 0
+            existentes = DemonstracaoFinanceira.get_demonstracoes(tipos, periodos, versao_balancete)
+            
+            for indice, periodo in enumerate(periodos):
+                if progresso:
+                    progresso(100.0 * indice / len(periodos), f'Calculando {periodo}')
+                
+                for tipo_demonstracao in tipos:
+                    assinatura = contexto.assinatura(tipo_demonstracao, (periodo,))
+                    existente = existentes.get((tipo_demonstracao, periodo))
+                    if existente and existente.esta_atualizada(assinatura):
+                        dados_por_periodo.setdefault(periodo, {})[tipo_demonstracao] = existente.get_dados(
+                            referenciadas=existentes
+                        )
+                        reaproveitadas += 1
+                        continue
+                    
+                    resultado = DemonstracoesService.CALCULOS_MENSAIS[tipo_demonstracao](periodo, contexto)
+                    if resultado['success']:
+                        demonstracoes.append((tipo_demonstracao, periodo, resultado['data'], assinatura))
+                        dados_por_periodo.setdefault(periodo, {})[tipo_demonstracao] = resultado['data']
+                    else:
+                        erros.setdefault(periodo, {})[tipo_demonstracao] = resultado['message']
+            
+            # Salvar todas as demonstrações geradas em uma única transação
+            with Instrumentacao.etapa('persistencia'):
+                DemonstracaoFinanceira.salvar_lote(demonstracoes, versao_balancete, versao_plano_contas)
+                db.session.commit()
+            
+            return {
+                'success': not erros,
+                'data': dados_por_periodo,
+                'periodos': periodos,
+                'erros': erros,
+                'reaproveitadas': reaproveitadas,
+                'message': (
+                    f'{len(demonstracoes)} demonstrações geradas para {len(periodos)} períodos'
+                    + (f'; {reaproveitadas} reaproveitadas sem alterações' if reaproveitadas else '')
+                    + (f'; {sum(len(e) for e in erros.values())} com erro' if erros else '')
+                )
+            }
+            
+        except Exception as e:
+            db.session.rollback()
+            return {
+                'success': False,
+                'message': f'Erro ao gerar demonstrações em lote: {str(e)}'
+            }
+    
+    @staticmethod
+    @Roteamento.somente_leitura()
+    def listar(tipos=None, periodo_inicial=None, periodo_final=None, versao_balancete=None, limite=None, cursor=None):
+        """
+        Listagem paginada das demonstrações geradas, somente com os metadados
+        (sem ler nem decodificar os dados). Filtros opcionais por tipos, intervalo
+        de períodos e versão do balancete.
+        """
+        try:
+            limite = max(1, min(limite or DemonstracoesService.TAMANHO_PAGINA, DemonstracoesService.TAMANHO_PAGINA_MAXIMO))
+            
+            demonstracoes, proximo_cursor = DemonstracaoFinanceira.listar(
+                tipos, periodo_inicial, periodo_final, versao_balancete, limite, cursor
+            )
+            
+            return {
+                'success': True,
+                'data': [demonstracao.to_dict(incluir_dados=False) for demonstracao in demonstracoes],
+                'paginacao': {
+                    'limite': limite,
+                    'proximo_cursor': proximo_cursor,
+                    'tem_mais': proximo_cursor is not None
+                }
+            }
+            
+        except ValueError as e:
+            return {
+                'success': False,
+                'message': str(e)
+            }
+        except Exception as e:
+            return {
+                'success': False,
+                'message': f'Erro ao listar demonstrações: {str(e)}'
+            }
+    
+    @staticmethod
+    def montar_grafo(periodo_inicial, periodo_final, contexto, metodo_dfc='indireto', max_workers=4):
+        """
+        Monta o grafo de dependências entre as demonstrações:
+        DRA, DVA e DFC dependem da DRE; DFC e DMPL dependem dos saldos dos dois
+        períodos; as seções da DFC são independentes entre si.
+        """
+        agendador = AgendadorCalculo(max_workers)
+        
+        saldos_inicial = f'saldos:{periodo_inicial}'
+        saldos_final = f'saldos:{periodo_final}'
+        for periodo in {periodo_inicial, periodo_final}:
+            agendador.adicionar(f'saldos:{periodo}', lambda periodo=periodo: contexto.saldos(periodo))
+        agendador.adicionar('plano', contexto.plano)
+        
+        base_final = (saldos_final, 'plano')
+        base_periodos = (saldos_inicial, saldos_final, 'plano')
+        
+        agendador.adicionar(
+            'BP', lambda: BalancoPatrimonialService.calcular_balanco_patrimonial(periodo_final, contexto), base_final
+        )
+        agendador.adicionar('DRE', lambda: DREService.calcular_dre(periodo_final, contexto), base_final)
+        agendador.adicionar('DRA', lambda: DRAService.calcular_dra(periodo_final, contexto), ('DRE',))
+        agendador.adicionar('DVA', lambda: DVAService.calcular_dva(periodo_final, contexto), ('DRE',))
+        agendador.adicionar(
+            'DMPL', lambda: DMPLService.calcular_dmpl(periodo_inicial, periodo_final, contexto), base_periodos
+        )
+        
+        dependencias_dfc = ['DRE']
+        if metodo_dfc == 'indireto':
+            for secao in DFCService.SECOES_INDIRETO:
+                agendador.adicionar(
+                    f'DFC.{secao}',
+                    lambda secao=secao: DFCService.calcular_secao_dfc(secao, periodo_inicial, periodo_final, contexto),
+                    base_periodos
+                )
+                dependencias_dfc.append(f'DFC.{secao}')
+        agendador.adicionar(
+            'DFC', lambda: DFCService.calcular_dfc(periodo_inicial, periodo_final, contexto, metodo_dfc), dependencias_dfc
+        )
+        
+        return agendador
@@ -1,51 +1,47 @@
-from src.models.balancete import Balancete
-from src.models.plano_contas import PlanoContas
 from src.models.demonstracoes import DemonstracaoFinanceira
 from src.models.user import db
+from src.models.centavos import converter_valores, para_reais
+from src.models.roteamento import Roteamento
 from src.services.dre import DREService
-import json
-from decimal import Decimal
+from src.services.contexto_calculo import ContextoCalculo
+from src.services.plano_contas_cache import PlanoContasCache
+from src.services.instrumentacao import Instrumentacao
 
 class DFCService:
     
     @staticmethod
-    def gerar_dfc(periodo_inicial, periodo_final, metodo='indireto', versao_balancete='1.0', versao_plano_contas='1.0'):
+    @Instrumentacao.servico('gerar_dfc')
+    def gerar_dfc(periodo_inicial, periodo_final, metodo='indireto', versao_balancete='1.0', versao_plano_contas='1.0', contexto=None):
         """
         Gera a Demonstração do Fluxo de Caixa (DFC) pelo método indireto ou direto
         """
         try:
-            if metodo == 'indireto':
-                resultado = DFCService._gerar_dfc_indireto(
-                    periodo_inicial, periodo_final, versao_balancete, versao_plano_contas
-                )
-            else:
-                resultado = DFCService._gerar_dfc_direto(
-                    periodo_inicial, periodo_final, versao_balancete, versao_plano_contas
-                )
+            contexto = contexto or ContextoCalculo(versao_balancete, versao_plano_contas)
+            periodo_chave = f"{periodo_inicial}_{periodo_final}"
+            
+            # Reaproveitar a demonstração gravada se as entradas do cálculo não mudaram
+            assinatura = contexto.assinatura('DFC', (periodo_inicial, periodo_final), metodo)
+            existente = DemonstracaoFinanceira.get_atualizada('DFC', periodo_chave, contexto.versao_balancete, assinatura)
+            if existente:
+                return {
+                    'success': True,
+                    'data': existente.get_dados(),
+                    'reaproveitada': True,
+                    'message': 'DFC sem alterações no balancete e no plano de contas; versão gravada reaproveitada'
+                }
             
+            resultado = DFCService.calcular_dfc(periodo_inicial, periodo_final, contexto, metodo)
             if not resultado['success']:
                 return resultado
             
             dfc_data = resultado['data']
             
             # Salvar demonstração no banco
-            periodo_chave = f"{periodo_inicial}_{periodo_final}"
-            demonstracao_existente = DemonstracaoFinanceira.get_demonstracao('DFC', periodo_chave, versao_balancete)
-            
-            if demonstracao_existente:
-                demonstracao_existente.dados_json = json.dumps(dfc_data)
-                demonstracao_existente.data_geracao = db.func.now()
-            else:
-                nova_demonstracao = DemonstracaoFinanceira(
-                    tipo_demonstracao='DFC',
-                    periodo=periodo_chave,
-                    versao_balancete=versao_balancete,
-                    versao_plano_contas=versao_plano_contas,
-                    dados_json=json.dumps(dfc_data)
+            with Instrumentacao.etapa('persistencia'):
+                DemonstracaoFinanceira.salvar(
+                    'DFC', periodo_chave, contexto.versao_balancete, contexto.versao_plano_contas, dfc_data, assinatura
                 )
-                db.session.add(nova_demonstracao)
-            
-            db.session.commit()
+                db.session.commit()
             
             return {
                 'success': True,
@@ -61,71 +57,113 @@ class DFCService:
             }
     
     @staticmethod
-    def _gerar_dfc_indireto(periodo_inicial, periodo_final, versao_balancete, versao_plano_contas):
+    def calcular_dfc(periodo_inicial, periodo_final, contexto, metodo='indireto'):
+        """
+        Calcula a DFC sem gravá-la, reaproveitando a DRE e os saldos do contexto
+        """
+        if metodo == 'indireto':
+            calcular = lambda: DFCService._gerar_dfc_indireto(periodo_inicial, periodo_final, contexto)
+        else:
+            calcular = lambda: DFCService._gerar_dfc_direto(periodo_inicial, periodo_final, contexto)
+        
+        return contexto.memorizar(('DFC', metodo, periodo_inicial, periodo_final), calcular)
+    
+    # Seções do método indireto que não dependem umas das outras
+    SECOES_INDIRETO = ('ajustes', 'capital_giro', 'investimento', 'financiamento', 'caixa')
+    
+    @staticmethod
+    def calcular_secao_dfc(secao, periodo_inicial, periodo_final, contexto):
+        """
+        Calcula uma seção do método indireto a partir dos saldos do contexto
+        (valores em centavos)
+        """
+        @Instrumentacao.etapa('consolidacao')
+        def calcular():
+            saldos_inicial = contexto.saldos(periodo_inicial)
+            saldos_final = contexto.saldos(periodo_final)
+            versao_plano_contas = contexto.versao_plano_contas
+            
+            if secao == 'ajustes':
+                return DFCService._calcular_ajustes_lucro_liquido(saldos_final, versao_plano_contas)
+            if secao == 'capital_giro':
+                return DFCService._calcular_variacoes_capital_giro(saldos_inicial, saldos_final, versao_plano_contas)
+            if secao == 'investimento':
+                return DFCService._calcular_fluxo_investimento(saldos_inicial, saldos_final, versao_plano_contas)
+            if secao == 'financiamento':
+                return DFCService._calcular_fluxo_financiamento(saldos_inicial, saldos_final, versao_plano_contas)
+            if secao == 'caixa':
+                return (
+                    DFCService._obter_saldo_caixa(saldos_inicial, versao_plano_contas),
+                    DFCService._obter_saldo_caixa(saldos_final, versao_plano_contas)
+                )
+            raise ValueError(f'Seção da DFC desconhecida: {secao}')
+        
+        return contexto.memorizar(('DFC', secao, periodo_inicial, periodo_final), calcular)
+    
+    @staticmethod
+    def _gerar_dfc_indireto(periodo_inicial, periodo_final, contexto):
         """
         Gera DFC pelo método indireto (partindo do lucro líquido)
         """
         try:
             # Obter lucro líquido da DRE
-            dre_resultado = DREService.gerar_dre(periodo_final, versao_balancete, versao_plano_contas)
+            dre_resultado = DREService.calcular_dre(periodo_final, contexto)
             if not dre_resultado['success']:
                 return {
                     'success': False,
                     'message': f'Erro ao obter DRE para DFC: {dre_resultado["message"]}'
                 }
             
-            lucro_liquido = dre_resultado['data']['indicadores']['lucro_liquido']
+            lucro_liquido = dre_resultado['centavos']['lucro_liquido']
+            
+            # Seções independentes entre si (memorizadas no contexto; o agendador
+            # de demonstrações pode calculá-las antecipadamente em paralelo)
+            secao = lambda nome: DFCService.calcular_secao_dfc(nome, periodo_inicial, periodo_final, contexto)
             
             # Calcular ajustes ao lucro líquido
-            ajustes = DFCService._calcular_ajustes_lucro_liquido(
-                periodo_inicial, periodo_final, versao_balancete, versao_plano_contas
-            )
+            ajustes = secao('ajustes')
             
             # Calcular variações no capital de giro
-            variacoes_capital_giro = DFCService._calcular_variacoes_capital_giro(
-                periodo_inicial, periodo_final, versao_balancete, versao_plano_contas
-            )
+            variacoes_capital_giro = secao('capital_giro')
             
             # Calcular fluxo de caixa operacional
             fluxo_operacional = lucro_liquido + sum(ajuste['valor'] for ajuste in ajustes) + variacoes_capital_giro['total']
             
             # Calcular fluxo de caixa de investimento
-            fluxo_investimento = DFCService._calcular_fluxo_investimento(
-                periodo_inicial, periodo_final, versao_balancete, versao_plano_contas
-            )
+            fluxo_investimento = secao('investimento')
             
             # Calcular fluxo de caixa de financiamento
-            fluxo_financiamento = DFCService._calcular_fluxo_financiamento(
-                periodo_inicial, periodo_final, versao_balancete, versao_plano_contas
-            )
+            fluxo_financiamento = secao('financiamento')
             
             # Calcular variação líquida de caixa
             variacao_caixa = fluxo_operacional + fluxo_investimento['total'] + fluxo_financiamento['total']
             
             # Obter saldos de caixa
-            saldo_inicial_caixa = DFCService._obter_saldo_caixa(periodo_inicial, versao_balancete, versao_plano_contas)
-            saldo_final_caixa = DFCService._obter_saldo_caixa(periodo_final, versao_balancete, versao_plano_contas)
+            saldo_inicial_caixa, saldo_final_caixa = secao('caixa')
             
+            # Valores calculados em centavos, convertidos para reais na montagem
             dfc_data = {
                 'metodo': 'indireto',
                 'periodo_inicial': periodo_inicial,
                 'periodo_final': periodo_final,
                 'fluxo_operacional': {
-                    'lucro_liquido': lucro_liquido,
-                    'ajustes': ajustes,
-                    'variacoes_capital_giro': variacoes_capital_giro,
-                    'total': fluxo_operacional
+                    'lucro_liquido': para_reais(lucro_liquido),
+                    'ajustes': converter_valores(ajustes),
+                    'variacoes_capital_giro': {
+                        nome: para_reais(valor) for nome, valor in variacoes_capital_giro.items()
+                    },
+                    'total': para_reais(fluxo_operacional)
                 },
-                'fluxo_investimento': fluxo_investimento,
-                'fluxo_financiamento': fluxo_financiamento,
-                'variacao_caixa': variacao_caixa,
-                'saldo_inicial_caixa': saldo_inicial_caixa,
-                'saldo_final_caixa': saldo_final_caixa,
-                'estrutura_dfc': DFCService._estruturar_dfc_indireto(
+                'fluxo_investimento': converter_valores(fluxo_investimento),
+                'fluxo_financiamento': converter_valores(fluxo_financiamento),
+                'variacao_caixa': para_reais(variacao_caixa),
+                'saldo_inicial_caixa': para_reais(saldo_inicial_caixa),
+                'saldo_final_caixa': para_reais(saldo_final_caixa),
+                'estrutura_dfc': converter_valores(DFCService._estruturar_dfc_indireto(
                     lucro_liquido, ajustes, variacoes_capital_giro, fluxo_operacional,
                     fluxo_investimento, fluxo_financiamento, variacao_caixa,
                     saldo_inicial_caixa, saldo_final_caixa
-                )
+                ))
             }
             
             return {'success': True, 'data': dfc_data}
@@ -134,22 +172,20 @@ class DFCService:
             return {'success': False, 'message': f'Erro no método indireto: {str(e)}'}
     
     @staticmethod
-    def _calcular_ajustes_lucro_liquido(periodo_inicial, periodo_final, versao_balancete, versao_plano_contas):
+    def _calcular_ajustes_lucro_liquido(saldos_final, versao_plano_contas):
         """
         Calcula ajustes ao lucro líquido para itens que não afetam o caixa
         """
         ajustes = []
         
-        # Buscar contas de depreciação, amortização e exaustão
-        contas_deprec = PlanoContas.query.filter(
-            PlanoContas.versao == versao_plano_contas,
-            PlanoContas.ativo == True,
-            PlanoContas.nome.ilike('%depreciação%')
-        ).all()
+        plano = PlanoContasCache.obter(versao_plano_contas)
+        
+        # Contas de depreciação, amortização e exaustão (classificação persistida)
+        contas_deprec = plano.get_contas_por_tag('depreciacao')
         
         for conta in contas_deprec:
-            saldo = Balancete.get_saldo_por_conta(conta.codigo, periodo_final, versao_balancete)
-            if abs(saldo) > 0.01:
+            saldo = saldos_final.get_saldo(conta.codigo)
+            if saldo != 0:
                 ajustes.append({
                     'codigo': conta.codigo,
                     'descricao': f'Depreciação - {conta.nome}',
@@ -158,17 +194,13 @@ class DFCService:
                 })
         
         # Buscar outras contas que não afetam o caixa
-        contas_nao_caixa = ['amortização', 'exaustão', 'provisão']
-        for termo in contas_nao_caixa:
-            contas = PlanoContas.query.filter(
-                PlanoContas.versao == versao_plano_contas,
-                PlanoContas.ativo == True,
-                PlanoContas.nome.ilike(f'%{termo}%')
-            ).all()
+        contas_nao_caixa = [('amortização', 'amortizacao'), ('exaustão', 'exaustao'), ('provisão', 'provisao')]
+        for termo, tag in contas_nao_caixa:
+            contas = plano.get_contas_por_tag(tag)
             
             for conta in contas:
-                saldo = Balancete.get_saldo_por_conta(conta.codigo, periodo_final, versao_balancete)
-                if abs(saldo) > 0.01:
+                saldo = saldos_final.get_saldo(conta.codigo)
+                if saldo != 0:
                     ajustes.append({
                         'codigo': conta.codigo,
                         'descricao': f'{termo.title()} - {conta.nome}',
@@ -179,39 +211,33 @@ class DFCService:
         return ajustes
     
     @staticmethod
-    def _calcular_variacoes_capital_giro(periodo_inicial, periodo_final, versao_balancete, versao_plano_contas):
+    def _calcular_variacoes_capital_giro(saldos_inicial, saldos_final, versao_plano_contas):
         """
         Calcula as variações no capital de giro circulante
         """
+        plano = PlanoContasCache.obter(versao_plano_contas)
+        contas_caixa = {conta.codigo for conta in plano.get_contas_por_tag('caixa')}
+        
         # Contas do ativo circulante (exceto caixa)
-        contas_ac = PlanoContas.query.filter(
-            PlanoContas.versao == versao_plano_contas,
-            PlanoContas.ativo == True,
-            PlanoContas.elemento_conta == 'ativo',
-            PlanoContas.nome.ilike('%circulante%'),
-            ~PlanoContas.nome.ilike('%caixa%'),
-            ~PlanoContas.nome.ilike('%banco%')
-        ).all()
+        contas_ac = [
+            conta for conta in plano.get_contas_por_tag('circulante', 'ativo')
+            if conta.codigo not in contas_caixa
+        ]
         
         variacao_ac = 0
         for conta in contas_ac:
-            saldo_inicial = Balancete.get_saldo_por_conta(conta.codigo, periodo_inicial, versao_balancete)
-            saldo_final = Balancete.get_saldo_por_conta(conta.codigo, periodo_final, versao_balancete)
+            saldo_inicial = saldos_inicial.get_saldo(conta.codigo)
+            saldo_final = saldos_final.get_saldo(conta.codigo)
             variacao = saldo_final - saldo_inicial
             variacao_ac += variacao
         
         # Contas do passivo circulante
-        contas_pc = PlanoContas.query.filter(
-            PlanoContas.versao == versao_plano_contas,
-            PlanoContas.ativo == True,
-            PlanoContas.elemento_conta == 'passivo',
-            PlanoContas.nome.ilike('%circulante%')
-        ).all()
+        contas_pc = plano.get_contas_por_tag('circulante', 'passivo')
         
         variacao_pc = 0
         for conta in contas_pc:
-            saldo_inicial = Balancete.get_saldo_por_conta(conta.codigo, periodo_inicial, versao_balancete)
-            saldo_final = Balancete.get_saldo_por_conta(conta.codigo, periodo_final, versao_balancete)
+            saldo_inicial = saldos_inicial.get_saldo(conta.codigo)
+            saldo_final = saldos_final.get_saldo(conta.codigo)
             variacao = saldo_final - saldo_inicial
             variacao_pc += variacao
         
@@ -225,27 +251,22 @@ class DFCService:
         }
     
     @staticmethod
-    def _calcular_fluxo_investimento(periodo_inicial, periodo_final, versao_balancete, versao_plano_contas):
+    def _calcular_fluxo_investimento(saldos_inicial, saldos_final, versao_plano_contas):
         """
         Calcula o fluxo de caixa das atividades de investimento
         """
         investimentos = []
         
         # Buscar contas do ativo não circulante
-        contas_anc = PlanoContas.query.filter(
-            PlanoContas.versao == versao_plano_contas,
-            PlanoContas.ativo == True,
-            PlanoContas.elemento_conta == 'ativo',
-            PlanoContas.nome.ilike('%não circulante%')
-        ).all()
+        contas_anc = PlanoContasCache.obter(versao_plano_contas).get_contas_por_tag('nao_circulante', 'ativo')
         
         total_investimento = 0
         for conta in contas_anc:
-            saldo_inicial = Balancete.get_saldo_por_conta(conta.codigo, periodo_inicial, versao_balancete)
-            saldo_final = Balancete.get_saldo_por_conta(conta.codigo, periodo_final, versao_balancete)
+            saldo_inicial = saldos_inicial.get_saldo(conta.codigo)
+            saldo_final = saldos_final.get_saldo(conta.codigo)
             variacao = saldo_final - saldo_inicial
             
-            if abs(variacao) > 0.01:
+            if variacao != 0:
                 investimentos.append({
                     'codigo': conta.codigo,
                     'descricao': conta.nome,
@@ -260,26 +281,25 @@ class DFCService:
         }
     
     @staticmethod
-    def _calcular_fluxo_financiamento(periodo_inicial, periodo_final, versao_balancete, versao_plano_contas):
+    def _calcular_fluxo_financiamento(saldos_inicial, saldos_final, versao_plano_contas):
         """
         Calcula o fluxo de caixa das atividades de financiamento
         """
         financiamentos = []
         
         # Buscar contas do passivo não circulante e patrimônio líquido
-        contas_financ = PlanoContas.query.filter(
-            PlanoContas.versao == versao_plano_contas,
-            PlanoContas.ativo == True,
-            PlanoContas.elemento_conta.in_(['passivo', 'patrimonio_liquido'])
-        ).all()
+        contas_financ = [
+            conta for conta in PlanoContasCache.obter(versao_plano_contas).get_contas()
+            if conta.elemento_conta in ('passivo', 'patrimonio_liquido')
+        ]
         
         total_financiamento = 0
         for conta in contas_financ:
-            saldo_inicial = Balancete.get_saldo_por_conta(conta.codigo, periodo_inicial, versao_balancete)
-            saldo_final = Balancete.get_saldo_por_conta(conta.codigo, periodo_final, versao_balancete)
+            saldo_inicial = saldos_inicial.get_saldo(conta.codigo)
+            saldo_final = saldos_final.get_saldo(conta.codigo)
             variacao = saldo_final - saldo_inicial
             
-            if abs(variacao) > 0.01:
+            if variacao != 0:
                 # Classificar tipo de financiamento
                 tipo_financ = DFCService._classificar_financiamento(conta.nome)
                 
@@ -313,24 +333,21 @@ class DFCService:
             return 'outros'
     
     @staticmethod
-    def _obter_saldo_caixa(periodo, versao_balancete, versao_plano_contas):
+    def _obter_saldo_caixa(saldos, versao_plano_contas):
         """
         Obtém o saldo de caixa e equivalentes para um período
         """
-        contas_caixa = PlanoContas.query.filter(
-            PlanoContas.versao == versao_plano_contas,
-            PlanoContas.ativo == True,
-            PlanoContas.nome.ilike('%caixa%') | PlanoContas.nome.ilike('%banco%')
-        ).all()
+        contas_caixa = PlanoContasCache.obter(versao_plano_contas).get_contas_por_tag('caixa')
         
         total_caixa = 0
         for conta in contas_caixa:
-            saldo = Balancete.get_saldo_por_conta(conta.codigo, periodo, versao_balancete)
+            saldo = saldos.get_saldo(conta.codigo)
             total_caixa += saldo
         
         return total_caixa
     
     @staticmethod
+    @Instrumentacao.etapa('estrutura')
     def _estruturar_dfc_indireto(lucro_liquido, ajustes, variacoes_capital_giro, fluxo_operacional,
                                 fluxo_investimento, fluxo_financiamento, variacao_caixa,
                                 saldo_inicial_caixa, saldo_final_caixa):
@@ -466,7 +483,7 @@ class DFCService:
         return {'linhas': linhas}
     
     @staticmethod
-    def _gerar_dfc_direto(periodo_inicial, periodo_final, versao_balancete, versao_plano_contas):
+    def _gerar_dfc_direto(periodo_inicial, periodo_final, contexto):
         """
         Gera DFC pelo método direto (recebimentos e pagamentos)
         Implementação simplificada - pode ser expandida conforme necessário
@@ -477,6 +494,7 @@ class DFCService:
         }
     
     @staticmethod
+    @Roteamento.somente_leitura()
     def obter_dfc(periodo_inicial, periodo_final, versao_balancete='1.0'):
         """
         Obtém a DFC já gerada para um período
@@ -487,7 +505,7 @@ class DFCService:
         if demonstracao:
             return {
                 'success': True,
-                'data': json.loads(demonstracao.dados_json),
+                'data': demonstracao.get_dados(),
                 'data_geracao': demonstracao.data_geracao.isoformat()
             }
         else:
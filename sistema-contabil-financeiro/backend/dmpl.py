@@ -1,71 +1,43 @@
-from src.models.balancete import Balancete
-from src.models.plano_contas import PlanoContas
 from src.models.demonstracoes import DemonstracaoFinanceira
 from src.models.user import db
-import json
-from decimal import Decimal
+from src.models.centavos import converter_valores
+from src.models.roteamento import Roteamento
+from src.services.contexto_calculo import ContextoCalculo
+from src.services.instrumentacao import Instrumentacao
 
 class DMPLService:
     
     @staticmethod
-    def gerar_dmpl(periodo_inicial, periodo_final, versao_balancete='1.0', versao_plano_contas='1.0'):
+    @Instrumentacao.servico('gerar_dmpl')
+    def gerar_dmpl(periodo_inicial, periodo_final, versao_balancete='1.0', versao_plano_contas='1.0', contexto=None):
         """
         Gera a Demonstração das Mutações do Patrimônio Líquido (DMPL) 
         comparando dois períodos
         """
         try:
-            # Obter contas do patrimônio líquido
-            contas_pl = PlanoContas.get_contas_por_elemento('patrimonio_liquido', versao_plano_contas)
-            
-            # Estruturar colunas da DMPL
-            colunas = DMPLService._definir_colunas_dmpl(contas_pl)
-            
-            # Obter saldos iniciais
-            saldos_iniciais = DMPLService._obter_saldos_periodo(
-                periodo_inicial, contas_pl, versao_balancete
-            )
-            
-            # Obter saldos finais
-            saldos_finais = DMPLService._obter_saldos_periodo(
-                periodo_final, contas_pl, versao_balancete
-            )
+            contexto = contexto or ContextoCalculo(versao_balancete, versao_plano_contas)
+            periodo_chave = f"{periodo_inicial}_{periodo_final}"
             
-            # Calcular movimentações
-            movimentacoes = DMPLService._calcular_movimentacoes(
-                saldos_iniciais, saldos_finais, periodo_inicial, periodo_final, versao_balancete
-            )
+            # Reaproveitar a demonstração gravada se as entradas do cálculo não mudaram
+            assinatura = contexto.assinatura('DMPL', (periodo_inicial, periodo_final))
+            existente = DemonstracaoFinanceira.get_atualizada('DMPL', periodo_chave, contexto.versao_balancete, assinatura)
+            if existente:
+                return {
+                    'success': True,
+                    'data': existente.get_dados(),
+                    'reaproveitada': True,
+                    'message': 'DMPL sem alterações no balancete e no plano de contas; versão gravada reaproveitada'
+                }
             
-            # Estruturar dados da DMPL
-            dmpl_data = {
-                'periodo_inicial': periodo_inicial,
-                'periodo_final': periodo_final,
-                'colunas': colunas,
-                'saldos_iniciais': saldos_iniciais,
-                'movimentacoes': movimentacoes,
-                'saldos_finais': saldos_finais,
-                'estrutura_dmpl': DMPLService._estruturar_dmpl_completa(
-                    colunas, saldos_iniciais, movimentacoes, saldos_finais
-                )
-            }
+            resultado = DMPLService.calcular_dmpl(periodo_inicial, periodo_final, contexto)
+            dmpl_data = resultado['data']
             
             # Salvar demonstração no banco
-            periodo_chave = f"{periodo_inicial}_{periodo_final}"
-            demonstracao_existente = DemonstracaoFinanceira.get_demonstracao('DMPL', periodo_chave, versao_balancete)
-            
-            if demonstracao_existente:
-                demonstracao_existente.dados_json = json.dumps(dmpl_data)
-                demonstracao_existente.data_geracao = db.func.now()
-            else:
-                nova_demonstracao = DemonstracaoFinanceira(
-                    tipo_demonstracao='DMPL',
-                    periodo=periodo_chave,
-                    versao_balancete=versao_balancete,
-                    versao_plano_contas=versao_plano_contas,
-                    dados_json=json.dumps(dmpl_data)
+            with Instrumentacao.etapa('persistencia'):
+                DemonstracaoFinanceira.salvar(
+                    'DMPL', periodo_chave, contexto.versao_balancete, contexto.versao_plano_contas, dmpl_data, assinatura
                 )
-                db.session.add(nova_demonstracao)
-            
-            db.session.commit()
+                db.session.commit()
             
             return {
                 'success': True,
@@ -81,9 +53,62 @@ class DMPLService:
             }
     
     @staticmethod
-    def _definir_colunas_dmpl(contas_pl):
+    def calcular_dmpl(periodo_inicial, periodo_final, contexto):
+        """
+        Calcula a DMPL sem gravá-la, reaproveitando os saldos do contexto
+        """
+        return contexto.memorizar(
+            ('DMPL', periodo_inicial, periodo_final),
+            lambda: DMPLService._calcular_dmpl(periodo_inicial, periodo_final, contexto)
+        )
+    
+    @staticmethod
+    def _calcular_dmpl(periodo_inicial, periodo_final, contexto):
+        # Obter contas do patrimônio líquido
+        plano = contexto.plano()
+        contas_pl = plano.get_contas_por_elemento('patrimonio_liquido')
+        
+        # Estruturar colunas da DMPL
+        colunas = DMPLService._definir_colunas_dmpl(contas_pl, plano)
+        
+        # Obter saldos iniciais
+        saldos_iniciais = DMPLService._obter_saldos_periodo(
+            contexto.saldos(periodo_inicial), contas_pl
+        )
+        
+        # Obter saldos finais
+        saldos_finais = DMPLService._obter_saldos_periodo(
+            contexto.saldos(periodo_final), contas_pl
+        )
+        
+        # Calcular movimentações
+        movimentacoes = DMPLService._calcular_movimentacoes(
+            saldos_iniciais, saldos_finais, periodo_inicial, periodo_final, contexto.versao_balancete
+        )
+        
+        # Estruturar dados da DMPL (saldos e movimentações calculados em centavos;
+        # na estrutura, os valores ficam nas chaves com o código de cada coluna)
+        dmpl_data = {
+            'periodo_inicial': periodo_inicial,
+            'periodo_final': periodo_final,
+            'colunas': colunas,
+            'saldos_iniciais': converter_valores(saldos_iniciais),
+            'movimentacoes': converter_valores(movimentacoes),
+            'saldos_finais': converter_valores(saldos_finais),
+            'estrutura_dmpl': converter_valores(
+                DMPLService._estruturar_dmpl_completa(colunas, saldos_iniciais, movimentacoes, saldos_finais),
+                chaves={coluna['codigo'] for coluna in colunas}
+            )
+        }
+        
+        return {'success': True, 'data': dmpl_data}
+    
+    @staticmethod
+    @Instrumentacao.etapa('consolidacao')
+    def _definir_colunas_dmpl(contas_pl, plano):
         """
-        Define as colunas da DMPL baseadas nas contas do patrimônio líquido
+        Define as colunas da DMPL baseadas nas contas do patrimônio líquido,
+        usando as tags dmpl_<coluna> persistidas no plano de contas
         """
         colunas = []
         
@@ -99,9 +124,10 @@ class DMPLService:
         
         # Mapear contas do plano para as colunas
         for coluna in colunas_padrao:
+            codigos_coluna = {conta.codigo for conta in plano.get_contas_por_tag(f"dmpl_{coluna['codigo']}")}
             contas_relacionadas = []
             for conta in contas_pl:
-                if DMPLService._mapear_conta_para_coluna(conta.nome, coluna['codigo']):
+                if conta.codigo in codigos_coluna:
                     contas_relacionadas.append({
                         'codigo': conta.codigo,
                         'nome': conta.nome
@@ -116,35 +142,15 @@ class DMPLService:
         return colunas
     
     @staticmethod
-    def _mapear_conta_para_coluna(nome_conta, codigo_coluna):
-        """
-        Mapeia uma conta do plano para uma coluna da DMPL
-        """
-        nome_lower = nome_conta.lower()
-        
-        mapeamentos = {
-            'capital_social': ['capital', 'social'],
-            'reservas_capital': ['reserva', 'capital', 'ágio', 'agio'],
-            'reservas_lucros': ['reserva', 'lucro', 'legal', 'estatutária'],
-            'lucros_acumulados': ['lucro', 'acumulado', 'prejuízo'],
-            'ajustes_avaliacao': ['ajuste', 'avaliação', 'patrimonial']
-        }
-        
-        if codigo_coluna in mapeamentos:
-            palavras_chave = mapeamentos[codigo_coluna]
-            return any(palavra in nome_lower for palavra in palavras_chave)
-        
-        return False
-    
-    @staticmethod
-    def _obter_saldos_periodo(periodo, contas_pl, versao_balancete):
+    @Instrumentacao.etapa('consolidacao')
+    def _obter_saldos_periodo(saldos_periodo, contas_pl):
         """
-        Obtém os saldos das contas do PL para um período específico
+        Obtém os saldos das contas do PL (em centavos) para um período específico
         """
         saldos = {}
         
         for conta in contas_pl:
-            saldo = Balancete.get_saldo_por_conta(conta.codigo, periodo, versao_balancete)
+            saldo = saldos_periodo.get_saldo(conta.codigo)
             saldos[conta.codigo] = {
                 'codigo': conta.codigo,
                 'nome': conta.nome,
@@ -154,6 +160,7 @@ class DMPLService:
         return saldos
     
     @staticmethod
+    @Instrumentacao.etapa('consolidacao')
     def _calcular_movimentacoes(saldos_iniciais, saldos_finais, periodo_inicial, periodo_final, versao_balancete):
         """
         Calcula as movimentações entre os períodos
@@ -175,7 +182,7 @@ class DMPLService:
                 saldo_final = saldos_finais[codigo_conta]['saldo']
                 variacao = saldo_final - saldo_inicial
                 
-                if abs(variacao) > 0.01:  # Só considerar variações significativas
+                if variacao != 0:
                     # Classificar o tipo de movimentação baseado no nome da conta
                     tipo_movimentacao = DMPLService._classificar_movimentacao(
                         saldos_iniciais[codigo_conta]['nome'], variacao
@@ -206,6 +213,7 @@ class DMPLService:
             return 'outras_movimentacoes'
     
     @staticmethod
+    @Instrumentacao.etapa('estrutura')
     def _estruturar_dmpl_completa(colunas, saldos_iniciais, movimentacoes, saldos_finais):
         """
         Estrutura a DMPL no formato de tabela
@@ -273,6 +281,7 @@ class DMPLService:
         return {'linhas': linhas}
     
     @staticmethod
+    @Roteamento.somente_leitura()
     def obter_dmpl(periodo_inicial, periodo_final, versao_balancete='1.0'):
         """
         Obtém a DMPL já gerada para um período
@@ -283,7 +292,7 @@ class DMPLService:
         if demonstracao:
             return {
                 'success': True,
-                'data': json.loads(demonstracao.dados_json),
+                'data': demonstracao.get_dados(),
                 'data_geracao': demonstracao.data_geracao.isoformat()
             }
         else:
@@ -1,69 +1,47 @@
-from src.models.balancete import Balancete
-from src.models.plano_contas import PlanoContas
 from src.models.demonstracoes import DemonstracaoFinanceira
 from src.models.user import db
+from src.models.centavos import converter_valores, para_reais
+from src.models.roteamento import Roteamento
 from src.services.dre import DREService
-import json
-from decimal import Decimal
+from src.services.contexto_calculo import ContextoCalculo
+from src.services.plano_contas_cache import PlanoContasCache
+from src.services.instrumentacao import Instrumentacao
 
 class DRAService:
     
     @staticmethod
-    def gerar_dra(periodo, versao_balancete='1.0', versao_plano_contas='1.0'):
+    @Instrumentacao.servico('gerar_dra')
+    def gerar_dra(periodo, versao_balancete='1.0', versao_plano_contas='1.0', contexto=None):
         """
         Gera a Demonstração do Resultado Abrangente (DRA) para um período específico
         A DRA inclui o resultado líquido da DRE mais outros resultados abrangentes
         """
         try:
-            # Primeiro, obter os dados da DRE
-            dre_resultado = DREService.gerar_dre(periodo, versao_balancete, versao_plano_contas)
+            contexto = contexto or ContextoCalculo(versao_balancete, versao_plano_contas)
             
-            if not dre_resultado['success']:
+            # Reaproveitar a demonstração gravada se as entradas do cálculo não mudaram
+            assinatura = contexto.assinatura('DRA', (periodo,))
+            existente = DemonstracaoFinanceira.get_atualizada('DRA', periodo, contexto.versao_balancete, assinatura)
+            if existente:
                 return {
-                    'success': False,
-                    'message': f'Erro ao gerar DRE para DRA: {dre_resultado["message"]}'
+                    'success': True,
+                    'data': existente.get_dados(),
+                    'reaproveitada': True,
+                    'message': 'DRA sem alterações no balancete e no plano de contas; versão gravada reaproveitada'
                 }
             
-            lucro_liquido = dre_resultado['data']['indicadores']['lucro_liquido']
+            resultado = DRAService.calcular_dra(periodo, contexto)
+            if not resultado['success']:
+                return resultado
             
-            # Obter outros resultados abrangentes
-            outros_resultados = DRAService._obter_outros_resultados_abrangentes(
-                periodo, versao_balancete, versao_plano_contas
-            )
-            
-            # Calcular resultado abrangente total
-            total_outros_resultados = sum(item['valor'] for item in outros_resultados)
-            resultado_abrangente_total = lucro_liquido + total_outros_resultados
-            
-            # Estruturar dados da DRA
-            dra_data = {
-                'lucro_liquido': lucro_liquido,
-                'outros_resultados_abrangentes': outros_resultados,
-                'total_outros_resultados': total_outros_resultados,
-                'resultado_abrangente_total': resultado_abrangente_total,
-                'estrutura_dra': DRAService._estruturar_dra_completa(
-                    lucro_liquido, outros_resultados, total_outros_resultados, resultado_abrangente_total
-                ),
-                'dre_base': dre_resultado['data']  # Incluir dados da DRE para referência
-            }
+            dra_data = resultado['data']
             
             # Salvar demonstração no banco
-            demonstracao_existente = DemonstracaoFinanceira.get_demonstracao('DRA', periodo, versao_balancete)
-            
-            if demonstracao_existente:
-                demonstracao_existente.dados_json = json.dumps(dra_data)
-                demonstracao_existente.data_geracao = db.func.now()
-            else:
-                nova_demonstracao = DemonstracaoFinanceira(
-                    tipo_demonstracao='DRA',
-                    periodo=periodo,
-                    versao_balancete=versao_balancete,
-                    versao_plano_contas=versao_plano_contas,
-                    dados_json=json.dumps(dra_data)
+            with Instrumentacao.etapa('persistencia'):
+                DemonstracaoFinanceira.salvar(
+                    'DRA', periodo, contexto.versao_balancete, contexto.versao_plano_contas, dra_data, assinatura
                 )
-                db.session.add(nova_demonstracao)
-            
-            db.session.commit()
+                db.session.commit()
             
             return {
                 'success': True,
@@ -79,24 +57,66 @@ class DRAService:
             }
     
     @staticmethod
-    def _obter_outros_resultados_abrangentes(periodo, versao_balancete, versao_plano_contas):
+    def calcular_dra(periodo, contexto):
+        """
+        Calcula a DRA do período sem gravá-la, reaproveitando a DRE do contexto
+        """
+        return contexto.memorizar(('DRA', periodo), lambda: DRAService._calcular_dra(periodo, contexto))
+    
+    @staticmethod
+    def _calcular_dra(periodo, contexto):
+        # Primeiro, obter os dados da DRE
+        dre_resultado = DREService.calcular_dre(periodo, contexto)
+        
+        if not dre_resultado['success']:
+            return {
+                'success': False,
+                'message': f'Erro ao gerar DRE para DRA: {dre_resultado["message"]}'
+            }
+        
+        lucro_liquido = dre_resultado['centavos']['lucro_liquido']
+        
+        # Obter outros resultados abrangentes
+        outros_resultados = DRAService._obter_outros_resultados_abrangentes(
+            contexto.saldos(periodo), contexto.versao_plano_contas
+        )
+        
+        # Calcular resultado abrangente total (em centavos)
+        total_outros_resultados = sum(item['valor'] for item in outros_resultados)
+        resultado_abrangente_total = lucro_liquido + total_outros_resultados
+        
+        # Estruturar dados da DRA (valores convertidos para reais)
+        dra_data = {
+            'lucro_liquido': para_reais(lucro_liquido),
+            'outros_resultados_abrangentes': converter_valores(outros_resultados),
+            'total_outros_resultados': para_reais(total_outros_resultados),
+            'resultado_abrangente_total': para_reais(resultado_abrangente_total),
+            'estrutura_dra': converter_valores(DRAService._estruturar_dra_completa(
+                lucro_liquido, outros_resultados, total_outros_resultados, resultado_abrangente_total
+            )),
+            'dre_base': dre_resultado['data']  # Incluir dados da DRE para referência
+        }
+        
+        return {'success': True, 'data': dra_data}
+    
+    @staticmethod
+    @Instrumentacao.etapa('consolidacao')
+    def _obter_outros_resultados_abrangentes(saldos, versao_plano_contas):
         """
         Obtém outros resultados abrangentes que não passam pelo resultado
-        Exemplos: ajustes de conversão, ganhos/perdas atuariais, etc.
+        Exemplos: ajustes de conversão, ganhos/perdas atuariais, etc. Valores em centavos.
         """
         outros_resultados = []
         
+        plano = PlanoContasCache.obter(versao_plano_contas)
+        
         # Buscar contas específicas de outros resultados abrangentes
-        # Estas contas devem estar marcadas no plano de contas como tal
-        contas_ora = PlanoContas.query.filter(
-            PlanoContas.versao == versao_plano_contas,
-            PlanoContas.ativo == True,
-            PlanoContas.nome.ilike('%ajuste%conversão%')  # Exemplo de busca
-        ).all()
+        # (marcadas no plano de contas pela classificação persistida)
+        contas_ora = plano.get_contas_por_tag('ajuste_conversao')
         
         for conta in contas_ora:
-            saldo = Balancete.get_saldo_por_conta(conta.codigo, periodo, versao_balancete)
-            if abs(saldo) > 0.01:
+            saldo = saldos.get_saldo(conta.codigo)
+            if saldo != 0:
                 outros_resultados.append({
                     'codigo': conta.codigo,
                     'descricao': conta.nome,
@@ -105,15 +125,11 @@ class DRAService:
                 })
         
         # Buscar ajustes de avaliação patrimonial
-        contas_avaliacao = PlanoContas.query.filter(
-            PlanoContas.versao == versao_plano_contas,
-            PlanoContas.ativo == True,
-            PlanoContas.nome.ilike('%ajuste%avaliação%')
-        ).all()
+        contas_avaliacao = plano.get_contas_por_tag('ajuste_avaliacao')
         
         for conta in contas_avaliacao:
-            saldo = Balancete.get_saldo_por_conta(conta.codigo, periodo, versao_balancete)
-            if abs(saldo) > 0.01:
+            saldo = saldos.get_saldo(conta.codigo)
+            if saldo != 0:
                 outros_resultados.append({
                     'codigo': conta.codigo,
                     'descricao': conta.nome,
@@ -126,13 +142,14 @@ class DRAService:
             outros_resultados.append({
                 'codigo': 'N/A',
                 'descricao': 'Não há outros resultados abrangentes no período',
-                'valor': 0.0,
+                'valor': 0,
                 'tipo': 'nenhum'
             })
         
         return outros_resultados
     
     @staticmethod
+    @Instrumentacao.etapa('estrutura')
     def _estruturar_dra_completa(lucro_liquido, outros_resultados, total_outros_resultados, resultado_abrangente_total):
         """
         Estrutura a DRA no formato padrão
@@ -183,6 +200,7 @@ class DRAService:
         return {'linhas': linhas}
     
     @staticmethod
+    @Roteamento.somente_leitura()
     def obter_dra(periodo, versao_balancete='1.0'):
         """
         Obtém a DRA já gerada para um período
@@ -192,7 +210,7 @@ class DRAService:
         if demonstracao:
             return {
                 'success': True,
-                'data': json.loads(demonstracao.dados_json),
+                'data': demonstracao.get_dados(),
                 'data_geracao': demonstracao.data_geracao.isoformat()
             }
         else:
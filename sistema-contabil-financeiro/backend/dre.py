@@ -1,81 +1,42 @@
-from src.models.balancete import Balancete
-from src.models.plano_contas import PlanoContas
 from src.models.demonstracoes import DemonstracaoFinanceira
 from src.models.user import db
-import json
-from decimal import Decimal
+from src.models.centavos import converter_valores, para_reais
+from src.models.roteamento import Roteamento
+from src.services.contexto_calculo import ContextoCalculo
+from src.services.plano_contas_cache import PlanoContasCache
+from src.services.instrumentacao import Instrumentacao
 
 class DREService:
     
     @staticmethod
-    def gerar_dre(periodo, versao_balancete='1.0', versao_plano_contas='1.0'):
+    @Instrumentacao.servico('gerar_dre')
+    def gerar_dre(periodo, versao_balancete='1.0', versao_plano_contas='1.0', contexto=None):
         """
         Gera a Demonstração do Resultado do Exercício (DRE) para um período específico
         """
         try:
-            # Obter receitas
-            receitas = DREService._obter_grupo_contas('receita', periodo, versao_balancete, versao_plano_contas)
+            contexto = contexto or ContextoCalculo(versao_balancete, versao_plano_contas)
             
-            # Obter custos
-            custos = DREService._obter_grupo_contas('custo', periodo, versao_balancete, versao_plano_contas)
-            
-            # Obter despesas
-            despesas = DREService._obter_grupo_contas('despesa', periodo, versao_balancete, versao_plano_contas)
-            
-            # Calcular totais
-            total_receitas = DREService._calcular_total_grupo(receitas)
-            total_custos = DREService._calcular_total_grupo(custos)
-            total_despesas = DREService._calcular_total_grupo(despesas)
-            
-            # Calcular indicadores da DRE
-            receita_bruta = total_receitas
-            lucro_bruto = receita_bruta - total_custos
-            lucro_operacional = lucro_bruto - total_despesas
-            lucro_liquido = lucro_operacional  # Simplificado - sem impostos/participações
+            # Reaproveitar a demonstração gravada se as entradas do cálculo não mudaram
+            assinatura = contexto.assinatura('DRE', (periodo,))
+            existente = DemonstracaoFinanceira.get_atualizada('DRE', periodo, contexto.versao_balancete, assinatura)
+            if existente:
+                return {
+                    'success': True,
+                    'data': existente.get_dados(),
+                    'reaproveitada': True,
+                    'message': 'DRE sem alterações no balancete e no plano de contas; versão gravada reaproveitada'
+                }
             
-            # Estruturar dados da DRE
-            dre_data = {
-                'receitas': {
-                    'grupos': receitas,
-                    'total': float(total_receitas)
-                },
-                'custos': {
-                    'grupos': custos,
-                    'total': float(total_custos)
-                },
-                'despesas': {
-                    'grupos': despesas,
-                    'total': float(total_despesas)
-                },
-                'indicadores': {
-                    'receita_bruta': float(receita_bruta),
-                    'lucro_bruto': float(lucro_bruto),
-                    'lucro_operacional': float(lucro_operacional),
-                    'lucro_liquido': float(lucro_liquido)
-                },
-                'estrutura_dre': DREService._estruturar_dre_completa(
-                    receitas, custos, despesas, 
-                    receita_bruta, lucro_bruto, lucro_operacional, lucro_liquido
-                )
-            }
+            resultado = DREService.calcular_dre(periodo, contexto)
+            dre_data = resultado['data']
             
             # Salvar demonstração no banco
-            demonstracao_existente = DemonstracaoFinanceira.get_demonstracao('DRE', periodo, versao_balancete)
-            
-            if demonstracao_existente:
-                demonstracao_existente.dados_json = json.dumps(dre_data)
-                demonstracao_existente.data_geracao = db.func.now()
-            else:
-                nova_demonstracao = DemonstracaoFinanceira(
-                    tipo_demonstracao='DRE',
-                    periodo=periodo,
-                    versao_balancete=versao_balancete,
-                    versao_plano_contas=versao_plano_contas,
-                    dados_json=json.dumps(dre_data)
+            with Instrumentacao.etapa('persistencia'):
+                DemonstracaoFinanceira.salvar(
+                    'DRE', periodo, contexto.versao_balancete, contexto.versao_plano_contas, dre_data, assinatura
                 )
-                db.session.add(nova_demonstracao)
-            
-            db.session.commit()
+                db.session.commit()
             
             return {
                 'success': True,
@@ -91,19 +52,101 @@ class DREService:
             }
     
     @staticmethod
-    def _obter_grupo_contas(elemento_conta, periodo, versao_balancete, versao_plano_contas):
+    def calcular_dre(periodo, contexto):
         """
-        Obtém as contas de um elemento específico (receita, custo, despesa)
+        Calcula a DRE do período sem gravá-la. O resultado fica memorizado no
+        contexto e é reaproveitado por DRA, DVA e DFC.
+        """
+        return contexto.memorizar(('DRE', periodo), lambda: DREService._calcular_dre(periodo, contexto))
+    
+    @staticmethod
+    def _calcular_dre(periodo, contexto):
+        saldos = contexto.saldos(periodo)
+        versao_plano_contas = contexto.versao_plano_contas
+        
+        # Obter receitas
+        receitas = DREService._obter_grupo_contas('receita', saldos, versao_plano_contas)
+        
+        # Obter custos
+        custos = DREService._obter_grupo_contas('custo', saldos, versao_plano_contas)
+        
+        # Obter despesas
+        despesas = DREService._obter_grupo_contas('despesa', saldos, versao_plano_contas)
+        
+        return DREService._montar_dre(receitas, custos, despesas)
+    
+    @staticmethod
+    @Instrumentacao.etapa('estrutura')
+    def _montar_dre(receitas, custos, despesas):
+        """
+        Monta os dados da DRE (totais, indicadores e estrutura) a partir dos grupos
+        de receitas, custos e despesas, com saldos em centavos. Os valores são
+        convertidos para reais apenas nos dados retornados; o resultado também
+        traz os indicadores em centavos, usados por DRA, DVA e DFC.
+        """
+        # Calcular totais
+        total_receitas = DREService._calcular_total_grupo(receitas)
+        total_custos = DREService._calcular_total_grupo(custos)
+        total_despesas = DREService._calcular_total_grupo(despesas)
+        
+        # Calcular indicadores da DRE
+        receita_bruta = total_receitas
+        lucro_bruto = receita_bruta - total_custos
+        lucro_operacional = lucro_bruto - total_despesas
+        lucro_liquido = lucro_operacional  # Simplificado - sem impostos/participações
+        
+        indicadores = {
+            'receita_bruta': receita_bruta,
+            'lucro_bruto': lucro_bruto,
+            'lucro_operacional': lucro_operacional,
+            'lucro_liquido': lucro_liquido
+        }
+        
+        # Grupos com os saldos em reais para exibição
+        receitas = converter_valores(receitas)
+        custos = converter_valores(custos)
+        despesas = converter_valores(despesas)
+        
+        # Estruturar dados da DRE
+        dre_data = {
+            'receitas': {
+                'grupos': receitas,
+                'total': para_reais(total_receitas)
+            },
+            'custos': {
+                'grupos': custos,
+                'total': para_reais(total_custos)
+            },
+            'despesas': {
+                'grupos': despesas,
+                'total': para_reais(total_despesas)
+            },
+            'indicadores': {nome: para_reais(valor) for nome, valor in indicadores.items()},
+            'estrutura_dre': DREService._estruturar_dre_completa(
+                receitas, custos, despesas, 
+                receita_bruta, lucro_bruto, total_despesas, lucro_operacional, lucro_liquido
+            )
+        }
+        
+        return {'success': True, 'data': dre_data, 'centavos': indicadores}
+    
+    @staticmethod
+    @Instrumentacao.etapa('consolidacao')
+    def _obter_grupo_contas(elemento_conta, saldos, versao_plano_contas):
+        """
+        Obtém as contas de um elemento específico (receita, custo, despesa),
+        com os saldos em centavos
         """
         # Obter contas do plano de contas para o elemento
-        contas_plano = PlanoContas.get_contas_por_elemento(elemento_conta, versao_plano_contas)
+        plano = PlanoContasCache.obter(versao_plano_contas)
+        contas_plano = plano.get_contas_por_elemento(elemento_conta)
         
         # Organizar por níveis hierárquicos
         grupos = {}
         
         for conta in contas_plano:
             # Obter saldo da conta no balancete
-            saldo = Balancete.get_saldo_por_conta(conta.codigo, periodo, versao_balancete)
+            saldo = saldos.get_saldo(conta.codigo)
             
             # Para contas de resultado, considerar o valor absoluto se necessário
             # Receitas normalmente têm saldo credor (negativo no balancete)
@@ -112,7 +155,7 @@ class DREService:
                 saldo = abs(saldo)  # Converter para positivo para exibição
             
             # Pular contas com saldo zero
-            if abs(saldo) < 0.01:
+            if saldo == 0:
                 continue
             
             # Organizar hierarquicamente
@@ -121,18 +164,26 @@ class DREService:
                     grupos[conta.codigo] = {
                         'codigo': conta.codigo,
                         'nome': conta.nome,
-                        'saldo': 0.0,
+                        'saldo': 0,
                         'subgrupos': {}
                     }
                 grupos[conta.codigo]['saldo'] += saldo
+                continue
+            
+            # Ancestrais da conta (raiz -> pai imediato), resolvidos no plano em cache
+            ancestrais = conta.get_codigos_ancestrais()
             
-            elif conta.nivel == 2 and conta.conta_pai:
-                pai_codigo = conta.conta_pai.codigo
+            if conta.nivel == 2 and ancestrais:
+                conta_pai = plano.get_by_codigo(ancestrais[-1])
+                if not conta_pai:
+                    continue
+                
+                pai_codigo = conta_pai.codigo
                 if pai_codigo not in grupos:
                     grupos[pai_codigo] = {
                         'codigo': pai_codigo,
-                        'nome': conta.conta_pai.nome,
-                        'saldo': 0.0,
+                        'nome': conta_pai.nome,
+                        'saldo': 0,
                         'subgrupos': {}
                     }
                 
@@ -140,76 +191,70 @@ class DREService:
                     grupos[pai_codigo]['subgrupos'][conta.codigo] = {
                         'codigo': conta.codigo,
                         'nome': conta.nome,
-                        'saldo': 0.0,
+                        'saldo': 0,
                         'contas': {}
                     }
                 grupos[pai_codigo]['subgrupos'][conta.codigo]['saldo'] += saldo
                 grupos[pai_codigo]['saldo'] += saldo
             
             # Para contas analíticas (níveis 3, 4, 5)
-            elif conta.eh_analitica:
-                # Encontrar o grupo pai (nível 1 ou 2)
-                conta_atual = conta
-                while conta_atual.conta_pai and conta_atual.conta_pai.nivel > 2:
-                    conta_atual = conta_atual.conta_pai
+            elif conta.eh_analitica and len(ancestrais) >= 2:
+                # Grupo (nível 1) e subgrupo (nível 2) da conta
+                pai_nivel1 = plano.get_by_codigo(ancestrais[0])
+                pai_nivel2 = plano.get_by_codigo(ancestrais[1])
+                if not pai_nivel1 or not pai_nivel2:
+                    continue
+                
+                # Garantir estrutura do grupo nível 1
+                if pai_nivel1.codigo not in grupos:
+                    grupos[pai_nivel1.codigo] = {
+                        'codigo': pai_nivel1.codigo,
+                        'nome': pai_nivel1.nome,
+                        'saldo': 0,
+                        'subgrupos': {}
+                    }
+                
+                # Garantir estrutura do subgrupo nível 2
+                if pai_nivel2.codigo not in grupos[pai_nivel1.codigo]['subgrupos']:
+                    grupos[pai_nivel1.codigo]['subgrupos'][pai_nivel2.codigo] = {
+                        'codigo': pai_nivel2.codigo,
+                        'nome': pai_nivel2.nome,
+                        'saldo': 0,
+                        'contas': {}
+                    }
+                
+                # Adicionar conta analítica
+                grupos[pai_nivel1.codigo]['subgrupos'][pai_nivel2.codigo]['contas'][conta.codigo] = {
+                    'codigo': conta.codigo,
+                    'nome': conta.nome,
+                    'saldo': saldo
+                }
                 
-                if conta_atual.conta_pai:
-                    pai_nivel2 = conta_atual.conta_pai
-                    if pai_nivel2.conta_pai:
-                        pai_nivel1 = pai_nivel2.conta_pai
-                        
-                        # Garantir estrutura do grupo nível 1
-                        if pai_nivel1.codigo not in grupos:
-                            grupos[pai_nivel1.codigo] = {
-                                'codigo': pai_nivel1.codigo,
-                                'nome': pai_nivel1.nome,
-                                'saldo': 0.0,
-                                'subgrupos': {}
-                            }
-                        
-                        # Garantir estrutura do subgrupo nível 2
-                        if pai_nivel2.codigo not in grupos[pai_nivel1.codigo]['subgrupos']:
-                            grupos[pai_nivel1.codigo]['subgrupos'][pai_nivel2.codigo] = {
-                                'codigo': pai_nivel2.codigo,
-                                'nome': pai_nivel2.nome,
-                                'saldo': 0.0,
-                                'contas': {}
-                            }
-                        
-                        # Adicionar conta analítica
-                        grupos[pai_nivel1.codigo]['subgrupos'][pai_nivel2.codigo]['contas'][conta.codigo] = {
-                            'codigo': conta.codigo,
-                            'nome': conta.nome,
-                            'saldo': saldo
-                        }
-                        
-                        # Atualizar saldos dos pais
-                        grupos[pai_nivel1.codigo]['subgrupos'][pai_nivel2.codigo]['saldo'] += saldo
-                        grupos[pai_nivel1.codigo]['saldo'] += saldo
+                # Atualizar saldos dos pais
+                grupos[pai_nivel1.codigo]['subgrupos'][pai_nivel2.codigo]['saldo'] += saldo
+                grupos[pai_nivel1.codigo]['saldo'] += saldo
         
         return list(grupos.values())
     
     @staticmethod
     def _calcular_total_grupo(grupos):
         """
-        Calcula o total de um grupo de contas
+        Calcula o total de um grupo de contas (em centavos)
         """
-        total = Decimal('0.00')
-        for grupo in grupos:
-            total += Decimal(str(grupo['saldo']))
-        return total
+        return sum(grupo['saldo'] for grupo in grupos)
     
     @staticmethod
-    def _estruturar_dre_completa(receitas, custos, despesas, receita_bruta, lucro_bruto, lucro_operacional, lucro_liquido):
+    def _estruturar_dre_completa(receitas, custos, despesas, receita_bruta, lucro_bruto, total_despesas, lucro_operacional, lucro_liquido):
         """
-        Estrutura a DRE no formato tradicional
+        Estrutura a DRE no formato tradicional (grupos já em reais; totais e
+        indicadores em centavos)
         """
         return {
             'linhas': [
                 {
                     'tipo': 'titulo',
                     'descricao': 'RECEITA BRUTA',
-                    'valor': float(receita_bruta),
+                    'valor': para_reais(receita_bruta),
                     'nivel': 1
                 },
                 {
@@ -221,7 +266,7 @@ class DREService:
                 {
                     'tipo': 'subtotal',
                     'descricao': '(-) CUSTOS DOS PRODUTOS/SERVIÇOS VENDIDOS',
-                    'valor': float(-custos[0]['saldo']) if custos else 0.0,
+                    'valor': -custos[0]['saldo'] if custos else 0.0,
                     'nivel': 1
                 },
                 {
@@ -233,13 +278,13 @@ class DREService:
                 {
                     'tipo': 'resultado',
                     'descricao': 'LUCRO BRUTO',
-                    'valor': float(lucro_bruto),
+                    'valor': para_reais(lucro_bruto),
                     'nivel': 1
                 },
                 {
                     'tipo': 'subtotal',
                     'descricao': '(-) DESPESAS OPERACIONAIS',
-                    'valor': float(-sum(grupo['saldo'] for grupo in despesas)),
+                    'valor': para_reais(-total_despesas),
                     'nivel': 1
                 },
                 {
@@ -251,19 +296,20 @@ class DREService:
                 {
                     'tipo': 'resultado',
                     'descricao': 'LUCRO OPERACIONAL',
-                    'valor': float(lucro_operacional),
+                    'valor': para_reais(lucro_operacional),
                     'nivel': 1
                 },
                 {
                     'tipo': 'resultado_final',
                     'descricao': 'LUCRO LÍQUIDO DO EXERCÍCIO',
-                    'valor': float(lucro_liquido),
+                    'valor': para_reais(lucro_liquido),
                     'nivel': 1
                 }
             ]
         }
     
     @staticmethod
+    @Roteamento.somente_leitura()
     def obter_dre(periodo, versao_balancete='1.0'):
         """
         Obtém a DRE já gerada para um período
@@ -273,7 +319,7 @@ class DREService:
         if demonstracao:
             return {
                 'success': True,
-                'data': json.loads(demonstracao.dados_json),
+                'data': demonstracao.get_dados(),
                 'data_geracao': demonstracao.data_geracao.isoformat()
             }
         else:
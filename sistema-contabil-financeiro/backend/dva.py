@@ -1,89 +1,46 @@
-from src.models.balancete import Balancete
-from src.models.plano_contas import PlanoContas
 from src.models.demonstracoes import DemonstracaoFinanceira
 from src.models.user import db
+from src.models.centavos import converter_valores, para_reais
+from src.models.roteamento import Roteamento
 from src.services.dre import DREService
-import json
-from decimal import Decimal
+from src.services.contexto_calculo import ContextoCalculo
+from src.services.plano_contas_cache import PlanoContasCache
+from src.services.instrumentacao import Instrumentacao
 
 class DVAService:
     
     @staticmethod
-    def gerar_dva(periodo, versao_balancete='1.0', versao_plano_contas='1.0'):
+    @Instrumentacao.servico('gerar_dva')
+    def gerar_dva(periodo, versao_balancete='1.0', versao_plano_contas='1.0', contexto=None):
         """
         Gera a Demonstração do Valor Adicionado (DVA) para um período específico
         """
         try:
-            # Obter dados da DRE para base de cálculo
-            dre_resultado = DREService.gerar_dre(periodo, versao_balancete, versao_plano_contas)
-            if not dre_resultado['success']:
+            contexto = contexto or ContextoCalculo(versao_balancete, versao_plano_contas)
+            
+            # Reaproveitar a demonstração gravada se as entradas do cálculo não mudaram
+            assinatura = contexto.assinatura('DVA', (periodo,))
+            existente = DemonstracaoFinanceira.get_atualizada('DVA', periodo, contexto.versao_balancete, assinatura)
+            if existente:
                 return {
-                    'success': False,
-                    'message': f'Erro ao obter DRE para DVA: {dre_resultado["message"]}'
+                    'success': True,
+                    'data': existente.get_dados(),
+                    'reaproveitada': True,
+                    'message': 'DVA sem alterações no balancete e no plano de contas; versão gravada reaproveitada'
                 }
             
-            # 1. GERAÇÃO DO VALOR ADICIONADO
-            receitas = DVAService._obter_receitas_dva(periodo, versao_balancete, versao_plano_contas)
-            insumos_adquiridos = DVAService._obter_insumos_adquiridos(periodo, versao_balancete, versao_plano_contas)
-            valor_adicionado_bruto = receitas['total'] - insumos_adquiridos['total']
-            
-            # Depreciação, amortização e exaustão
-            depreciacoes = DVAService._obter_depreciacoes(periodo, versao_balancete, versao_plano_contas)
-            valor_adicionado_liquido = valor_adicionado_bruto - depreciacoes['total']
-            
-            # Valor adicionado recebido em transferência
-            transferencias = DVAService._obter_transferencias_recebidas(periodo, versao_balancete, versao_plano_contas)
-            valor_adicionado_total = valor_adicionado_liquido + transferencias['total']
+            resultado = DVAService.calcular_dva(periodo, contexto)
+            if not resultado['success']:
+                return resultado
             
-            # 2. DISTRIBUIÇÃO DO VALOR ADICIONADO
-            distribuicao = DVAService._calcular_distribuicao_valor_adicionado(
-                periodo, versao_balancete, versao_plano_contas, dre_resultado['data']
-            )
-            
-            # Verificar se a distribuição está balanceada
-            total_distribuido = sum(item['valor'] for item in distribuicao.values())
-            diferenca = abs(valor_adicionado_total - total_distribuido)
-            
-            # Estruturar dados da DVA
-            dva_data = {
-                'periodo': periodo,
-                'geracao_valor_adicionado': {
-                    'receitas': receitas,
-                    'insumos_adquiridos': insumos_adquiridos,
-                    'valor_adicionado_bruto': valor_adicionado_bruto,
-                    'depreciacoes': depreciacoes,
-                    'valor_adicionado_liquido': valor_adicionado_liquido,
-                    'transferencias': transferencias,
-                    'valor_adicionado_total': valor_adicionado_total
-                },
-                'distribuicao_valor_adicionado': distribuicao,
-                'total_distribuido': total_distribuido,
-                'diferenca_balanceamento': diferenca,
-                'balanceado': diferenca < 0.01,
-                'estrutura_dva': DVAService._estruturar_dva_completa(
-                    receitas, insumos_adquiridos, valor_adicionado_bruto,
-                    depreciacoes, valor_adicionado_liquido, transferencias,
-                    valor_adicionado_total, distribuicao
-                )
-            }
+            dva_data = resultado['data']
             
             # Salvar demonstração no banco
-            demonstracao_existente = DemonstracaoFinanceira.get_demonstracao('DVA', periodo, versao_balancete)
-            
-            if demonstracao_existente:
-                demonstracao_existente.dados_json = json.dumps(dva_data)
-                demonstracao_existente.data_geracao = db.func.now()
-            else:
-                nova_demonstracao = DemonstracaoFinanceira(
-                    tipo_demonstracao='DVA',
-                    periodo=periodo,
-                    versao_balancete=versao_balancete,
-                    versao_plano_contas=versao_plano_contas,
-                    dados_json=json.dumps(dva_data)
+            with Instrumentacao.etapa('persistencia'):
+                DemonstracaoFinanceira.salvar(
+                    'DVA', periodo, contexto.versao_balancete, contexto.versao_plano_contas, dva_data, assinatura
                 )
-                db.session.add(nova_demonstracao)
-            
-            db.session.commit()
+                db.session.commit()
             
             return {
                 'success': True,
@@ -99,7 +56,78 @@ class DVAService:
             }
     
     @staticmethod
-    def _obter_receitas_dva(periodo, versao_balancete, versao_plano_contas):
+    def calcular_dva(periodo, contexto):
+        """
+        Calcula a DVA do período sem gravá-la, reaproveitando a DRE do contexto
+        """
+        return contexto.memorizar(('DVA', periodo), lambda: DVAService._calcular_dva(periodo, contexto))
+    
+    @staticmethod
+    def _calcular_dva(periodo, contexto):
+        # Obter dados da DRE para base de cálculo
+        dre_resultado = DREService.calcular_dre(periodo, contexto)
+        if not dre_resultado['success']:
+            return {
+                'success': False,
+                'message': f'Erro ao obter DRE para DVA: {dre_resultado["message"]}'
+            }
+        
+        saldos = contexto.saldos(periodo)
+        versao_plano_contas = contexto.versao_plano_contas
+        
+        # Todos os valores abaixo estão em centavos; a conversão para reais é feita
+        # apenas na montagem de dva_data
+        
+        # 1. GERAÇÃO DO VALOR ADICIONADO
+        receitas = DVAService._obter_receitas_dva(saldos, versao_plano_contas)
+        insumos_adquiridos = DVAService._obter_insumos_adquiridos(saldos, versao_plano_contas)
+        valor_adicionado_bruto = receitas['total'] - insumos_adquiridos['total']
+        
+        # Depreciação, amortização e exaustão
+        depreciacoes = DVAService._obter_depreciacoes(saldos, versao_plano_contas)
+        valor_adicionado_liquido = valor_adicionado_bruto - depreciacoes['total']
+        
+        # Valor adicionado recebido em transferência
+        transferencias = DVAService._obter_transferencias_recebidas(saldos, versao_plano_contas)
+        valor_adicionado_total = valor_adicionado_liquido + transferencias['total']
+        
+        # 2. DISTRIBUIÇÃO DO VALOR ADICIONADO
+        distribuicao = DVAService._calcular_distribuicao_valor_adicionado(
+            saldos, versao_plano_contas, dre_resultado['centavos']
+        )
+        
+        # Verificar se a distribuição está balanceada (exato, sem tolerância)
+        total_distribuido = sum(item['valor'] for item in distribuicao.values())
+        diferenca = abs(valor_adicionado_total - total_distribuido)
+        
+        # Estruturar dados da DVA
+        dva_data = {
+            'periodo': periodo,
+            'geracao_valor_adicionado': {
+                'receitas': converter_valores(receitas),
+                'insumos_adquiridos': converter_valores(insumos_adquiridos),
+                'valor_adicionado_bruto': para_reais(valor_adicionado_bruto),
+                'depreciacoes': converter_valores(depreciacoes),
+                'valor_adicionado_liquido': para_reais(valor_adicionado_liquido),
+                'transferencias': converter_valores(transferencias),
+                'valor_adicionado_total': para_reais(valor_adicionado_total)
+            },
+            'distribuicao_valor_adicionado': converter_valores(distribuicao),
+            'total_distribuido': para_reais(total_distribuido),
+            'diferenca_balanceamento': para_reais(diferenca),
+            'balanceado': diferenca == 0,
+            'estrutura_dva': converter_valores(DVAService._estruturar_dva_completa(
+                receitas, insumos_adquiridos, valor_adicionado_bruto,
+                depreciacoes, valor_adicionado_liquido, transferencias,
+                valor_adicionado_total, distribuicao
+            ))
+        }
+        
+        return {'success': True, 'data': dva_data}
+    
+    @staticmethod
+    @Instrumentacao.etapa('consolidacao')
+    def _obter_receitas_dva(saldos, versao_plano_contas):
         """
         Obtém as receitas para a DVA (vendas de mercadorias, produtos e serviços)
         """
@@ -107,13 +135,13 @@ class DVAService:
         total_receitas = 0
         
         # Buscar contas de receita
-        contas_receita = PlanoContas.get_contas_por_elemento('receita', versao_plano_contas)
+        contas_receita = PlanoContasCache.obter(versao_plano_contas).get_contas_por_elemento('receita')
         
         for conta in contas_receita:
-            saldo = Balancete.get_saldo_por_conta(conta.codigo, periodo, versao_balancete)
+            saldo = saldos.get_saldo(conta.codigo)
             saldo_abs = abs(saldo)  # Receitas normalmente têm saldo credor
             
-            if saldo_abs > 0.01:
+            if saldo_abs != 0:
                 tipo_receita = DVAService._classificar_receita_dva(conta.nome)
                 receitas.append({
                     'codigo': conta.codigo,
@@ -129,7 +157,8 @@ class DVAService:
         }
     
     @staticmethod
-    def _obter_insumos_adquiridos(periodo, versao_balancete, versao_plano_contas):
+    @Instrumentacao.etapa('consolidacao')
+    def _obter_insumos_adquiridos(saldos, versao_plano_contas):
         """
         Obtém os insumos adquiridos de terceiros (custos e algumas despesas)
         """
@@ -137,12 +166,12 @@ class DVAService:
         total_insumos = 0
         
         # Buscar contas de custo
-        contas_custo = PlanoContas.get_contas_por_elemento('custo', versao_plano_contas)
+        contas_custo = PlanoContasCache.obter(versao_plano_contas).get_contas_por_elemento('custo')
         
         for conta in contas_custo:
-            saldo = Balancete.get_saldo_por_conta(conta.codigo, periodo, versao_balancete)
+            saldo = saldos.get_saldo(conta.codigo)
             
-            if abs(saldo) > 0.01:
+            if saldo != 0:
                 insumos.append({
                     'codigo': conta.codigo,
                     'descricao': conta.nome,
@@ -152,20 +181,19 @@ class DVAService:
                 total_insumos += abs(saldo)
         
         # Buscar algumas despesas que são insumos (materiais, energia, etc.)
-        contas_despesa = PlanoContas.get_contas_por_elemento('despesa', versao_plano_contas)
+        contas_insumo = PlanoContasCache.obter(versao_plano_contas).get_contas_por_tag('insumo_terceiros', 'despesa')
         
-        for conta in contas_despesa:
-            if DVAService._eh_insumo_terceiros(conta.nome):
-                saldo = Balancete.get_saldo_por_conta(conta.codigo, periodo, versao_balancete)
-                
-                if abs(saldo) > 0.01:
-                    insumos.append({
-                        'codigo': conta.codigo,
-                        'descricao': conta.nome,
-                        'valor': abs(saldo),
-                        'tipo': 'insumo'
-                    })
-                    total_insumos += abs(saldo)
+        for conta in contas_insumo:
+            saldo = saldos.get_saldo(conta.codigo)
+            
+            if saldo != 0:
+                insumos.append({
+                    'codigo': conta.codigo,
+                    'descricao': conta.nome,
+                    'valor': abs(saldo),
+                    'tipo': 'insumo'
+                })
+                total_insumos += abs(saldo)
         
         return {
             'itens': insumos,
@@ -173,26 +201,24 @@ class DVAService:
         }
     
     @staticmethod
-    def _obter_depreciacoes(periodo, versao_balancete, versao_plano_contas):
+    @Instrumentacao.etapa('consolidacao')
+    def _obter_depreciacoes(saldos, versao_plano_contas):
         """
         Obtém depreciação, amortização e exaustão
         """
         depreciacoes = []
         total_depreciacoes = 0
         
-        termos_busca = ['depreciação', 'amortização', 'exaustão']
+        termos_busca = [('depreciação', 'depreciacao'), ('amortização', 'amortizacao'), ('exaustão', 'exaustao')]
+        plano = PlanoContasCache.obter(versao_plano_contas)
         
-        for termo in termos_busca:
-            contas = PlanoContas.query.filter(
-                PlanoContas.versao == versao_plano_contas,
-                PlanoContas.ativo == True,
-                PlanoContas.nome.ilike(f'%{termo}%')
-            ).all()
+        for termo, tag in termos_busca:
+            contas = plano.get_contas_por_tag(tag)
             
             for conta in contas:
-                saldo = Balancete.get_saldo_por_conta(conta.codigo, periodo, versao_balancete)
+                saldo = saldos.get_saldo(conta.codigo)
                 
-                if abs(saldo) > 0.01:
+                if saldo != 0:
                     depreciacoes.append({
                         'codigo': conta.codigo,
                         'descricao': conta.nome,
@@ -207,7 +233,8 @@ class DVAService:
         }
     
     @staticmethod
-    def _obter_transferencias_recebidas(periodo, versao_balancete, versao_plano_contas):
+    @Instrumentacao.etapa('consolidacao')
+    def _obter_transferencias_recebidas(saldos, versao_plano_contas):
         """
         Obtém valor adicionado recebido em transferência (receitas financeiras, etc.)
         """
@@ -215,18 +242,13 @@ class DVAService:
         total_transferencias = 0
         
         # Buscar receitas financeiras
-        contas_financeiras = PlanoContas.query.filter(
-            PlanoContas.versao == versao_plano_contas,
-            PlanoContas.ativo == True,
-            PlanoContas.elemento_conta == 'receita',
-            PlanoContas.nome.ilike('%financeira%')
-        ).all()
+        contas_financeiras = PlanoContasCache.obter(versao_plano_contas).get_contas_por_tag('financeira', 'receita')
         
         for conta in contas_financeiras:
-            saldo = Balancete.get_saldo_por_conta(conta.codigo, periodo, versao_balancete)
+            saldo = saldos.get_saldo(conta.codigo)
             saldo_abs = abs(saldo)
             
-            if saldo_abs > 0.01:
+            if saldo_abs != 0:
                 transferencias.append({
                     'codigo': conta.codigo,
                     'descricao': conta.nome,
@@ -241,9 +263,11 @@ class DVAService:
         }
     
     @staticmethod
-    def _calcular_distribuicao_valor_adicionado(periodo, versao_balancete, versao_plano_contas, dados_dre):
+    @Instrumentacao.etapa('consolidacao')
+    def _calcular_distribuicao_valor_adicionado(saldos, versao_plano_contas, indicadores_dre):
         """
-        Calcula a distribuição do valor adicionado
+        Calcula a distribuição do valor adicionado (indicadores da DRE e valores
+        em centavos)
         """
         distribuicao = {
             'pessoal': {'valor': 0, 'itens': []},
@@ -252,21 +276,14 @@ class DVAService:
             'remuneracao_capital_proprio': {'valor': 0, 'itens': []}
         }
         
+        plano = PlanoContasCache.obter(versao_plano_contas)
+        
         # 1. Pessoal (salários, encargos, benefícios)
-        contas_pessoal = PlanoContas.query.filter(
-            PlanoContas.versao == versao_plano_contas,
-            PlanoContas.ativo == True,
-            PlanoContas.elemento_conta == 'despesa',
-            PlanoContas.nome.ilike('%salário%') | 
-            PlanoContas.nome.ilike('%encargo%') |
-            PlanoContas.nome.ilike('%benefício%') |
-            PlanoContas.nome.ilike('%férias%') |
-            PlanoContas.nome.ilike('%13º%')
-        ).all()
+        contas_pessoal = plano.get_contas_por_tag('pessoal', 'despesa')
         
         for conta in contas_pessoal:
-            saldo = Balancete.get_saldo_por_conta(conta.codigo, periodo, versao_balancete)
-            if abs(saldo) > 0.01:
+            saldo = saldos.get_saldo(conta.codigo)
+            if saldo != 0:
                 distribuicao['pessoal']['itens'].append({
                     'codigo': conta.codigo,
                     'descricao': conta.nome,
@@ -275,19 +292,11 @@ class DVAService:
                 distribuicao['pessoal']['valor'] += abs(saldo)
         
         # 2. Impostos, taxas e contribuições
-        contas_impostos = PlanoContas.query.filter(
-            PlanoContas.versao == versao_plano_contas,
-            PlanoContas.ativo == True,
-            PlanoContas.elemento_conta == 'despesa',
-            PlanoContas.nome.ilike('%imposto%') |
-            PlanoContas.nome.ilike('%taxa%') |
-            PlanoContas.nome.ilike('%contribuição%') |
-            PlanoContas.nome.ilike('%tributo%')
-        ).all()
+        contas_impostos = plano.get_contas_por_tag('impostos', 'despesa')
         
         for conta in contas_impostos:
-            saldo = Balancete.get_saldo_por_conta(conta.codigo, periodo, versao_balancete)
-            if abs(saldo) > 0.01:
+            saldo = saldos.get_saldo(conta.codigo)
+            if saldo != 0:
                 distribuicao['impostos']['itens'].append({
                     'codigo': conta.codigo,
                     'descricao': conta.nome,
@@ -296,18 +305,11 @@ class DVAService:
                 distribuicao['impostos']['valor'] += abs(saldo)
         
         # 3. Remuneração de capital de terceiros (juros, aluguéis)
-        contas_terceiros = PlanoContas.query.filter(
-            PlanoContas.versao == versao_plano_contas,
-            PlanoContas.ativo == True,
-            PlanoContas.elemento_conta == 'despesa',
-            PlanoContas.nome.ilike('%juro%') |
-            PlanoContas.nome.ilike('%aluguel%') |
-            PlanoContas.nome.ilike('%financeira%')
-        ).all()
+        contas_terceiros = plano.get_contas_por_tag('capital_terceiros', 'despesa')
         
         for conta in contas_terceiros:
-            saldo = Balancete.get_saldo_por_conta(conta.codigo, periodo, versao_balancete)
-            if abs(saldo) > 0.01:
+            saldo = saldos.get_saldo(conta.codigo)
+            if saldo != 0:
                 distribuicao['remuneracao_capital_terceiros']['itens'].append({
                     'codigo': conta.codigo,
                     'descricao': conta.nome,
@@ -316,7 +318,7 @@ class DVAService:
                 distribuicao['remuneracao_capital_terceiros']['valor'] += abs(saldo)
         
         # 4. Remuneração de capital próprio (lucros retidos, dividendos)
-        lucro_liquido = dados_dre['indicadores']['lucro_liquido']
+        lucro_liquido = indicadores_dre['lucro_liquido']
         if lucro_liquido > 0:
             distribuicao['remuneracao_capital_proprio']['itens'].append({
                 'codigo': 'LUCRO',
@@ -344,20 +346,7 @@ class DVAService:
             return 'outras_receitas'
     
     @staticmethod
-    def _eh_insumo_terceiros(nome_conta):
-        """
-        Verifica se uma conta de despesa representa insumo adquirido de terceiros
-        """
-        nome_lower = nome_conta.lower()
-        
-        insumos_terceiros = [
-            'material', 'energia', 'telefone', 'água', 'combustível',
-            'manutenção', 'terceirizado', 'consultoria', 'auditoria'
-        ]
-        
-        return any(termo in nome_lower for termo in insumos_terceiros)
-    
-    @staticmethod
+    @Instrumentacao.etapa('estrutura')
     def _estruturar_dva_completa(receitas, insumos_adquiridos, valor_adicionado_bruto,
                                 depreciacoes, valor_adicionado_liquido, transferencias,
                                 valor_adicionado_total, distribuicao):
@@ -537,6 +526,7 @@ class DVAService:
         return {'linhas': linhas}
     
     @staticmethod
+    @Roteamento.somente_leitura()
     def obter_dva(periodo, versao_balancete='1.0'):
         """
         Obtém a DVA já gerada para um período
@@ -546,7 +536,7 @@ class DVAService:
         if demonstracao:
             return {
                 'success': True,
-                'data': json.loads(demonstracao.dados_json),
+                'data': demonstracao.get_dados(),
                 'data_geracao': demonstracao.data_geracao.isoformat()
             }
         else:
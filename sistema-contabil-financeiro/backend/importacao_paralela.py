@@ -0,0 +1,283 @@
+"""
+Importação paralela de vários balancetes (ex.: os doze meses de um ano ou as
+versões de um período). A leitura e a validação dos arquivos rodam em um pool
+de processos; somente as gravações em lote são serializadas no processo
+principal, uma transação por arquivo.
+
+Uso pela linha de comando:
+    python -m src.services.importacao_paralela --uri sqlite:///caminho/app.db balancete_2024-01.csv balancete_2024-02.csv
+"""
+from src.models.user import db
+from src.models.perfil_banco import criar_app
+from src.services.importacao_service import ImportacaoBalanceteService
+from src.services.instrumentacao import Instrumentacao
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import json
+import os
+import pickle
+import re
+import tempfile
+import time
+
+# Plano de contas (codigo -> (id, nome)) recebido por cada processo do pool
+_contas_processo = {}
+
+
+class ImportacaoParalelaService:
+    
+    # Quantidade máxima de arquivos por lote (36 versões de um período)
+    LIMITE_ARQUIVOS = 36
+    
+    @staticmethod
+    @Instrumentacao.servico('importar_arquivos')
+    def importar_arquivos(arquivos, versao_plano_contas='1.0', ignorar_zeros=False, max_workers=None, progresso=None):
+        """
+        Importa vários arquivos de balancete. arquivos é uma lista de dicionários
+        com 'caminho', 'nome' (opcional), 'periodo' (opcional: inferido do nome) e
+        'versao_balancete' (opcional, '1.0'). Retorna o resultado de cada arquivo,
+        na ordem recebida; um arquivo com erro não impede a gravação dos demais.
+        progresso, se informado, é chamado após cada arquivo gravado com
+        (percentual, mensagem); uma exceção levantada por ele interrompe o lote e
+        os arquivos ainda não gravados são descartados.
+        """
+        try:
+            inicio = time.perf_counter()
+            
+            if not arquivos:
+                return {
+                    'success': False,
+                    'message': 'Nenhum arquivo informado'
+                }
+            
+            if len(arquivos) > ImportacaoParalelaService.LIMITE_ARQUIVOS:
+                return {
+                    'success': False,
+                    'message': f'O lote aceita no máximo {ImportacaoParalelaService.LIMITE_ARQUIVOS} arquivos'
+                }
+            
+            resultados = [None] * len(arquivos)
+            tarefas = []
+            chaves = {}
+            
+            for indice, arquivo in enumerate(arquivos):
+                nome = arquivo.get('nome') or os.path.basename(arquivo['caminho'])
+                periodo = arquivo.get('periodo') or ImportacaoParalelaService.inferir_periodo(nome)
+                versao_balancete = arquivo.get('versao_balancete') or '1.0'
+                
+                erro = ImportacaoBalanceteService.validar_parametros(nome, periodo)
+                if not erro and (periodo, versao_balancete) in chaves:
+                    erro = f'Período {periodo} (versão {versao_balancete}) repetido no lote: {chaves[(periodo, versao_balancete)]}'
+                
+                if erro:
+                    resultados[indice] = ImportacaoParalelaService._resultado_arquivo(
+                        nome, periodo, versao_balancete, {'success': False, 'message': erro}
+                    )
+                    continue
+                
+                chaves[(periodo, versao_balancete)] = nome
+                tarefas.append((indice, arquivo['caminho'], nome, periodo, versao_balancete))
+            
+            contas = ImportacaoBalanceteService.mapa_plano(versao_plano_contas)
+            max_workers = max(1, min(max_workers or os.cpu_count() or 1, len(tarefas) or 1))
+            
+            with ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_inicializar_processo,
+                initargs=(contas,)
+            ) as executor:
+                futuros = {
+                    executor.submit(
+                        _validar_arquivo, caminho, nome, periodo, versao_balancete, versao_plano_contas, ignorar_zeros
+                    ): (indice, nome, periodo, versao_balancete)
+                    for indice, caminho, nome, periodo, versao_balancete in tarefas
+                }
+                
+                # Cada arquivo é gravado assim que sua validação termina, enquanto os
+                # demais continuam sendo processados no pool
+                interrupcao = None
+                for concluidos, futuro in enumerate(as_completed(futuros), 1):
+                    indice, nome, periodo, versao_balancete = futuros[futuro]
+                    if interrupcao:
+                        ImportacaoParalelaService._descartar_arquivo(futuro)
+                        resultado = {'success': False, 'message': f'Importação interrompida: {interrupcao}'}
+                    else:
+                        resultado = ImportacaoParalelaService._gravar_arquivo(
+                            futuro, periodo, versao_balancete, versao_plano_contas
+                        )
+                    resultados[indice] = ImportacaoParalelaService._resultado_arquivo(
+                        nome, periodo, versao_balancete, resultado
+                    )
+                    
+                    if progresso and not interrupcao:
+                        try:
+                            progresso(100.0 * concluidos / len(futuros), f'{nome} processado')
+                        except Exception as e:
+                            interrupcao = str(e)
+                            for pendente in futuros:
+                                pendente.cancel()
+            
+            importados = sum(1 for resultado in resultados if resultado['success'])
+            
+            return {
+                'success': importados == len(arquivos),
+                'data': {
+                    'arquivos': resultados,
+                    'processos': max_workers,
+                    'tempo_ms': round((time.perf_counter() - inicio) * 1000, 2)
+                },
+                'message': f'{importados} de {len(arquivos)} arquivos importados'
+            }
+            
+        except Exception as e:
+            db.session.rollback()
+            return {
+                'success': False,
+                'message': f'Erro ao importar arquivos: {str(e)}'
+            }
+    
+    @staticmethod
+    def inferir_periodo(nome_arquivo):
+        """Período YYYY-MM contido no nome do arquivo (ex.: balancete_2024-03.csv, bal_03_2024.txt)"""
+        nome = os.path.splitext(os.path.basename(nome_arquivo or ''))[0]
+        
+        encontrado = re.search(r'(?<!\d)(\d{4})[-_.]?(0[1-9]|1[0-2])(?!\d)', nome)
+        if encontrado:
+            return f'{encontrado.group(1)}-{encontrado.group(2)}'
+        
+        encontrado = re.search(r'(?<!\d)(0[1-9]|1[0-2])[-_.](\d{4})(?!\d)', nome)
+        if encontrado:
+            return f'{encontrado.group(2)}-{encontrado.group(1)}'
+        
+        return None
+    
+    @staticmethod
+    def _gravar_arquivo(futuro, periodo, versao_balancete, versao_plano_contas):
+        """Grava, em uma transação, os lotes validados por um processo do pool"""
+        inicio = time.perf_counter()
+        arquivo_lotes = None
+        
+        try:
+            validacao = futuro.result()
+            arquivo_lotes = validacao['arquivo_lotes']
+            resumo = validacao['resumo']
+            
+            if resumo['total_erros']:
+                return ImportacaoBalanceteService.concluir(
+                    periodo, versao_balancete, versao_plano_contas, None, resumo, inicio
+                )
+            
+            saldos_anteriores = ImportacaoBalanceteService.preparar_periodo(periodo, versao_balancete)
+            with open(arquivo_lotes, 'rb') as lotes:
+                while True:
+                    try:
+                        registros = pickle.load(lotes)
+                    except EOFError:
+                        break
+                    ImportacaoBalanceteService.inserir_lote(registros, resumo)
+            
+            resultado = ImportacaoBalanceteService.concluir(
+                periodo, versao_balancete, versao_plano_contas, saldos_anteriores, resumo, inicio
+            )
+            if resultado['success']:
+                resultado['data']['tempo_validacao_ms'] = validacao['tempo_ms']
+            return resultado
+            
+        except Exception as e:
+            db.session.rollback()
+            return {
+                'success': False,
+                'message': f'Erro ao importar balancete: {str(e)}'
+            }
+        finally:
+            if arquivo_lotes and os.path.exists(arquivo_lotes):
+                os.remove(arquivo_lotes)
+    
+    @staticmethod
+    def _descartar_arquivo(futuro):
+        """Remove os lotes validados de um arquivo que não será gravado"""
+        if futuro.cancelled() or futuro.exception() is not None:
+            return
+        arquivo_lotes = futuro.result()['arquivo_lotes']
+        if os.path.exists(arquivo_lotes):
+            os.remove(arquivo_lotes)
+    
+    @staticmethod
+    def _resultado_arquivo(nome, periodo, versao_balancete, resultado):
+        return {
+            'arquivo': nome,
+            'periodo': periodo,
+            'versao_balancete': versao_balancete,
+            'success': resultado['success'],
+            'message': resultado['message'],
+            'data': resultado.get('data')
+        }
+
+
+def _inicializar_processo(contas):
+    global _contas_processo
+    _contas_processo = contas
+
+
+def _validar_arquivo(caminho, nome, periodo, versao_balancete, versao_plano_contas, ignorar_zeros):
+    """
+    Executado no pool: lê e valida o arquivo e grava os lotes de registros em um
+    arquivo temporário (pickle), devolvendo o caminho e o resumo. Nenhum acesso
+    ao banco é feito aqui.
+    """
+    inicio = time.perf_counter()
+    resumo = ImportacaoBalanceteService.novo_resumo()
+    descritor, arquivo_lotes = tempfile.mkstemp(prefix='balancete_', suffix='.lotes')
+    
+    try:
+        with os.fdopen(descritor, 'wb') as saida, open(caminho, 'rb') as entrada:
+            for registros in ImportacaoBalanceteService.lotes_validados(
+                entrada, nome, _contas_processo, periodo, versao_balancete, versao_plano_contas, ignorar_zeros, resumo
+            ):
+                if resumo['total_erros'] == 0:
+                    pickle.dump(registros, saida, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        os.remove(arquivo_lotes)
+        raise
+    
+    return {
+        'arquivo_lotes': arquivo_lotes,
+        'resumo': resumo,
+        'tempo_ms': round((time.perf_counter() - inicio) * 1000, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Importação paralela de arquivos de balancete')
+    parser.add_argument('arquivos', nargs='+', help='Arquivos CSV/TXT/XLSX (período YYYY-MM no nome ou em --periodos)')
+    parser.add_argument('--uri', required=True, help='URI do banco de dados da aplicação')
+    parser.add_argument('--periodos', help='Períodos dos arquivos, na mesma ordem, separados por vírgula')
+    parser.add_argument('--versao-balancete', default='1.0')
+    parser.add_argument('--versao-plano-contas', default='1.0')
+    parser.add_argument('--ignorar-zeros', action='store_true')
+    parser.add_argument('--processos', type=int, help='Processos de validação (padrão: núcleos disponíveis)')
+    args = parser.parse_args()
+    
+    periodos = args.periodos.split(',') if args.periodos else [None] * len(args.arquivos)
+    if len(periodos) != len(args.arquivos):
+        parser.error('--periodos deve ter um período para cada arquivo')
+    
+    app = criar_app(args.uri)
+    
+    with app.app_context():
+        resultado = ImportacaoParalelaService.importar_arquivos(
+            [
+                {'caminho': caminho, 'periodo': periodo, 'versao_balancete': args.versao_balancete}
+                for caminho, periodo in zip(args.arquivos, periodos)
+            ],
+            args.versao_plano_contas,
+            args.ignorar_zeros,
+            args.processos
+        )
+    
+    print(json.dumps(resultado, ensure_ascii=False, indent=2, default=str))
+    raise SystemExit(0 if resultado['success'] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,494 @@
+from src.models.balancete import Balancete
+from src.models.user import db
+from src.services.plano_contas_cache import PlanoContasCache
+from src.services.recalculo_incremental import RecalculoIncrementalService
+from src.services.saldos import SaldosPeriodo
+from src.services.instrumentacao import Instrumentacao
+from decimal import Decimal, InvalidOperation
+import csv
+import os
+import re
+import time
+import unicodedata
+
+class ImportacaoBalanceteService:
+    """
+    Importação de balancetes (CSV, TXT e Excel) em fluxo contínuo: o arquivo é lido
+    em lotes de tamanho fixo, cada lote é normalizado, validado e mapeado para o
+    plano de contas (dicionário em memória) e gravado com um INSERT em lote
+    (executemany). Todo o arquivo é gravado em uma única transação e o uso de
+    memória não depende do tamanho do arquivo.
+    """
+    
+    TAMANHO_LOTE = 5000
+    
+    # Quantidade máxima de versões de balancete por período
+    LIMITE_VERSOES_PERIODO = 36
+    
+    # Quantidade máxima de erros e de contas sem plano detalhados no retorno
+    LIMITE_DETALHES = 100
+    
+    EXTENSOES_TEXTO = ('.csv', '.txt')
+    EXTENSOES_EXCEL = ('.xlsx', '.xlsm')
+    
+    # Nomes aceitos para cada coluna (cabeçalho sem acentos, minúsculo e com '_')
+    COLUNAS = {
+        'codigo_conta': ('codigo_conta', 'codigo', 'cod_conta', 'cod', 'conta', 'classificacao'),
+        'nome_conta': ('nome_conta', 'nome', 'descricao', 'descricao_conta'),
+        'saldo_inicial': ('saldo_inicial', 'saldo_anterior'),
+        'debitos': ('debitos', 'debito'),
+        'creditos': ('creditos', 'credito'),
+        'saldo_final': ('saldo_final', 'saldo_atual', 'saldo')
+    }
+    COLUNAS_OBRIGATORIAS = ('codigo_conta', 'saldo_final')
+    COLUNAS_VALOR = ('saldo_inicial', 'debitos', 'creditos', 'saldo_final')
+    
+    DELIMITADORES = (';', '\t', '|', ',')
+    
+    CENTAVOS = Decimal('0.01')
+    ZERO = Decimal('0.00')
+    
+    # Um único ponto seguido de exatamente 3 dígitos, e o caso em que ele só pode
+    # ser separador de milhar (1 a 3 dígitos antes, sem zero à esquerda)
+    PADRAO_PONTO_MILHAR_AMBIGUO = re.compile(r'^[+-]?\d*\.\d{3}$')
+    PADRAO_PONTO_MILHAR = re.compile(r'^[+-]?[1-9]\d{0,2}\.\d{3}$')
+    
+    @staticmethod
+    @Instrumentacao.servico('importar_arquivo')
+    def importar_arquivo(arquivo, nome_arquivo, periodo, versao_balancete='1.0', versao_plano_contas='1.0', ignorar_zeros=False, progresso=None):
+        """
+        Importa o balancete de um período a partir de um arquivo binário aberto
+        (ou do caminho do arquivo). As linhas já existentes do período/versão são
+        substituídas; nesse caso as demonstrações gravadas são atualizadas
+        incrementalmente a partir das contas alteradas. progresso, se informado, é
+        chamado a cada lote com (percentual lido do arquivo ou None, mensagem); uma
+        exceção levantada por ele interrompe a importação e desfaz a transação.
+        """
+        try:
+            inicio = time.perf_counter()
+            
+            erro = ImportacaoBalanceteService.validar_parametros(nome_arquivo, periodo)
+            if erro:
+                return {'success': False, 'message': erro}
+            
+            saldos_anteriores = ImportacaoBalanceteService.preparar_periodo(periodo, versao_balancete)
+            contas = ImportacaoBalanceteService.mapa_plano(versao_plano_contas)
+            resumo = ImportacaoBalanceteService.novo_resumo()
+            
+            if isinstance(arquivo, str):
+                arquivo = open(arquivo, 'rb')
+                fechar = True
+            else:
+                fechar = False
+            
+            try:
+                tamanho = ImportacaoBalanceteService._tamanho_arquivo(arquivo) if progresso else None
+                for registros in ImportacaoBalanceteService.lotes_validados(
+                    arquivo, nome_arquivo, contas, periodo, versao_balancete, versao_plano_contas, ignorar_zeros, resumo
+                ):
+                    # Havendo erro, o arquivo continua sendo validado, mas nada mais é gravado
+                    if resumo['total_erros'] == 0:
+                        ImportacaoBalanceteService.inserir_lote(registros, resumo)
+                    if progresso:
+                        progresso(
+                            ImportacaoBalanceteService._percentual_lido(arquivo, tamanho),
+                            f"{resumo['linhas_lidas']} linhas lidas"
+                        )
+            finally:
+                if fechar:
+                    arquivo.close()
+            
+            return ImportacaoBalanceteService.concluir(
+                periodo, versao_balancete, versao_plano_contas, saldos_anteriores, resumo, inicio
+            )
+            
+        except Exception as e:
+            db.session.rollback()
+            return {
+                'success': False,
+                'message': f'Erro ao importar balancete: {str(e)}'
+            }
+    
+    @staticmethod
+    def validar_parametros(nome_arquivo, periodo):
+        """Mensagem de erro para período ou formato de arquivo inválido, ou None"""
+        if not re.fullmatch(r'\d{4}-(0[1-9]|1[0-2])', periodo or ''):
+            return 'Período inválido. Use o formato YYYY-MM'
+        
+        extensao = os.path.splitext(nome_arquivo or '')[1].lower()
+        if extensao not in ImportacaoBalanceteService.EXTENSOES_TEXTO + ImportacaoBalanceteService.EXTENSOES_EXCEL:
+            return f'Formato de arquivo não suportado: {extensao or nome_arquivo}. Use CSV, TXT ou XLSX'
+        
+        return None
+    
+    @staticmethod
+    def mapa_plano(versao_plano_contas='1.0'):
+        """
+        Dicionário codigo -> (id, nome) das contas ativas do plano (a primeira
+        conta de cada código, como em PlanoContas.get_by_codigo). Serializável,
+        para ser enviado aos processos de validação.
+        """
+        contas = {}
+        for conta in PlanoContasCache.obter(versao_plano_contas).get_contas():
+            contas.setdefault(conta.codigo, (conta.id, conta.nome))
+        return contas
+    
+    @staticmethod
+    def novo_resumo():
+        return {
+            'linhas_lidas': 0,
+            'linhas_importadas': 0,
+            'linhas_ignoradas': 0,
+            'contas_sem_plano': 0,
+            'codigos_sem_plano': [],
+            'total_erros': 0,
+            'erros': [],
+            'totalizador': ImportacaoBalanceteService.ZERO
+        }
+    
+    @staticmethod
+    def lotes_validados(arquivo, nome_arquivo, contas, periodo, versao_balancete, versao_plano_contas, ignorar_zeros, resumo):
+        """
+        Lê e valida o arquivo em lotes, sem acessar o banco: gera as listas de
+        registros prontos para o INSERT e acumula contagens e erros em resumo
+        """
+        extensao = os.path.splitext(nome_arquivo)[1].lower()
+        linhas = ImportacaoBalanceteService._ler_arquivo(arquivo, extensao)
+        
+        for lote in ImportacaoBalanceteService._em_lotes(linhas, ImportacaoBalanceteService.TAMANHO_LOTE):
+            registros, erros = ImportacaoBalanceteService._normalizar_lote(
+                lote, contas, periodo, versao_balancete, versao_plano_contas, ignorar_zeros, resumo
+            )
+            
+            if erros:
+                resumo['total_erros'] += len(erros)
+                espaco = ImportacaoBalanceteService.LIMITE_DETALHES - len(resumo['erros'])
+                resumo['erros'].extend(erros[:max(espaco, 0)])
+            
+            if registros:
+                yield registros
+    
+    @staticmethod
+    def preparar_periodo(periodo, versao_balancete):
+        """
+        Verifica o limite de versões do período e remove as linhas da versão que
+        será reimportada (sem commit). Retorna os saldos anteriores (SaldosPeriodo)
+        quando a versão já existia, ou None.
+        """
+        versoes = {
+            versao for (versao,) in db.session.query(Balancete.versao_balancete).filter_by(periodo=periodo).distinct()
+        }
+        if versao_balancete not in versoes and len(versoes) >= ImportacaoBalanceteService.LIMITE_VERSOES_PERIODO:
+            raise ValueError(
+                f'O período {periodo} já possui {len(versoes)} versões de balancete '
+                f'(máximo {ImportacaoBalanceteService.LIMITE_VERSOES_PERIODO})'
+            )
+        
+        if versao_balancete not in versoes:
+            return None
+        
+        # Fotografia do balancete anterior, para a atualização incremental das demonstrações
+        saldos_anteriores = SaldosPeriodo.carregar(periodo, versao_balancete)
+        Balancete.query.filter_by(periodo=periodo, versao_balancete=versao_balancete).delete(
+            synchronize_session=False
+        )
+        return saldos_anteriores
+    
+    @staticmethod
+    @Instrumentacao.etapa('persistencia')
+    def inserir_lote(registros, resumo):
+        """Grava um lote de registros com um único INSERT (executemany)"""
+        db.session.execute(Balancete.__table__.insert(), registros)
+        resumo['linhas_importadas'] += len(registros)
+        for registro in registros:
+            resumo['totalizador'] += registro['saldo_final']
+    
+    @staticmethod
+    def concluir(periodo, versao_balancete, versao_plano_contas, saldos_anteriores, resumo, inicio):
+        """
+        Confirma a transação da importação (ou a desfaz, se houve erros ou nenhuma
+        linha) e atualiza as demonstrações quando o período foi reimportado
+        """
+        if resumo['total_erros']:
+            db.session.rollback()
+            resumo['totalizador'] = float(resumo['totalizador'])
+            return {
+                'success': False,
+                'data': resumo,
+                'message': f"Importação cancelada: {resumo['total_erros']} linhas com erro"
+            }
+        
+        if resumo['linhas_importadas'] == 0:
+            db.session.rollback()
+            resumo['totalizador'] = float(resumo['totalizador'])
+            return {
+                'success': False,
+                'data': resumo,
+                'message': 'Nenhuma linha de balancete encontrada no arquivo'
+            }
+        
+        db.session.commit()
+        
+        totalizador = resumo['totalizador']
+        resumo['totalizador'] = float(totalizador)
+        resumo['totalizador_zero'] = abs(totalizador) < ImportacaoBalanceteService.CENTAVOS
+        resumo['substituiu_existente'] = saldos_anteriores is not None
+        
+        if saldos_anteriores is not None:
+            resumo['demonstracoes'] = RecalculoIncrementalService.atualizar_apos_reimportacao(
+                periodo, saldos_anteriores, versao_balancete, versao_plano_contas
+            )
+        
+        resumo['tempo_ms'] = round((time.perf_counter() - inicio) * 1000, 2)
+        
+        return {
+            'success': True,
+            'data': resumo,
+            'message': (
+                f"{resumo['linhas_importadas']} linhas importadas para {periodo}"
+                + (f"; {resumo['linhas_ignoradas']} ignoradas" if resumo['linhas_ignoradas'] else '')
+                + (f"; {resumo['contas_sem_plano']} sem conta no plano" if resumo['contas_sem_plano'] else '')
+                + ('' if resumo['totalizador_zero'] else '; atenção: totalizador diferente de zero')
+            )
+        }
+    
+    @staticmethod
+    def _em_lotes(linhas, tamanho):
+        """Agrupa um iterável em listas de até `tamanho` elementos"""
+        lote = []
+        for linha in linhas:
+            lote.append(linha)
+            if len(lote) >= tamanho:
+                yield lote
+                lote = []
+        if lote:
+            yield lote
+    
+    @staticmethod
+    def _tamanho_arquivo(arquivo):
+        try:
+            return os.fstat(arquivo.fileno()).st_size
+        except (AttributeError, OSError, ValueError):
+            return None
+    
+    @staticmethod
+    def _percentual_lido(arquivo, tamanho):
+        """Posição de leitura do arquivo em relação ao tamanho (0 a 100), ou None"""
+        if not tamanho:
+            return None
+        try:
+            return min(100.0, 100.0 * arquivo.tell() / tamanho)
+        except (AttributeError, OSError, ValueError):
+            return None
+    
+    @staticmethod
+    def _ler_arquivo(arquivo, extensao):
+        """
+        Linhas do arquivo como (número da linha, {coluna: valor bruto}), já com os
+        cabeçalhos mapeados para as colunas do balancete
+        """
+        if extensao in ImportacaoBalanceteService.EXTENSOES_EXCEL:
+            registros = ImportacaoBalanceteService._ler_excel(arquivo)
+        else:
+            registros = ImportacaoBalanceteService._ler_texto(arquivo)
+        
+        colunas = None
+        for numero_linha, valores in registros:
+            if colunas is None:
+                # Primeira linha não vazia: cabeçalho
+                if not any(valor not in (None, '') for valor in valores):
+                    continue
+                colunas = ImportacaoBalanceteService._mapear_cabecalho(valores)
+                continue
+            
+            if not any(valor not in (None, '') for valor in valores):
+                continue
+            
+            yield numero_linha, {
+                coluna: valores[indice] if indice < len(valores) else None
+                for coluna, indice in colunas.items()
+            }
+    
+    @staticmethod
+    def _mapear_cabecalho(cabecalho):
+        """Posição de cada coluna do balancete no cabeçalho do arquivo"""
+        nomes = [ImportacaoBalanceteService._normalizar_nome_coluna(valor) for valor in cabecalho]
+        
+        colunas = {}
+        for coluna, aceitos in ImportacaoBalanceteService.COLUNAS.items():
+            for aceito in aceitos:
+                if aceito in nomes and nomes.index(aceito) not in colunas.values():
+                    colunas[coluna] = nomes.index(aceito)
+                    break
+        
+        faltantes = [coluna for coluna in ImportacaoBalanceteService.COLUNAS_OBRIGATORIAS if coluna not in colunas]
+        if faltantes:
+            raise ValueError(f'Colunas obrigatórias ausentes no cabeçalho: {", ".join(faltantes)}')
+        
+        return colunas
+    
+    @staticmethod
+    def _normalizar_nome_coluna(valor):
+        texto = unicodedata.normalize('NFKD', str(valor or '')).encode('ascii', 'ignore').decode('ascii')
+        return re.sub(r'[^a-z0-9]+', '_', texto.lower()).strip('_')
+    
+    @staticmethod
+    def _ler_texto(arquivo):
+        """
+        Linhas de um arquivo CSV/TXT delimitado, decodificadas uma a uma (UTF-8,
+        ou Latin-1 a partir da primeira linha que não for UTF-8 válido)
+        """
+        linhas = ImportacaoBalanceteService._decodificar_linhas(arquivo)
+        
+        primeira = next(linhas, None)
+        if primeira is None:
+            return
+        
+        delimitador = max(ImportacaoBalanceteService.DELIMITADORES, key=primeira.count)
+        
+        def todas():
+            yield primeira
+            yield from linhas
+        
+        for numero_linha, valores in enumerate(csv.reader(todas(), delimiter=delimitador), start=1):
+            yield numero_linha, [valor.strip() for valor in valores]
+    
+    @staticmethod
+    def _decodificar_linhas(arquivo):
+        codificacao = 'utf-8-sig'
+        for linha in arquivo:
+            try:
+                texto = linha.decode(codificacao)
+            except UnicodeDecodeError:
+                codificacao = 'latin-1'
+                texto = linha.decode(codificacao)
+            if codificacao == 'utf-8-sig':
+                codificacao = 'utf-8'
+            yield texto
+    
+    @staticmethod
+    def _ler_excel(arquivo):
+        """Linhas da primeira planilha, lidas em modo somente leitura (streaming)"""
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ValueError('Importação de Excel requer o pacote openpyxl')
+        
+        pasta = load_workbook(arquivo, read_only=True, data_only=True)
+        try:
+            planilha = pasta.worksheets[0]
+            for numero_linha, valores in enumerate(planilha.iter_rows(values_only=True), start=1):
+                yield numero_linha, list(valores)
+        finally:
+            pasta.close()
+    
+    @staticmethod
+    def _normalizar_lote(lote, contas, periodo, versao_balancete, versao_plano_contas, ignorar_zeros, resumo):
+        """
+        Converte e valida um lote de linhas. Retorna os registros prontos para o
+        INSERT em lote e a lista de erros (linha e mensagem)
+        """
+        registros = []
+        erros = []
+        
+        for numero_linha, valores in lote:
+            resumo['linhas_lidas'] += 1
+            
+            codigo_conta = valores.get('codigo_conta')
+            if isinstance(codigo_conta, float) and codigo_conta.is_integer():
+                codigo_conta = int(codigo_conta)  # Célula numérica do Excel
+            codigo_conta = str(codigo_conta if codigo_conta is not None else '').strip()
+            if not codigo_conta:
+                erros.append({'linha': numero_linha, 'mensagem': 'Código da conta não informado'})
+                continue
+            if len(codigo_conta) > 20:
+                erros.append({'linha': numero_linha, 'mensagem': f'Código da conta com mais de 20 caracteres: {codigo_conta}'})
+                continue
+            
+            registro = {
+                'codigo_conta': codigo_conta,
+                'periodo': periodo,
+                'versao_balancete': versao_balancete,
+                'versao_plano_contas': versao_plano_contas
+            }
+            
+            try:
+                for coluna in ImportacaoBalanceteService.COLUNAS_VALOR:
+                    registro[coluna] = ImportacaoBalanceteService._converter_valor(valores.get(coluna))
+            except ValueError as e:
+                erros.append({'linha': numero_linha, 'mensagem': str(e)})
+                continue
+            
+            if ignorar_zeros and not any(registro[coluna] for coluna in ImportacaoBalanceteService.COLUNAS_VALOR):
+                resumo['linhas_ignoradas'] += 1
+                continue
+            
+            conta = contas.get(codigo_conta)  # (id, nome)
+            if conta is None:
+                resumo['contas_sem_plano'] += 1
+                if len(resumo['codigos_sem_plano']) < ImportacaoBalanceteService.LIMITE_DETALHES:
+                    resumo['codigos_sem_plano'].append(codigo_conta)
+            
+            nome_conta = str(valores.get('nome_conta') or '').strip()
+            registro['nome_conta'] = (nome_conta or (conta[1] if conta else codigo_conta))[:255]
+            registro['plano_contas_id'] = conta[0] if conta else None
+            
+            registros.append(registro)
+        
+        return registros, erros
+    
+    @staticmethod
+    def _converter_valor(valor):
+        """
+        Converte um valor monetário para Decimal com 2 casas. Aceita números,
+        '1.234,56', '1,234.56', '(1.234,56)' e o sufixo D/C (crédito negativo).
+        Um único ponto seguido de 3 dígitos ('1.234') é separador de milhar;
+        se não puder sê-lo ('0.500', '1234.567'), o valor é recusado como ambíguo.
+        """
+        if valor is None or valor == '' or valor == '0,00' or valor == '0':
+            return ImportacaoBalanceteService.ZERO
+        if isinstance(valor, (int, float, Decimal)):
+            return ImportacaoBalanceteService._quantizar(Decimal(str(valor)), valor)
+        
+        texto = str(valor).strip().replace(' ', '').replace('R$', '')
+        negativo = False
+        
+        if texto[-1:].upper() in ('D', 'C'):
+            negativo = texto[-1].upper() == 'C'
+            texto = texto[:-1]
+        if texto.startswith('(') and texto.endswith(')'):
+            negativo = not negativo
+            texto = texto[1:-1]
+        
+        # O último separador é o decimal; os demais são de milhar
+        if ',' in texto and '.' in texto:
+            if texto.rfind(',') > texto.rfind('.'):
+                texto = texto.replace('.', '').replace(',', '.')
+            else:
+                texto = texto.replace(',', '')
+        elif ',' in texto:
+            texto = texto.replace(',', '.')
+        elif texto.count('.') > 1:
+            texto = texto.replace('.', '')
+        elif ImportacaoBalanceteService.PADRAO_PONTO_MILHAR_AMBIGUO.match(texto):
+            if not ImportacaoBalanceteService.PADRAO_PONTO_MILHAR.match(texto):
+                raise ValueError(f'Valor monetário ambíguo (ponto decimal ou de milhar?): {valor}')
+            texto = texto.replace('.', '')
+        
+        try:
+            numero = Decimal(texto)
+        except InvalidOperation:
+            raise ValueError(f'Valor monetário inválido: {valor}')
+        numero = ImportacaoBalanceteService._quantizar(numero, valor)
+        
+        return -numero if negativo else numero
+    
+    @staticmethod
+    def _quantizar(numero, valor):
+        """Arredonda para centavos; NaN, infinitos e valores fora da precisão viram ValueError"""
+        try:
+            if not numero.is_finite():
+                raise InvalidOperation
+            return numero.quantize(ImportacaoBalanceteService.CENTAVOS)
+        except InvalidOperation:
+            raise ValueError(f'Valor monetário inválido: {valor}')
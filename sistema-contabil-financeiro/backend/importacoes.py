@@ -0,0 +1,104 @@
+from flask import Blueprint, jsonify, request
+from src.services.importacao_service import ImportacaoBalanceteService
+from src.services.importacao_paralela import ImportacaoParalelaService
+from werkzeug.utils import secure_filename
+import os
+import tempfile
+
+importacoes_bp = Blueprint('importacoes', __name__)
+
+@importacoes_bp.route('/importacoes/balancete', methods=['POST'])
+def importar_balancete():
+    """
+    Importa um balancete (CSV, TXT ou XLSX) em lotes, sem carregar o arquivo
+    inteiro em memória. Formulário multipart: arquivo, periodo, versao_balancete,
+    versao_plano_contas e ignorar_zeros.
+    """
+    try:
+        arquivo = request.files.get('arquivo')
+        periodo = request.form.get('periodo')
+        
+        if not arquivo or not arquivo.filename:
+            return jsonify({
+                'success': False,
+                'message': 'Arquivo do balancete é obrigatório'
+            }), 400
+        
+        if not periodo:
+            return jsonify({
+                'success': False,
+                'message': 'Período é obrigatório'
+            }), 400
+        
+        resultado = ImportacaoBalanceteService.importar_arquivo(
+            arquivo.stream,
+            arquivo.filename,
+            periodo,
+            request.form.get('versao_balancete', '1.0'),
+            request.form.get('versao_plano_contas', '1.0'),
+            request.form.get('ignorar_zeros', 'false').lower() in ('1', 'true', 'sim', 'on')
+        )
+        
+        return jsonify(resultado), 200 if resultado['success'] else 400
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao importar balancete: {str(e)}'
+        }), 500
+
+@importacoes_bp.route('/importacoes/balancetes/lote', methods=['POST'])
+def importar_balancetes_lote():
+    """
+    Importa vários balancetes de uma vez, validando os arquivos em paralelo.
+    Formulário multipart: arquivos (vários), periodos (opcional, um por arquivo;
+    se omitido, inferido do nome do arquivo), versoes_balancete (opcional, uma por
+    arquivo) ou versao_balancete, versao_plano_contas, ignorar_zeros e processos.
+    """
+    try:
+        arquivos = [arquivo for arquivo in request.files.getlist('arquivos') if arquivo and arquivo.filename]
+        
+        if not arquivos:
+            return jsonify({
+                'success': False,
+                'message': 'Envie ao menos um arquivo de balancete'
+            }), 400
+        
+        periodos = request.form.getlist('periodos') or [None] * len(arquivos)
+        versoes = request.form.getlist('versoes_balancete') or [request.form.get('versao_balancete', '1.0')] * len(arquivos)
+        
+        if len(periodos) != len(arquivos) or len(versoes) != len(arquivos):
+            return jsonify({
+                'success': False,
+                'message': 'Informe um período e uma versão para cada arquivo (ou nenhum)'
+            }), 400
+        
+        processos = request.form.get('processos')
+        
+        # Os arquivos são gravados em disco para serem lidos pelos processos de validação
+        with tempfile.TemporaryDirectory(prefix='balancetes_') as diretorio:
+            lote = []
+            for indice, (arquivo, periodo, versao) in enumerate(zip(arquivos, periodos, versoes)):
+                caminho = os.path.join(diretorio, f'{indice:02d}_{secure_filename(arquivo.filename) or "arquivo"}')
+                arquivo.save(caminho)
+                lote.append({
+                    'caminho': caminho,
+                    'nome': arquivo.filename,
+                    'periodo': periodo or None,
+                    'versao_balancete': versao or '1.0'
+                })
+            
+            resultado = ImportacaoParalelaService.importar_arquivos(
+                lote,
+                request.form.get('versao_plano_contas', '1.0'),
+                request.form.get('ignorar_zeros', 'false').lower() in ('1', 'true', 'sim', 'on'),
+                int(processos) if processos else None
+            )
+        
+        return jsonify(resultado), 200 if resultado['success'] else 400
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao importar balancetes: {str(e)}'
+        }), 500
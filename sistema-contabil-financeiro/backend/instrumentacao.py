@@ -0,0 +1,442 @@
+"""
+Instrumentação leve das requisições e dos serviços: consultas SQL (quantidade,
+tempo e linhas lidas), tempo por serviço e por etapa do cálculo (carga dos saldos e
+do plano, consolidação, montagem da estrutura e gravação) e histogramas
+agregados no formato texto do Prometheus (rota GET /metrics).
+
+O custo por consulta é o de dois perf_counter e alguns incrementos (mais um
+por busca de linhas no cursor), de modo
+que a instrumentação pode ficar ligada em produção (configuração
+INSTRUMENTACAO, padrão True). Os histogramas são do processo: com vários
+workers, cada um expõe os seus.
+
+Uso:
+    Instrumentacao.init_app(app)          # medição por requisição
+    GET /api/demonstracoes/...?metricas=1 # resposta do serviço com 'metricas'
+    
+    with Instrumentacao.etapa('consolidacao'):
+        ...
+    
+    with Instrumentacao.medir(exibir=True):  # fora de requisições (CLI, scripts)
+        DFCService.gerar_dfc(...)
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import threading
+import time
+
+BUCKETS_TEMPO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BUCKETS_CONSULTAS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class Histograma:
+    """Histograma cumulativo por combinação de rótulos, no modelo do Prometheus"""
+    
+    def __init__(self, nome, descricao, rotulos, buckets):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = rotulos
+        self.buckets = buckets
+        self._series = {}
+    
+    def observar(self, valores_rotulos, valor):
+        serie = self._series.get(valores_rotulos)
+        if serie is None:
+            # Contagem por bucket (não cumulativa), soma e quantidade
+            serie = self._series[valores_rotulos] = [[0] * len(self.buckets), 0.0, 0]
+        
+        for indice, limite in enumerate(self.buckets):
+            if valor <= limite:
+                serie[0][indice] += 1
+                break
+        serie[1] += valor
+        serie[2] += 1
+    
+    def exportar(self):
+        linhas = [f'# HELP {self.nome} {self.descricao}', f'# TYPE {self.nome} histogram']
+        for valores_rotulos, (contagens, soma, quantidade) in sorted(self._series.items()):
+            rotulos = _formatar_rotulos(self.rotulos, valores_rotulos)
+            bucket = lambda limite: _formatar_rotulos(self.rotulos + ('le',), valores_rotulos + (limite,))
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, contagens):
+                acumulado += contagem
+                linhas.append(f'{self.nome}_bucket{bucket(limite)} {acumulado}')
+            linhas.append(f'{self.nome}_bucket{bucket("+Inf")} {quantidade}')
+            linhas.append(f'{self.nome}_sum{rotulos} {soma!r}')
+            linhas.append(f'{self.nome}_count{rotulos} {quantidade}')
+        return linhas
+
+class Contador:
+    """Contador monotônico sem rótulos"""
+    
+    def __init__(self, nome, descricao):
+        self.nome = nome
+        self.descricao = descricao
+        self.valor = 0
+    
+    def exportar(self):
+        return [f'# HELP {self.nome} {self.descricao}', f'# TYPE {self.nome} counter', f'{self.nome} {self.valor!r}']
+
+def _formatar_rotulos(nomes, valores):
+    if not nomes:
+        return ''
+    pares = []
+    for nome, valor in zip(nomes, valores):
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pares.append(f'{nome}="{valor}"')
+    return '{' + ','.join(pares) + '}'
+
+class RegistroMetricas:
+    """Métricas agregadas do processo, exportadas em GET /metrics"""
+    
+    _lock = threading.Lock()
+    
+    consultas = Contador('indicium_consultas_sql_total', 'Comandos SQL executados')
+    tempo_sql = Contador('indicium_consultas_sql_segundos_total', 'Tempo total dos comandos SQL')
+    linhas = Contador('indicium_linhas_sql_total', 'Linhas lidas dos resultados dos comandos SQL')
+    
+    requisicoes = Histograma(
+        'indicium_requisicao_duracao_segundos', 'Duração das requisições HTTP',
+        ('endpoint', 'metodo', 'status'), BUCKETS_TEMPO
+    )
+    consultas_requisicao = Histograma(
+        'indicium_requisicao_consultas_sql', 'Comandos SQL por requisição HTTP',
+        ('endpoint',), BUCKETS_CONSULTAS
+    )
+    servicos = Histograma(
+        'indicium_servico_duracao_segundos', 'Duração das chamadas de serviço',
+        ('servico',), BUCKETS_TEMPO
+    )
+    consultas_servico = Histograma(
+        'indicium_servico_consultas_sql', 'Comandos SQL por chamada de serviço',
+        ('servico',), BUCKETS_CONSULTAS
+    )
+    etapas = Histograma(
+        'indicium_etapa_duracao_segundos', 'Duração das etapas de cálculo (tempo próprio, sem subetapas)',
+        ('etapa',), BUCKETS_TEMPO
+    )
+    
+    @classmethod
+    def registrar_consulta(cls, duracao):
+        with cls._lock:
+            cls.consultas.valor += 1
+            cls.tempo_sql.valor += duracao
+    
+    @classmethod
+    def registrar_linhas(cls, linhas):
+        with cls._lock:
+            cls.linhas.valor += linhas
+    
+    @classmethod
+    def observar(cls, histograma, valores_rotulos, valor):
+        with cls._lock:
+            histograma.observar(valores_rotulos, valor)
+    
+    @classmethod
+    def exportar(cls):
+        """Texto no formato de exposição do Prometheus (versão 0.0.4)"""
+        with cls._lock:
+            linhas = []
+            for metrica in (cls.consultas, cls.tempo_sql, cls.linhas, cls.requisicoes, cls.consultas_requisicao,
+                            cls.servicos, cls.consultas_servico, cls.etapas):
+                linhas.extend(metrica.exportar())
+        return '\n'.join(linhas) + '\n'
+
+class Medicao:
+    """
+    Números de uma requisição (ou de uma chamada de serviço fora de requisições):
+    consultas, tempo de SQL, linhas lidas e, por etapa, tempo próprio, consultas
+    e linhas lidas. As threads do agendador de cálculo somam na mesma medição.
+    """
+    
+    def __init__(self, exibir=False):
+        self.exibir = exibir
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tempo_sql = 0.0
+        self.linhas = 0
+        self.etapas = {}
+        self._lock = threading.Lock()
+    
+    def _etapa(self, nome):
+        etapa = self.etapas.get(nome)
+        if etapa is None:
+            # tempo (s), consultas, linhas, execuções
+            etapa = self.etapas[nome] = [0.0, 0, 0, 0]
+        return etapa
+    
+    def registrar_consulta(self, duracao, nome_etapa):
+        with self._lock:
+            self.consultas += 1
+            self.tempo_sql += duracao
+            if nome_etapa is not None:
+                self._etapa(nome_etapa)[1] += 1
+    
+    def registrar_linhas(self, linhas, nome_etapa):
+        with self._lock:
+            self.linhas += linhas
+            if nome_etapa is not None:
+                self._etapa(nome_etapa)[2] += linhas
+    
+    def somar_tempo_etapa(self, nome, duracao, execucao=False):
+        with self._lock:
+            etapa = self._etapa(nome)
+            etapa[0] += duracao
+            if execucao:
+                etapa[3] += 1
+    
+    def resumo(self):
+        """
+        Dicionário exibível: tempos em ms. Com cálculos em paralelo, o tempo das
+        etapas soma o das threads e pode passar do tempo total.
+        """
+        with self._lock:
+            return {
+                'tempo_ms': round((time.perf_counter() - self.inicio) * 1000, 3),
+                'consultas': self.consultas,
+                'tempo_sql_ms': round(self.tempo_sql * 1000, 3),
+                'linhas': self.linhas,
+                'etapas': {
+                    nome: {
+                        'tempo_ms': round(tempo * 1000, 3),
+                        'consultas': consultas,
+                        'linhas': linhas,
+                        'execucoes': execucoes
+                    }
+                    for nome, (tempo, consultas, linhas, execucoes) in self.etapas.items()
+                }
+            }
+
+class _Escopo:
+    """Medição ativa no contexto atual e pilha de etapas abertas (própria de cada thread)"""
+    __slots__ = ('medicao', 'pilha', 'servicos')
+    
+    def __init__(self, medicao):
+        self.medicao = medicao
+        # Itens [nome, início do trecho atual, tempo próprio acumulado]
+        self.pilha = []
+        self.servicos = 0
+
+_escopo_atual = ContextVar('indicium_instrumentacao', default=None)
+
+class Instrumentacao:
+    
+    habilitada = True
+    
+    @staticmethod
+    def init_app(app):
+        """
+        Mede cada requisição (histogramas por endpoint e cabeçalho Server-Timing).
+        Com ?metricas=1, os serviços anexam o resumo da medição à resposta.
+        """
+        from flask import g, request
+        
+        Instrumentacao.habilitada = app.config.get('INSTRUMENTACAO', True)
+        
+        @app.before_request
+        def _iniciar_medicao():
+            if Instrumentacao.habilitada:
+                exibir = request.args.get('metricas', 'false').lower() in ('1', 'true', 'sim')
+                g.medicao_token = _escopo_atual.set(_Escopo(Medicao(exibir)))
+        
+        @app.after_request
+        def _finalizar_medicao(resposta):
+            escopo = _escopo_atual.get()
+            if escopo is None or 'medicao_token' not in g:
+                return resposta
+            
+            medicao = escopo.medicao
+            endpoint = request.endpoint or 'desconhecido'
+            duracao = time.perf_counter() - medicao.inicio
+            RegistroMetricas.observar(
+                RegistroMetricas.requisicoes, (endpoint, request.method, str(resposta.status_code)), duracao
+            )
+            RegistroMetricas.observar(RegistroMetricas.consultas_requisicao, (endpoint,), medicao.consultas)
+            
+            temporizacoes = [f'total;dur={duracao * 1000:.1f}', f'sql;dur={medicao.tempo_sql * 1000:.1f};desc="{medicao.consultas} consultas"']
+            for nome, (tempo, consultas, linhas, execucoes) in medicao.etapas.items():
+                temporizacoes.append(f'{nome};dur={tempo * 1000:.1f}')
+            resposta.headers['Server-Timing'] = ', '.join(temporizacoes)
+            return resposta
+        
+        @app.teardown_request
+        def _encerrar_medicao(erro=None):
+            token = g.pop('medicao_token', None)
+            if token is not None:
+                _escopo_atual.reset(token)
+    
+    @staticmethod
+    def atual():
+        """Medição ativa no contexto atual (ou None)"""
+        escopo = _escopo_atual.get()
+        return escopo.medicao if escopo else None
+    
+    @staticmethod
+    @contextmanager
+    def medir(exibir=False):
+        """Ativa uma medição fora de requisições (scripts, tarefas em segundo plano)"""
+        token = _escopo_atual.set(_Escopo(Medicao(exibir)))
+        try:
+            yield _escopo_atual.get().medicao
+        finally:
+            _escopo_atual.reset(token)
+    
+    @staticmethod
+    @contextmanager
+    def etapa(nome):
+        """
+        Mede uma etapa do cálculo. O tempo de subetapas é descontado da etapa
+        externa e as consultas são atribuídas à etapa mais interna.
+        """
+        escopo = _escopo_atual.get()
+        if escopo is None:
+            yield
+            return
+        
+        agora = time.perf_counter()
+        pilha = escopo.pilha
+        if pilha:
+            externa = pilha[-1]
+            externa[2] += agora - externa[1]
+            escopo.medicao.somar_tempo_etapa(externa[0], agora - externa[1])
+        item = [nome, agora, 0.0]
+        pilha.append(item)
+        try:
+            yield
+        finally:
+            agora = time.perf_counter()
+            pilha.pop()
+            item[2] += agora - item[1]
+            escopo.medicao.somar_tempo_etapa(nome, agora - item[1], execucao=True)
+            RegistroMetricas.observar(RegistroMetricas.etapas, (nome,), item[2])
+            if pilha:
+                pilha[-1][1] = agora
+    
+    @staticmethod
+    def servico(nome):
+        """
+        Decorador dos métodos de serviço: histograma de duração e de consultas por
+        serviço. A chamada mais externa cria a medição se não houver uma (fora de
+        requisições) e, se a medição pede exibição, anexa 'metricas' ao
+        dicionário retornado.
+        """
+        def decorador(funcao):
+            @wraps(funcao)
+            def executar(*args, **kwargs):
+                if not Instrumentacao.habilitada:
+                    return funcao(*args, **kwargs)
+                
+                escopo = _escopo_atual.get()
+                token = None
+                if escopo is None:
+                    escopo = _Escopo(Medicao())
+                    token = _escopo_atual.set(escopo)
+                
+                medicao = escopo.medicao
+                inicio = time.perf_counter()
+                consultas_inicio = medicao.consultas
+                escopo.servicos += 1
+                try:
+                    resultado = funcao(*args, **kwargs)
+                finally:
+                    escopo.servicos -= 1
+                    RegistroMetricas.observar(RegistroMetricas.servicos, (nome,), time.perf_counter() - inicio)
+                    RegistroMetricas.observar(RegistroMetricas.consultas_servico, (nome,), medicao.consultas - consultas_inicio)
+                    if token is not None:
+                        _escopo_atual.reset(token)
+                
+                if medicao.exibir and escopo.servicos == 0 and isinstance(resultado, dict):
+                    resultado['metricas'] = medicao.resumo()
+                return resultado
+            return executar
+        return decorador
+    
+    @staticmethod
+    def vincular(funcao):
+        """
+        Função que executa funcao() na medição do contexto atual, com pilha de
+        etapas própria (para threads, ex.: os nós do AgendadorCalculo)
+        """
+        medicao = Instrumentacao.atual()
+        if medicao is None:
+            return funcao
+        
+        def executar():
+            escopo = _Escopo(medicao)
+            # Os serviços chamados na thread fazem parte de uma chamada externa
+            escopo.servicos = 1
+            token = _escopo_atual.set(escopo)
+            try:
+                return funcao()
+            finally:
+                _escopo_atual.reset(token)
+        return executar
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _iniciar_consulta(conexao, cursor, comando, parametros, contexto, executemany):
+    if Instrumentacao.habilitada and contexto is not None:
+        contexto._inicio_instrumentacao = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _registrar_consulta(conexao, cursor, comando, parametros, contexto, executemany):
+    inicio = getattr(contexto, '_inicio_instrumentacao', None)
+    if inicio is None:
+        return
+    
+    duracao = time.perf_counter() - inicio
+    RegistroMetricas.registrar_consulta(duracao)
+    
+    escopo = _escopo_atual.get()
+    if escopo is not None:
+        escopo.medicao.registrar_consulta(duracao, escopo.pilha[-1][0] if escopo.pilha else None)
+    
+    # Comandos que retornam linhas: o resultado passa a buscá-las pelo cursor
+    # contador (o rowcount dos SELECTs não é informado por todos os drivers)
+    if cursor.description is not None and contexto.cursor is cursor:
+        contexto.cursor = _CursorContado(cursor)
+
+def _registrar_linhas(linhas):
+    RegistroMetricas.registrar_linhas(linhas)
+    
+    escopo = _escopo_atual.get()
+    if escopo is not None:
+        escopo.medicao.registrar_linhas(linhas, escopo.pilha[-1][0] if escopo.pilha else None)
+
+class _CursorContado:
+    """
+    Cursor do driver que soma as linhas buscadas na medição ativa no momento da
+    busca (leituras em lote são contadas na etapa que as percorre)
+    """
+    __slots__ = ('_cursor',)
+    
+    def __init__(self, cursor):
+        object.__setattr__(self, '_cursor', cursor)
+    
+    def fetchone(self):
+        linha = self._cursor.fetchone()
+        if linha is not None:
+            _registrar_linhas(1)
+        return linha
+    
+    def fetchmany(self, *args, **kwargs):
+        linhas = self._cursor.fetchmany(*args, **kwargs)
+        if linhas:
+            _registrar_linhas(len(linhas))
+        return linhas
+    
+    def fetchall(self):
+        linhas = self._cursor.fetchall()
+        if linhas:
+            _registrar_linhas(len(linhas))
+        return linhas
+    
+    def __iter__(self):
+        return iter(self.fetchone, None)
+    
+    def __getattr__(self, nome):
+        return getattr(self._cursor, nome)
+    
+    def __setattr__(self, nome, valor):
+        setattr(self._cursor, nome, valor)
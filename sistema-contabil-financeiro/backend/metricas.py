@@ -0,0 +1,12 @@
+from flask import Blueprint, Response
+from src.services.instrumentacao import RegistroMetricas
+
+metricas_bp = Blueprint('metricas', __name__)
+
+@metricas_bp.route('/metrics', methods=['GET'])
+def exportar_metricas():
+    """
+    Histogramas e contadores do processo no formato texto do Prometheus
+    (requisições, serviços, etapas de cálculo e consultas SQL)
+    """
+    return Response(RegistroMetricas.exportar(), mimetype='text/plain; version=0.0.4; charset=utf-8')
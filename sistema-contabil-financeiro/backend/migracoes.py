@@ -0,0 +1,122 @@
+from src.models.user import db
+from src.models.plano_contas import PlanoContas, PlanoContasTag
+from src.models.demonstracoes import DemonstracaoFinanceira, LinhaDemonstracao
+from sqlalchemy import func, inspect, or_, select, text
+
+# Colunas adicionadas aos modelos depois da criação das tabelas: (tabela, coluna,
+# tipo SQL; None usa o tipo da coluna do modelo no banco em uso)
+COLUNAS_ADICIONADAS = [
+    ('plano_contas', 'caminho', 'VARCHAR(255)'),
+    ('demonstracao_financeira', 'assinatura_entrada', 'VARCHAR(64)'),
+    ('demonstracao_financeira', 'dados_binario', None),
+    ('demonstracao_financeira', 'formato_dados', 'VARCHAR(20)'),
+]
+
+def aplicar_migracoes():
+    """
+    Atualiza um banco existente para o esquema atual dos modelos.
+    Deve ser chamada após db.create_all(), dentro do contexto da aplicação.
+    Retorna a lista de alterações aplicadas.
+    """
+    inspetor = inspect(db.engine)
+    aplicadas = []
+    
+    # Adicionar colunas que db.create_all() não cria em tabelas existentes
+    for tabela, coluna, tipo in COLUNAS_ADICIONADAS:
+        colunas_existentes = {c['name'] for c in inspetor.get_columns(tabela)}
+        if coluna not in colunas_existentes:
+            if tipo is None:
+                tipo = db.metadata.tables[tabela].columns[coluna].type.compile(dialect=db.engine.dialect)
+            db.session.execute(text(f'ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}'))
+            aplicadas.append(f'coluna {tabela}.{coluna}')
+    db.session.commit()
+    
+    # Criar os índices declarados nos modelos que ainda não existem
+    for tabela in db.metadata.sorted_tables:
+        indices_existentes = {i['name'] for i in inspect(db.engine).get_indexes(tabela.name)}
+        for indice in tabela.indexes:
+            if indice.name not in indices_existentes:
+                if indice.unique:
+                    duplicadas = _contar_duplicatas(tabela, indice)
+                    if duplicadas:
+                        # Nada é apagado automaticamente: o índice fica para quando
+                        # as duplicatas forem resolvidas manualmente
+                        aplicadas.append(
+                            f'índice único {indice.name} não criado: {duplicadas} chaves '
+                            f'duplicadas em {tabela.name}'
+                        )
+                        continue
+                indice.create(bind=db.engine)
+                aplicadas.append(f'índice {indice.name}')
+    
+    # Materializar o caminho das contas já cadastradas e corrigir os que não
+    # correspondem mais a conta_pai_id (ex.: pai trocado só pelo id)
+    versoes = [v for (v,) in db.session.query(PlanoContas.versao).distinct()]
+    corrigidos = sum(PlanoContas.reconstruir_caminhos(versao) for versao in versoes)
+    db.session.commit()
+    if corrigidos and 'coluna plano_contas.caminho' not in aplicadas:
+        aplicadas.append(f'{corrigidos} caminhos de contas corrigidos')
+    
+    # Classificar as contas já cadastradas (tabela de tags recém-criada)
+    if db.session.query(PlanoContasTag.id).first() is None and db.session.query(PlanoContas.id).first() is not None:
+        total_tags = 0
+        versoes = [v for (v,) in db.session.query(PlanoContas.versao).distinct()]
+        for versao in versoes:
+            total_tags += PlanoContasTag.reconstruir(versao)
+        db.session.commit()
+        aplicadas.append(f'{total_tags} tags de classificação do plano de contas')
+    
+    # Extrair as linhas das demonstrações já gravadas (tabela de linhas recém-criada)
+    if (db.session.query(LinhaDemonstracao.id).first() is None
+            and db.session.query(DemonstracaoFinanceira.id).first() is not None):
+        total_demonstracoes = _percorrer_demonstracoes(lambda demonstracao: demonstracao.reconstruir_linhas())
+        aplicadas.append(f'linhas de {total_demonstracoes} demonstrações gravadas')
+    
+    return aplicadas
+
+def compactar_demonstracoes(lote=200):
+    """
+    Regrava no formato configurado (FORMATO_DADOS_DEMONSTRACOES, ver
+    codificacao_dados) as demonstrações ainda gravadas como texto JSON, trocando
+    as cópias embutidas por referências.
+    Não é executada por aplicar_migracoes: pode ser demorada em bancos grandes.
+    No SQLite, execute VACUUM depois para reduzir o arquivo. Retorna a quantidade
+    de demonstrações regravadas.
+    """
+    return _percorrer_demonstracoes(
+        lambda demonstracao: demonstracao.definir_dados(demonstracao.get_dados()),
+        or_(DemonstracaoFinanceira.formato_dados.is_(None), DemonstracaoFinanceira.formato_dados == 'json'),
+        lote
+    )
+
+def _percorrer_demonstracoes(acao, filtro=None, lote=200):
+    """Aplica acao às demonstrações (em lotes por id, um commit por lote) e retorna a quantidade"""
+    total = 0
+    ultimo_id = 0
+    
+    while True:
+        consulta = DemonstracaoFinanceira.query.filter(DemonstracaoFinanceira.id > ultimo_id)
+        if filtro is not None:
+            consulta = consulta.filter(filtro)
+        demonstracoes = consulta.order_by(DemonstracaoFinanceira.id).limit(lote).all()
+        
+        if not demonstracoes:
+            return total
+        
+        for demonstracao in demonstracoes:
+            acao(demonstracao)
+        db.session.commit()
+        
+        total += len(demonstracoes)
+        ultimo_id = demonstracoes[-1].id
+
+def _contar_duplicatas(tabela, indice):
+    """
+    Quantidade de chaves que violariam um índice único (linhas com alguma coluna
+    nula não conflitam no índice e ficam de fora)
+    """
+    colunas = list(indice.columns)
+    chaves = select(*colunas).where(
+        *(coluna.isnot(None) for coluna in colunas)
+    ).group_by(*colunas).having(func.count() > 1).subquery()
+    return db.session.execute(select(func.count()).select_from(chaves)).scalar()
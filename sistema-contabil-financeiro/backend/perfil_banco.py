@@ -0,0 +1,162 @@
+"""
+Perfil de ajuste do banco para produção.
+
+SQLite: em cada conexão, WAL (leituras não bloqueiam a escrita de uma
+importação), synchronous=NORMAL, mmap_size, cache_size e busy_timeout (espera
+em vez de "database is locked" quando duas escritas concorrem).
+
+PostgreSQL: pool de conexões dimensionado, pre-ping (descarta conexões
+derrubadas pelo servidor), reciclagem, statement_timeout e nome da aplicação.
+
+Leituras em massa (saldos do balancete, plano de contas) usam leitura_em_lote:
+cursor do lado do servidor no PostgreSQL e busca em lotes nos demais bancos.
+
+Uso (as opções do engine precisam estar na configuração antes de db.init_app):
+    PerfilBanco.configurar(app)
+    db.init_app(app)
+    PerfilBanco.init_app(app)
+
+Processos fora do servidor web (trabalhadores, linha de comando, benchmarks)
+usam criar_app(uri), que aplica o perfil e o roteamento de leitura.
+
+Configuração do app (todas opcionais):
+    PERFIL_BANCO                 'producao' (padrão) ou 'padrao' (sem ajustes)
+    BANCO_SQLITE_PRAGMAS         PRAGMAs que substituem/complementam PRAGMAS_SQLITE
+    BANCO_POOL_SIZE              conexões mantidas no pool (PostgreSQL, padrão 10)
+    BANCO_MAX_OVERFLOW           conexões extras em picos (padrão 20)
+    BANCO_POOL_TIMEOUT           espera por uma conexão livre, em s (padrão 30)
+    BANCO_POOL_RECYCLE           idade máxima de uma conexão, em s (padrão 1800)
+    BANCO_STATEMENT_TIMEOUT_MS   limite de duração de um comando (padrão 60000)
+    BANCO_LOTE_LEITURA           linhas por lote nas leituras em massa (padrão 5000)
+SQLALCHEMY_ENGINE_OPTIONS informadas explicitamente prevalecem sobre o perfil.
+"""
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+class PerfilBanco:
+    
+    PRAGMAS_SQLITE = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 268435456,  # 256 MB
+        'cache_size': -65536,  # 64 MB (valor negativo: em KiB)
+        'busy_timeout': 30000,  # ms
+        'temp_store': 'MEMORY'
+    }
+    
+    POOL_SIZE = 10
+    MAX_OVERFLOW = 20
+    POOL_TIMEOUT = 30
+    POOL_RECYCLE = 1800
+    STATEMENT_TIMEOUT_MS = 60000
+    
+    # Linhas por lote nas leituras em massa (ver leitura_em_lote)
+    LOTE_LEITURA = 5000
+    
+    @staticmethod
+    def configurar(app):
+        """
+        Grava em SQLALCHEMY_ENGINE_OPTIONS as opções do perfil para o banco da
+        URI configurada. Chamar antes de db.init_app.
+        """
+        if app.config.get('PERFIL_BANCO', 'producao') != 'producao':
+            return
+        
+        PerfilBanco.LOTE_LEITURA = app.config.get('BANCO_LOTE_LEITURA', PerfilBanco.LOTE_LEITURA)
+        uri = app.config.get('SQLALCHEMY_DATABASE_URI')
+        if not uri:
+            return
+        
+        opcoes = PerfilBanco.opcoes_engine(uri, app.config)
+        opcoes.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = opcoes
+    
+    @staticmethod
+    def opcoes_engine(uri, config=None):
+        """Opções de create_engine do perfil para a URI"""
+        config = config or {}
+        backend = make_url(uri).get_backend_name()
+        
+        if backend == 'sqlite':
+            # Espera do driver por um lock (s), coerente com o busy_timeout
+            pragmas = PerfilBanco.pragmas_sqlite(config)
+            return {'connect_args': {'timeout': pragmas.get('busy_timeout', 30000) / 1000}}
+        
+        if backend == 'postgresql':
+            statement_timeout = config.get('BANCO_STATEMENT_TIMEOUT_MS', PerfilBanco.STATEMENT_TIMEOUT_MS)
+            return {
+                'pool_size': config.get('BANCO_POOL_SIZE', PerfilBanco.POOL_SIZE),
+                'max_overflow': config.get('BANCO_MAX_OVERFLOW', PerfilBanco.MAX_OVERFLOW),
+                'pool_timeout': config.get('BANCO_POOL_TIMEOUT', PerfilBanco.POOL_TIMEOUT),
+                'pool_recycle': config.get('BANCO_POOL_RECYCLE', PerfilBanco.POOL_RECYCLE),
+                'pool_pre_ping': True,
+                'connect_args': {
+                    'application_name': 'indicium360',
+                    'options': f'-c statement_timeout={int(statement_timeout)}'
+                }
+            }
+        
+        return {'pool_pre_ping': True}
+    
+    @staticmethod
+    def pragmas_sqlite(config=None):
+        pragmas = dict(PerfilBanco.PRAGMAS_SQLITE)
+        pragmas.update((config or {}).get('BANCO_SQLITE_PRAGMAS') or {})
+        return pragmas
+    
+    @staticmethod
+    def init_app(app):
+        """Aplica os PRAGMAs do SQLite em cada nova conexão do engine do app. Chamar após db.init_app."""
+        from src.models.user import db
+        
+        if app.config.get('PERFIL_BANCO', 'producao') != 'producao':
+            return
+        
+        with app.app_context():
+            PerfilBanco.aplicar_sqlite(db.engine, PerfilBanco.pragmas_sqlite(app.config))
+    
+    @staticmethod
+    def aplicar_sqlite(engine, pragmas=None):
+        """Registra os PRAGMAs nas conexões do engine (sem efeito em outros bancos)"""
+        if engine.dialect.name != 'sqlite' or getattr(engine, '_perfil_banco', False):
+            return
+        engine._perfil_banco = True
+        pragmas = PerfilBanco.PRAGMAS_SQLITE if pragmas is None else pragmas
+        
+        @event.listens_for(engine, 'connect')
+        def _aplicar_pragmas(conexao_dbapi, registro):
+            cursor = conexao_dbapi.cursor()
+            try:
+                for nome, valor in pragmas.items():
+                    cursor.execute(f'PRAGMA {nome}={valor}')
+            finally:
+                cursor.close()
+
+def criar_app(uri, config=None):
+    """
+    App Flask mínimo para os processos fora do servidor web, com o mesmo perfil
+    do banco (PerfilBanco) e roteamento de leitura (Roteamento) da aplicação
+    """
+    from src.models.user import db
+    from src.models.roteamento import Roteamento
+    
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config.update(config or {})
+    
+    PerfilBanco.configurar(app)
+    Roteamento.configurar(app)
+    db.init_app(app)
+    PerfilBanco.init_app(app)
+    Roteamento.init_app(app)
+    return app
+
+def leitura_em_lote(consulta):
+    """
+    Consulta ORM que busca as linhas em lotes de PerfilBanco.LOTE_LEITURA; no
+    PostgreSQL, com cursor do lado do servidor (stream_results). Deve ser
+    percorrida uma única vez, até o fim.
+    """
+    return consulta.yield_per(PerfilBanco.LOTE_LEITURA)
@@ -1,6 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from src.models.user import db
 from datetime import datetime
+from sqlalchemy import event, func, inspect, literal
+
+# Separador do caminho materializado (ex.: '/1/1.1/1.1.01/')
+SEPARADOR_CAMINHO = '/'
 
 class PlanoContas(db.Model):
     __tablename__ = 'plano_contas'
@@ -17,6 +21,7 @@ class PlanoContas(db.Model):
     ativo = db.Column(db.Boolean, default=True)
     data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
     data_atualizacao = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    caminho = db.Column(db.String(255), index=True)  # Caminho materializado com os códigos da raiz até a conta
     
     # Relacionamentos
     conta_pai = db.relationship('PlanoContas', remote_side=[id], backref='contas_filhas')
@@ -40,6 +45,66 @@ class PlanoContas(db.Model):
             'data_atualizacao': self.data_atualizacao.isoformat() if self.data_atualizacao else None
         }
     
+    def get_codigos_ancestrais(self):
+        """
+        Códigos dos ancestrais da conta, da raiz (nível 1) até o pai imediato
+        """
+        if self.caminho:
+            return self.caminho.strip(SEPARADOR_CAMINHO).split(SEPARADOR_CAMINHO)[:-1]
+        
+        # Caminho ainda não materializado: percorrer a hierarquia
+        codigos = []
+        conta_atual = self.conta_pai
+        while conta_atual:
+            codigos.insert(0, conta_atual.codigo)
+            conta_atual = conta_atual.conta_pai
+        return codigos
+    
+    def get_ancestral_nivel(self, nivel):
+        """
+        Código do ancestral no nível informado (1 = raiz), ou None se não houver
+        """
+        ancestrais = self.get_codigos_ancestrais()
+        return ancestrais[nivel - 1] if len(ancestrais) >= nivel else None
+    
+    @classmethod
+    def montar_caminho(cls, codigo, caminho_pai=None):
+        """Monta o caminho materializado de uma conta a partir do caminho do pai"""
+        return f'{caminho_pai or SEPARADOR_CAMINHO}{codigo}{SEPARADOR_CAMINHO}'
+    
+    @classmethod
+    def reconstruir_caminhos(cls, versao='1.0'):
+        """
+        Recalcula o caminho materializado de todas as contas de uma versão.
+        Usado após importações em lote, que não disparam os eventos do ORM.
+        Retorna a quantidade de contas atualizadas (sem commit).
+        """
+        contas = db.session.query(cls.id, cls.codigo, cls.conta_pai_id, cls.caminho).filter_by(versao=versao).all()
+        por_id = {conta.id: conta for conta in contas}
+        caminhos = {}
+        
+        def caminho_de(conta_id, visitados=()):
+            if conta_id not in caminhos:
+                conta = por_id[conta_id]
+                pai_id = conta.conta_pai_id
+                if pai_id in por_id and pai_id not in visitados:
+                    caminho_pai = caminho_de(pai_id, visitados + (conta_id,))
+                else:
+                    caminho_pai = None
+                caminhos[conta_id] = cls.montar_caminho(conta.codigo, caminho_pai)
+            return caminhos[conta_id]
+        
+        alteracoes = []
+        for conta in contas:
+            caminho = caminho_de(conta.id)
+            if caminho != conta.caminho:
+                alteracoes.append({'id': conta.id, 'caminho': caminho})
+        
+        if alteracoes:
+            db.session.execute(db.update(cls), alteracoes)
+        
+        return len(alteracoes)
+    
     @classmethod
     def get_by_codigo(cls, codigo, versao='1.0'):
         return cls.query.filter_by(codigo=codigo, versao=versao, ativo=True).first()
@@ -52,3 +117,185 @@ class PlanoContas(db.Model):
     def get_contas_por_elemento(cls, elemento_conta, versao='1.0'):
         return cls.query.filter_by(elemento_conta=elemento_conta, versao=versao, ativo=True).all()
 
+
+# Regras de classificação das contas pelo nome: tag -> (elementos aceitos, padrões LIKE).
+# A conta recebe a tag quando o elemento é aceito (None = qualquer) e o nome,
+# sem distinção de maiúsculas, corresponde a algum dos padrões ('%' = qualquer trecho).
+REGRAS_TAGS = {
+    # Caixa e equivalentes / circulante (DFC)
+    'caixa': (None, ('%caixa%', '%banco%')),
+    'circulante': (None, ('%circulante%',)),
+    'nao_circulante': (None, ('%não circulante%',)),
+    # Itens que não afetam o caixa (DFC e DVA)
+    'depreciacao': (None, ('%depreciação%',)),
+    'amortizacao': (None, ('%amortização%',)),
+    'exaustao': (None, ('%exaustão%',)),
+    'provisao': (None, ('%provisão%',)),
+    # Geração e distribuição do valor adicionado (DVA)
+    'financeira': (None, ('%financeira%',)),
+    'insumo_terceiros': (('despesa',), (
+        '%material%', '%energia%', '%telefone%', '%água%', '%combustível%',
+        '%manutenção%', '%terceirizado%', '%consultoria%', '%auditoria%'
+    )),
+    'pessoal': (('despesa',), ('%salário%', '%encargo%', '%benefício%', '%férias%', '%13º%')),
+    'impostos': (('despesa',), ('%imposto%', '%taxa%', '%contribuição%', '%tributo%')),
+    'capital_terceiros': (('despesa',), ('%juro%', '%aluguel%', '%financeira%')),
+    # Outros resultados abrangentes (DRA)
+    'ajuste_conversao': (None, ('%ajuste%conversão%',)),
+    'ajuste_avaliacao': (None, ('%ajuste%avaliação%',)),
+    # Colunas da DMPL
+    'dmpl_capital_social': (('patrimonio_liquido',), ('%capital%', '%social%')),
+    'dmpl_reservas_capital': (('patrimonio_liquido',), ('%reserva%', '%capital%', '%ágio%', '%agio%')),
+    'dmpl_reservas_lucros': (('patrimonio_liquido',), ('%reserva%', '%lucro%', '%legal%', '%estatutária%')),
+    'dmpl_lucros_acumulados': (('patrimonio_liquido',), ('%lucro%', '%acumulado%', '%prejuízo%')),
+    'dmpl_ajustes_avaliacao': (('patrimonio_liquido',), ('%ajuste%', '%avaliação%', '%patrimonial%'))
+}
+
+
+def _corresponde_padrao(nome_lower, padrao):
+    """Verifica se o nome corresponde a um padrão LIKE com '%' (trechos na ordem)"""
+    trechos = padrao.lower().split('%')
+    inicio = trechos[0]
+    fim = trechos[-1]
+    if not nome_lower.startswith(inicio) or not nome_lower.endswith(fim) or len(nome_lower) < len(inicio) + len(fim):
+        return False
+    posicao = len(inicio)
+    limite = len(nome_lower) - len(fim)
+    for trecho in trechos[1:-1]:
+        posicao = nome_lower.find(trecho, posicao, limite)
+        if posicao < 0:
+            return False
+        posicao += len(trecho)
+    return True
+
+
+class PlanoContasTag(db.Model):
+    """
+    Classificação persistida das contas (caixa, circulante, depreciação, pessoal,
+    colunas da DMPL...), calculada quando a conta é gravada a partir de REGRAS_TAGS.
+    Substitui as buscas por nome (ILIKE '%...%') feitas a cada demonstração.
+    """
+    __tablename__ = 'plano_contas_tag'
+    __table_args__ = (
+        db.Index('uq_plano_contas_tag_conta_tag', 'plano_contas_id', 'tag', unique=True),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    plano_contas_id = db.Column(db.Integer, db.ForeignKey('plano_contas.id'), nullable=False)
+    tag = db.Column(db.String(50), nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<PlanoContasTag {self.plano_contas_id} - {self.tag}>'
+    
+    @staticmethod
+    def calcular_tags(nome, elemento_conta):
+        """Tags de uma conta segundo REGRAS_TAGS"""
+        nome_lower = (nome or '').lower()
+        return [
+            tag for tag, (elementos, padroes) in REGRAS_TAGS.items()
+            if (elementos is None or elemento_conta in elementos)
+            and any(_corresponde_padrao(nome_lower, padrao) for padrao in padroes)
+        ]
+    
+    @classmethod
+    def get_tags(cls, plano_contas_id):
+        return [tag for (tag,) in db.session.query(cls.tag).filter_by(plano_contas_id=plano_contas_id).order_by(cls.tag)]
+    
+    @classmethod
+    def reconstruir(cls, versao='1.0'):
+        """
+        Recalcula as tags de todas as contas de uma versão.
+        Usado após importações em lote, que não disparam os eventos do ORM.
+        Retorna a quantidade de tags gravadas (sem commit).
+        """
+        contas = db.session.query(PlanoContas.id, PlanoContas.nome, PlanoContas.elemento_conta).filter_by(versao=versao).all()
+        ids = [conta.id for conta in contas]
+        
+        for inicio in range(0, len(ids), 500):
+            db.session.execute(db.delete(cls).where(cls.plano_contas_id.in_(ids[inicio:inicio + 500])))
+        
+        linhas = [
+            {'plano_contas_id': conta.id, 'tag': tag}
+            for conta in contas for tag in cls.calcular_tags(conta.nome, conta.elemento_conta)
+        ]
+        if linhas:
+            db.session.execute(db.insert(cls), linhas)
+        
+        # Descarta o plano em cache da versão no commit (ver plano_contas_cache)
+        db.session.info.setdefault('versoes_plano_alteradas', set()).add(versao)
+        
+        return len(linhas)
+
+
+def _obter_caminho_pai(conexao, conta):
+    """
+    Caminho do pai da conta, sem disparar carregamentos durante o flush. O pai
+    já carregado só vale se ainda corresponder a conta_pai_id (que pode ter sido
+    alterado diretamente, sem passar pelo relacionamento).
+    """
+    conta_pai = conta.__dict__.get('conta_pai')
+    if conta_pai is not None and (conta_pai.id is None or conta_pai.id == conta.conta_pai_id):
+        return conta_pai.caminho
+    if conta.conta_pai_id is None:
+        return None
+    tabela = PlanoContas.__table__
+    return conexao.execute(
+        db.select(tabela.c.caminho).where(tabela.c.id == conta.conta_pai_id)
+    ).scalar()
+
+
+@event.listens_for(PlanoContas, 'before_insert')
+def _definir_caminho_insercao(mapper, conexao, conta):
+    conta.caminho = PlanoContas.montar_caminho(conta.codigo, _obter_caminho_pai(conexao, conta))
+
+
+@event.listens_for(PlanoContas, 'before_update')
+def _definir_caminho_atualizacao(mapper, conexao, conta):
+    caminho = PlanoContas.montar_caminho(conta.codigo, _obter_caminho_pai(conexao, conta))
+    if caminho != conta.caminho:
+        conta._caminho_anterior = conta.caminho
+        conta.caminho = caminho
+
+
+@event.listens_for(PlanoContas, 'after_update')
+def _propagar_caminho_descendentes(mapper, conexao, conta):
+    """Reescreve o prefixo do caminho dos descendentes quando a conta muda de código ou de pai"""
+    caminho_anterior = conta.__dict__.pop('_caminho_anterior', None)
+    if not caminho_anterior:
+        return
+    tabela = PlanoContas.__table__
+    conexao.execute(
+        tabela.update()
+        .where(
+            tabela.c.versao == conta.versao,
+            tabela.c.id != conta.id,
+            tabela.c.caminho.startswith(caminho_anterior, autoescape=True)
+        )
+        .values(caminho=literal(conta.caminho) + func.substr(tabela.c.caminho, len(caminho_anterior) + 1))
+    )
+
+
+def _gravar_tags(conexao, conta):
+    tabela = PlanoContasTag.__table__
+    conexao.execute(tabela.delete().where(tabela.c.plano_contas_id == conta.id))
+    tags = PlanoContasTag.calcular_tags(conta.nome, conta.elemento_conta)
+    if tags:
+        conexao.execute(tabela.insert(), [{'plano_contas_id': conta.id, 'tag': tag} for tag in tags])
+
+
+@event.listens_for(PlanoContas, 'after_insert')
+def _classificar_conta_insercao(mapper, conexao, conta):
+    _gravar_tags(conexao, conta)
+
+
+@event.listens_for(PlanoContas, 'after_update')
+def _classificar_conta_atualizacao(mapper, conexao, conta):
+    estado = inspect(conta)
+    if estado.attrs.nome.history.has_changes() or estado.attrs.elemento_conta.history.has_changes():
+        _gravar_tags(conexao, conta)
+
+
+@event.listens_for(PlanoContas, 'before_delete')
+def _remover_tags_conta(mapper, conexao, conta):
+    tabela = PlanoContasTag.__table__
+    conexao.execute(tabela.delete().where(tabela.c.plano_contas_id == conta.id))
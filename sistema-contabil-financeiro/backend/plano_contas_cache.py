@@ -0,0 +1,294 @@
+from src.models.plano_contas import PlanoContas, PlanoContasTag, SEPARADOR_CAMINHO
+from src.models.user import db
+from src.models.perfil_banco import leitura_em_lote
+from src.models.roteamento import Roteamento
+from src.services.instrumentacao import Instrumentacao
+from array import array
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+import threading
+import time
+
+class ContaPlano:
+    """
+    Visão somente leitura de uma conta do plano em cache.
+    Expõe os mesmos atributos usados pelos serviços no modelo PlanoContas.
+    """
+    __slots__ = ('_plano', '_indice')
+    
+    def __init__(self, plano, indice):
+        self._plano = plano
+        self._indice = indice
+    
+    @property
+    def id(self):
+        return self._plano.ids[self._indice]
+    
+    @property
+    def codigo(self):
+        return self._plano.codigos[self._indice]
+    
+    @property
+    def nome(self):
+        return self._plano.nomes[self._indice]
+    
+    @property
+    def tipo_conta(self):
+        return self._plano.tipos_conta[self._indice]
+    
+    @property
+    def elemento_conta(self):
+        return self._plano.elementos[self._plano.indices_elemento[self._indice]]
+    
+    @property
+    def nivel(self):
+        return self._plano.niveis[self._indice]
+    
+    @property
+    def eh_analitica(self):
+        return bool(self._plano.analiticas[self._indice])
+    
+    @property
+    def versao(self):
+        return self._plano.versao
+    
+    @property
+    def tags(self):
+        return self._plano.get_tags(self._indice)
+    
+    @property
+    def conta_pai_id(self):
+        indice_pai = self._plano.pais[self._indice]
+        return self._plano.ids[indice_pai] if indice_pai >= 0 else None
+    
+    @property
+    def conta_pai(self):
+        indice_pai = self._plano.pais[self._indice]
+        return ContaPlano(self._plano, indice_pai) if indice_pai >= 0 else None
+    
+    def get_codigos_ancestrais(self):
+        """Códigos dos ancestrais da conta, da raiz (nível 1) até o pai imediato"""
+        return self._plano.get_codigos_ancestrais(self._indice)
+    
+    def get_ancestral_nivel(self, nivel):
+        """Código do ancestral no nível informado (1 = raiz), ou None se não houver"""
+        ancestrais = self.get_codigos_ancestrais()
+        return ancestrais[nivel - 1] if len(ancestrais) >= nivel else None
+    
+    def __repr__(self):
+        return f'<ContaPlano {self.codigo} - {self.nome}>'
+
+
+class PlanoContasVersao:
+    """
+    Plano de contas ativo de uma versão, mantido em arrays paralelos
+    (uma posição por conta, na ordem de id)
+    """
+    
+    def __init__(self, versao, linhas, carimbo, tags=()):
+        self.versao = versao
+        self.carimbo = carimbo
+        self.validado_em = time.monotonic()
+        
+        self.ids = array('q')
+        self.codigos = []
+        self.nomes = []
+        self.tipos_conta = []
+        self.elementos = []  # Valores distintos de elemento_conta
+        self.indices_elemento = array('B')  # Posição do elemento da conta em self.elementos
+        self.niveis = array('b')
+        self.analiticas = bytearray()
+        self.pais = array('l')  # Posição da conta pai (-1 quando não há pai ativo)
+        self.caminhos = []  # Caminho materializado (PlanoContas.caminho), None se ainda não gravado
+        
+        self._posicao_por_codigo = {}
+        self._posicoes_por_elemento = {}
+        posicao_por_id = {}
+        pais_ids = []
+        
+        for posicao, linha in enumerate(linhas):
+            if linha.elemento_conta not in self._posicoes_por_elemento:
+                self._posicoes_por_elemento[linha.elemento_conta] = array('l')
+                self.elementos.append(linha.elemento_conta)
+            
+            self.ids.append(linha.id)
+            self.codigos.append(linha.codigo)
+            self.nomes.append(linha.nome)
+            self.tipos_conta.append(linha.tipo_conta)
+            self.indices_elemento.append(self.elementos.index(linha.elemento_conta))
+            self.niveis.append(linha.nivel)
+            self.analiticas.append(1 if linha.eh_analitica else 0)
+            self.caminhos.append(linha.caminho)
+            
+            # Mantém a primeira conta do código, como em PlanoContas.get_by_codigo
+            self._posicao_por_codigo.setdefault(linha.codigo, posicao)
+            self._posicoes_por_elemento[linha.elemento_conta].append(posicao)
+            posicao_por_id[linha.id] = posicao
+            pais_ids.append(linha.conta_pai_id)
+        
+        for pai_id in pais_ids:
+            self.pais.append(posicao_por_id.get(pai_id, -1))
+        
+        # Classificação persistida (PlanoContasTag): tag -> posições em ordem de id
+        posicoes_por_tag = {}
+        self._tags_por_posicao = {}
+        for plano_contas_id, tag in tags:
+            posicao = posicao_por_id.get(plano_contas_id)
+            if posicao is not None:
+                posicoes_por_tag.setdefault(tag, []).append(posicao)
+                self._tags_por_posicao.setdefault(posicao, set()).add(tag)
+        self._posicoes_por_tag = {tag: array('l', sorted(posicoes)) for tag, posicoes in posicoes_por_tag.items()}
+    
+    def get_by_codigo(self, codigo):
+        posicao = self._posicao_por_codigo.get(codigo)
+        return ContaPlano(self, posicao) if posicao is not None else None
+    
+    def get_elemento(self, codigo):
+        """Elemento da conta do código informado, ou None se não estiver no plano"""
+        posicao = self._posicao_por_codigo.get(codigo)
+        return self.elementos[self.indices_elemento[posicao]] if posicao is not None else None
+    
+    def get_contas_por_elemento(self, elemento_conta):
+        return [ContaPlano(self, posicao) for posicao in self._posicoes_por_elemento.get(elemento_conta, ())]
+    
+    def get_contas_por_tag(self, tag, elemento_conta=None):
+        """Contas com a tag de classificação (ver REGRAS_TAGS), opcionalmente de um elemento"""
+        contas = [ContaPlano(self, posicao) for posicao in self._posicoes_por_tag.get(tag, ())]
+        if elemento_conta is not None:
+            contas = [conta for conta in contas if conta.elemento_conta == elemento_conta]
+        return contas
+    
+    def get_tags(self, posicao):
+        """Tags de classificação da conta na posição informada"""
+        return self._tags_por_posicao.get(posicao, frozenset())
+    
+    def get_contas_analiticas(self):
+        return [ContaPlano(self, posicao) for posicao, analitica in enumerate(self.analiticas) if analitica]
+    
+    def get_contas(self):
+        return [ContaPlano(self, posicao) for posicao in range(len(self.ids))]
+    
+    def get_codigos_ancestrais(self, posicao):
+        """
+        Códigos dos ancestrais de uma conta, da raiz até o pai imediato, lidos do
+        caminho materializado (como PlanoContas.get_codigos_ancestrais)
+        """
+        caminho = self.caminhos[posicao]
+        if caminho:
+            return caminho.strip(SEPARADOR_CAMINHO).split(SEPARADOR_CAMINHO)[:-1]
+        
+        # Caminho ainda não materializado: percorrer a hierarquia em cache
+        return [self.codigos[indice] for indice in self.get_indices_ancestrais(posicao)]
+    
+    def get_indices_ancestrais(self, posicao):
+        """Posições dos ancestrais de uma conta, da raiz até o pai imediato"""
+        ancestrais = []
+        posicao = self.pais[posicao]
+        while posicao >= 0 and len(ancestrais) < len(self.ids):
+            ancestrais.append(posicao)
+            posicao = self.pais[posicao]
+        ancestrais.reverse()
+        return ancestrais
+    
+    def __len__(self):
+        return len(self.ids)
+
+
+class PlanoContasCache:
+    """
+    Cache em memória do plano de contas, por versão.
+    A versão em cache é revalidada contra o banco (quantidade de contas e maior
+    data_atualizacao) no máximo a cada INTERVALO_VALIDACAO segundos, e é descartada
+    imediatamente quando contas da versão são alteradas por este processo.
+    """
+    
+    INTERVALO_VALIDACAO = 5.0
+    
+    _versoes = {}
+    _lock = threading.Lock()
+    
+    @classmethod
+    def obter(cls, versao='1.0'):
+        """
+        Retorna o plano de contas da versão, carregando-o se necessário
+        """
+        plano = cls._versoes.get(versao)
+        agora = time.monotonic()
+        
+        if plano and agora - plano.validado_em < cls.INTERVALO_VALIDACAO:
+            return plano
+        
+        with cls._lock:
+            plano = cls._versoes.get(versao)
+            carimbo = cls._obter_carimbo(versao)
+            
+            if plano and plano.carimbo == carimbo:
+                plano.validado_em = agora
+                return plano
+            
+            plano = cls._carregar(versao, carimbo)
+            cls._versoes[versao] = plano
+            return plano
+    
+    @classmethod
+    def invalidar(cls, versao=None):
+        """
+        Descarta o cache de uma versão (ou de todas). Deve ser chamado ao final
+        de importações em lote do plano de contas.
+        """
+        with cls._lock:
+            if versao is None:
+                cls._versoes.clear()
+            else:
+                cls._versoes.pop(versao, None)
+    
+    @staticmethod
+    @Roteamento.primario()
+    def _obter_carimbo(versao):
+        """Carimbo de versão do plano: quantidade de contas e última atualização"""
+        quantidade, ultima_atualizacao = db.session.query(
+            func.count(PlanoContas.id),
+            func.max(PlanoContas.data_atualizacao)
+        ).filter(PlanoContas.versao == versao).one()
+        return (quantidade, ultima_atualizacao)
+    
+    @staticmethod
+    @Instrumentacao.etapa('carregar_plano')
+    @Roteamento.primario()
+    def _carregar(versao, carimbo):
+        # Lidas em lotes: percorridas uma única vez na montagem de PlanoContasVersao
+        linhas = leitura_em_lote(db.session.query(
+            PlanoContas.id,
+            PlanoContas.codigo,
+            PlanoContas.nome,
+            PlanoContas.tipo_conta,
+            PlanoContas.elemento_conta,
+            PlanoContas.nivel,
+            PlanoContas.conta_pai_id,
+            PlanoContas.eh_analitica,
+            PlanoContas.caminho
+        ).filter_by(versao=versao, ativo=True).order_by(PlanoContas.id))
+        tags = db.session.query(PlanoContasTag.plano_contas_id, PlanoContasTag.tag).join(
+            PlanoContas, PlanoContas.id == PlanoContasTag.plano_contas_id
+        ).filter(PlanoContas.versao == versao, PlanoContas.ativo == True).all()
+        return PlanoContasVersao(versao, linhas, carimbo, tags)
+
+
+@event.listens_for(PlanoContas, 'after_insert')
+@event.listens_for(PlanoContas, 'after_update')
+@event.listens_for(PlanoContas, 'after_delete')
+def _registrar_versao_alterada(mapper, conexao, conta):
+    sessao = Session.object_session(conta)
+    if sessao is not None:
+        sessao.info.setdefault('versoes_plano_alteradas', set()).add(conta.versao)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_versoes_alteradas(sessao):
+    for versao in sessao.info.pop('versoes_plano_alteradas', ()):
+        PlanoContasCache.invalidar(versao)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_versoes_alteradas(sessao):
+    sessao.info.pop('versoes_plano_alteradas', None)
@@ -0,0 +1,276 @@
+from src.models.demonstracoes import DemonstracaoFinanceira
+from src.models.user import db
+from src.models.centavos import converter_valores, para_centavos
+from src.services.contexto_calculo import ContextoCalculo
+from src.services.balanco_patrimonial import BalancoPatrimonialService
+from src.services.dre import DREService
+from src.services.dra import DRAService
+from src.services.dva import DVAService
+from src.services.dfc import DFCService
+from src.services.dmpl import DMPLService
+
+class RecalculoIncrementalService:
+    """
+    Atualiza as demonstrações gravadas após a reimportação do balancete de um
+    período, propagando apenas as contas alteradas: os saldos das contas, grupos
+    e subgrupos de DRE e BP são corrigidos no próprio JSON gravado, e DRA, DVA,
+    DFC e DMPL são recalculadas somente quando alguma conta alterada as alimenta.
+    """
+    
+    # Elementos e tags (PlanoContasTag) lidos por cada demonstração, além da DRE
+    ELEMENTOS_DRE = {'receita': 'receitas', 'custo': 'custos', 'despesa': 'despesas'}
+    ELEMENTOS_BP = ('ativo', 'passivo', 'patrimonio_liquido')
+    TAGS_DRA = {'ajuste_conversao', 'ajuste_avaliacao'}
+    TAGS_DVA = {'depreciacao', 'amortizacao', 'exaustao'}
+    
+    @staticmethod
+    def atualizar_apos_reimportacao(periodo, saldos_anteriores, versao_balancete='1.0', versao_plano_contas='1.0'):
+        """
+        Atualiza as demonstrações do período (e as DFC/DMPL que começam ou terminam
+        nele) a partir da diferença entre saldos_anteriores (SaldosPeriodo lido antes
+        da reimportação) e o balancete gravado agora. Demonstrações que já estavam
+        desatualizadas antes da reimportação são recalculadas por completo.
+        """
+        try:
+            contexto = ContextoCalculo(versao_balancete, versao_plano_contas)
+            contexto_anterior = ContextoCalculo(versao_balancete, versao_plano_contas)
+            contexto_anterior.usar_saldos(saldos_anteriores)
+            
+            saldos_novos = contexto.saldos(periodo)
+            plano = contexto.plano()
+            alteracoes = saldos_anteriores.diferencas(saldos_novos)
+            
+            # Contas alteradas que constam do plano: (conta, saldo anterior, saldo novo)
+            contas_alteradas = []
+            for codigo_conta, (saldo_anterior, saldo_novo) in alteracoes.items():
+                conta = plano.get_by_codigo(codigo_conta)
+                if conta is not None:
+                    contas_alteradas.append((conta, saldo_anterior, saldo_novo))
+            
+            elementos = {conta.elemento_conta for conta, saldo_anterior, saldo_novo in contas_alteradas}
+            tags = set()
+            for conta, saldo_anterior, saldo_novo in contas_alteradas:
+                tags |= conta.tags
+            
+            afeta_dre = bool(elementos & set(RecalculoIncrementalService.ELEMENTOS_DRE))
+            afetadas = {
+                'DRE': afeta_dre,
+                'BP': (
+                    bool(elementos & set(RecalculoIncrementalService.ELEMENTOS_BP))
+                    or saldos_anteriores.total != saldos_novos.total
+                ),
+                'DRA': afeta_dre or bool(tags & RecalculoIncrementalService.TAGS_DRA),
+                'DVA': afeta_dre or bool(tags & RecalculoIncrementalService.TAGS_DVA),
+                'DFC': bool(contas_alteradas),
+                'DMPL': 'patrimonio_liquido' in elementos
+            }
+            
+            mensais = DemonstracaoFinanceira.get_demonstracoes(('DRE', 'BP', 'DRA', 'DVA'), (periodo,), versao_balancete)
+            demonstracoes = [
+                (tipo, (periodo,), (), mensais[(tipo, periodo)])
+                for tipo in ('DRE', 'BP', 'DRA', 'DVA') if (tipo, periodo) in mensais
+            ]
+            for demonstracao in DemonstracaoFinanceira.get_intervalos_com_periodo(periodo, versao_balancete):
+                periodo_inicial, periodo_final = demonstracao.periodo.split('_')
+                parametros = ()
+                if demonstracao.tipo_demonstracao == 'DFC':
+                    parametros = (demonstracao.get_dados().get('metodo', 'indireto'),)
+                demonstracoes.append(
+                    (demonstracao.tipo_demonstracao, (periodo_inicial, periodo_final), parametros, demonstracao)
+                )
+            
+            situacao = {}
+            erros = {}
+            
+            for tipo, periodos, parametros, demonstracao in demonstracoes:
+                chave = f'{tipo} {demonstracao.periodo}'
+                assinatura = contexto.assinatura(tipo, periodos, *parametros)
+                estava_atualizada = demonstracao.esta_atualizada(
+                    contexto_anterior.assinatura(tipo, periodos, *parametros)
+                )
+                
+                resultado = None
+                if estava_atualizada and not afetadas[tipo]:
+                    # Nenhuma conta lida pela demonstração mudou: apenas a assinatura
+                    demonstracao.atualizar_assinatura(assinatura)
+                    situacao[chave] = 'inalterada'
+                    continue
+                
+                if estava_atualizada and tipo == 'DRE':
+                    resultado = RecalculoIncrementalService._propagar_dre(demonstracao.get_dados(), contas_alteradas, plano)
+                elif estava_atualizada and tipo == 'BP' and saldos_novos.verificar_totalizador_zero():
+                    resultado = RecalculoIncrementalService._propagar_balanco(demonstracao.get_dados(), contas_alteradas, plano)
+                
+                if resultado is not None:
+                    dados = resultado['data']
+                    situacao[chave] = 'incremental'
+                    if tipo == 'DRE':
+                        # DRA, DVA e DFC do período partem da DRE já corrigida
+                        contexto.memorizar(('DRE', periodo), lambda resultado=resultado: resultado)
+                else:
+                    resultado = RecalculoIncrementalService._recalcular(tipo, periodos, parametros, contexto)
+                    if not resultado['success']:
+                        erros[chave] = resultado['message']
+                        continue
+                    dados = resultado['data']
+                    situacao[chave] = 'recalculada'
+                
+                demonstracao.atualizar_dados(versao_plano_contas, dados, assinatura)
+            
+            db.session.commit()
+            
+            return {
+                'success': not erros,
+                'data': {
+                    'contas_alteradas': len(alteracoes),
+                    'demonstracoes': situacao
+                },
+                'erros': erros,
+                'message': (
+                    f'{len(alteracoes)} contas alteradas; '
+                    f'{sum(1 for valor in situacao.values() if valor != "inalterada")} demonstrações atualizadas'
+                    + (f'; {len(erros)} com erro' if erros else '')
+                )
+            }
+            
+        except Exception as e:
+            db.session.rollback()
+            return {
+                'success': False,
+                'message': f'Erro ao atualizar demonstrações após reimportação: {str(e)}'
+            }
+    
+    @staticmethod
+    def _recalcular(tipo, periodos, parametros, contexto):
+        """Cálculo completo da demonstração com os saldos atuais"""
+        if tipo == 'DRE':
+            return DREService.calcular_dre(periodos[0], contexto)
+        if tipo == 'BP':
+            return BalancoPatrimonialService.calcular_balanco_patrimonial(periodos[0], contexto)
+        if tipo == 'DRA':
+            return DRAService.calcular_dra(periodos[0], contexto)
+        if tipo == 'DVA':
+            return DVAService.calcular_dva(periodos[0], contexto)
+        if tipo == 'DFC':
+            return DFCService.calcular_dfc(periodos[0], periodos[1], contexto, *parametros)
+        return DMPLService.calcular_dmpl(periodos[0], periodos[1], contexto)
+    
+    @staticmethod
+    def _propagar_dre(dados, contas_alteradas, plano):
+        """
+        Aplica as diferenças das contas de resultado aos grupos da DRE gravada
+        (convertidos para centavos) e recalcula totais, indicadores e estrutura.
+        Retorna o resultado de DREService._montar_dre ou None se alguma conta
+        entra ou sai da estrutura (exige recálculo completo).
+        """
+        grupos = {
+            elemento: converter_valores(dados[secao]['grupos'], para_centavos)
+            for elemento, secao in RecalculoIncrementalService.ELEMENTOS_DRE.items()
+        }
+        
+        for conta, saldo_anterior, saldo_novo in contas_alteradas:
+            if conta.elemento_conta not in grupos:
+                continue
+            
+            # Receitas são exibidas em valor absoluto (ver DREService._obter_grupo_contas)
+            if conta.elemento_conta == 'receita':
+                saldo_anterior, saldo_novo = abs(saldo_anterior), abs(saldo_novo)
+            
+            if not RecalculoIncrementalService._aplicar_diferenca(
+                grupos[conta.elemento_conta], conta, plano, saldo_anterior, saldo_novo
+            ):
+                return None
+        
+        return DREService._montar_dre(grupos['receita'], grupos['custo'], grupos['despesa'])
+    
+    @staticmethod
+    def _propagar_balanco(dados, contas_alteradas, plano):
+        """
+        Aplica as diferenças das contas patrimoniais aos grupos do BP gravado
+        (convertidos para centavos) e recalcula os totais. Retorna None se alguma
+        conta entra ou sai da estrutura ou se o balanço deixa de fechar (o
+        recálculo completo informa o erro).
+        """
+        grupos = {
+            elemento: converter_valores(dados[elemento]['grupos'], para_centavos)
+            for elemento in RecalculoIncrementalService.ELEMENTOS_BP
+        }
+        
+        for conta, saldo_anterior, saldo_novo in contas_alteradas:
+            if conta.elemento_conta not in grupos:
+                continue
+            if not RecalculoIncrementalService._aplicar_diferenca(
+                grupos[conta.elemento_conta], conta, plano, saldo_anterior, saldo_novo
+            ):
+                return None
+        
+        resultado = BalancoPatrimonialService._montar_balanco(
+            grupos['ativo'], grupos['passivo'], grupos['patrimonio_liquido']
+        )
+        return resultado if resultado['success'] else None
+    
+    @staticmethod
+    def _aplicar_diferenca(grupos, conta, plano, saldo_anterior, saldo_novo):
+        """
+        Soma a diferença de saldo da conta aos nós da estrutura hierárquica que a
+        acumulam (grupo, subgrupo e a própria conta analítica), tudo em centavos.
+        Retorna False quando a alteração muda a estrutura: a conta passa a constar
+        ou deixa de constar (saldo diferente de zero).
+        """
+        constava = saldo_anterior != 0
+        consta = saldo_novo != 0
+        
+        if not constava and not consta:
+            return True
+        if constava != consta:
+            return False
+        
+        try:
+            caminho = RecalculoIncrementalService._localizar_conta(grupos, conta, plano)
+        except KeyError:
+            return False
+        
+        if caminho is None:
+            return True
+        
+        nos, linha_conta = caminho
+        diferenca = saldo_novo - saldo_anterior
+        for no in nos:
+            no['saldo'] += diferenca
+        if linha_conta is not None:
+            linha_conta['saldo'] = saldo_novo
+        
+        return True
+    
+    @staticmethod
+    def _localizar_conta(grupos, conta, plano):
+        """
+        Nós que acumulam o saldo da conta na estrutura gravada, seguindo as regras
+        de _obter_grupo_contas de DRE e BP: (nós de grupo/subgrupo, linha da conta
+        analítica ou None). Retorna None se a conta não entra na estrutura e levanta
+        KeyError se algum nó esperado não existe.
+        """
+        grupo_por_codigo = {grupo['codigo']: grupo for grupo in grupos}
+        
+        if conta.nivel == 1:
+            return [grupo_por_codigo[conta.codigo]], None
+        
+        ancestrais = conta.get_codigos_ancestrais()
+        
+        if conta.nivel == 2 and ancestrais:
+            conta_pai = plano.get_by_codigo(ancestrais[-1])
+            if not conta_pai:
+                return None
+            grupo = grupo_por_codigo[conta_pai.codigo]
+            return [grupo, grupo['subgrupos'][conta.codigo]], None
+        
+        if conta.eh_analitica and len(ancestrais) >= 2:
+            pai_nivel1 = plano.get_by_codigo(ancestrais[0])
+            pai_nivel2 = plano.get_by_codigo(ancestrais[1])
+            if not pai_nivel1 or not pai_nivel2:
+                return None
+            grupo = grupo_por_codigo[pai_nivel1.codigo]
+            subgrupo = grupo['subgrupos'][pai_nivel2.codigo]
+            return [grupo, subgrupo], subgrupo['contas'][conta.codigo]
+        
+        return None
@@ -0,0 +1,109 @@
+"""
+Roteamento de leitura/escrita da sessão do banco.
+
+Os métodos de serviço somente leitura (obter_*, listagem e análises) rodam em
+Roteamento.somente_leitura(): enquanto o contexto está ativo, as consultas da
+sessão vão para o engine do bind 'leitura' (réplica do PostgreSQL ou segunda
+conexão do SQLite em modo somente leitura). Gravações (flush) continuam no
+engine principal, assim como tudo fora do contexto (geração e importação).
+
+Sem o bind 'leitura' configurado, tudo usa o engine principal. Uma réplica
+pode estar alguns instantes atrás do principal: o que precisa do dado recém
+gravado (ex.: caches compartilhados) usa Roteamento.primario().
+
+Uso (antes de db.init_app, para que o bind seja criado):
+    Roteamento.configurar(app)
+    db.init_app(app)
+    Roteamento.init_app(app)
+
+Configuração do app:
+    BANCO_LEITURA_URI     URI da réplica de leitura
+    BANCO_LEITURA_SQLITE  True para abrir o mesmo arquivo SQLite em modo
+                          somente leitura (use com o perfil WAL, ver perfil_banco)
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask_sqlalchemy.session import Session
+from sqlalchemy.engine import make_url
+import os
+
+_somente_leitura = ContextVar('indicium_somente_leitura', default=False)
+
+class SessaoRoteada(Session):
+    """Sessão do db que envia as leituras ao bind 'leitura' dentro de Roteamento.somente_leitura()"""
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _somente_leitura.get() and not self._flushing:
+            engine = self._db.engines.get(Roteamento.BIND_LEITURA)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+class Roteamento:
+    
+    BIND_LEITURA = 'leitura'
+    
+    @staticmethod
+    def configurar(app):
+        """Registra o bind de leitura em SQLALCHEMY_BINDS. Chamar antes de db.init_app."""
+        uri = app.config.get('BANCO_LEITURA_URI')
+        if not uri and app.config.get('BANCO_LEITURA_SQLITE', False):
+            uri = Roteamento.uri_sqlite_leitura(app.config.get('SQLALCHEMY_DATABASE_URI'))
+        if not uri:
+            return
+        
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds.setdefault(Roteamento.BIND_LEITURA, uri)
+        app.config['SQLALCHEMY_BINDS'] = binds
+    
+    @staticmethod
+    def uri_sqlite_leitura(uri):
+        """URI do mesmo arquivo SQLite em modo somente leitura (None para bancos em memória)"""
+        if not uri:
+            return None
+        url = make_url(uri)
+        if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+            return None
+        return f'sqlite:///file:{os.path.abspath(url.database)}?mode=ro&uri=true'
+    
+    @staticmethod
+    def init_app(app):
+        """
+        Aplica ao engine de leitura do SQLite os PRAGMAs do perfil do banco, exceto
+        os que alteram o arquivo (journal_mode). Chamar após db.init_app.
+        """
+        from src.models.user import db
+        from src.models.perfil_banco import PerfilBanco
+        
+        with app.app_context():
+            engine = db.engines.get(Roteamento.BIND_LEITURA)
+            if engine is None or app.config.get('PERFIL_BANCO', 'producao') != 'producao':
+                return
+            pragmas = PerfilBanco.pragmas_sqlite(app.config)
+            pragmas.pop('journal_mode', None)
+            pragmas['query_only'] = 1
+            PerfilBanco.aplicar_sqlite(engine, pragmas)
+    
+    @staticmethod
+    @contextmanager
+    def somente_leitura():
+        """Consultas da sessão no engine de leitura (também usável como decorador)"""
+        token = _somente_leitura.set(True)
+        try:
+            yield
+        finally:
+            _somente_leitura.reset(token)
+    
+    @staticmethod
+    @contextmanager
+    def primario():
+        """Consultas da sessão no engine principal, mesmo dentro de somente_leitura()"""
+        token = _somente_leitura.set(False)
+        try:
+            yield
+        finally:
+            _somente_leitura.reset(token)
+    
+    @staticmethod
+    def em_leitura():
+        return _somente_leitura.get()
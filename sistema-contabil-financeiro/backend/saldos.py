@@ -0,0 +1,109 @@
+from src.models.balancete import Balancete
+from src.services.instrumentacao import Instrumentacao
+import hashlib
+import json
+
+class SaldosPeriodo:
+    """
+    Fotografia dos saldos finais de um balancete (período + versão).
+    Todas as linhas são carregadas em uma única consulta e mantidas em um
+    mapa codigo_conta -> saldo, evitando uma consulta por conta nos serviços.
+    Os saldos e o total são inteiros em centavos (ver src.models.centavos).
+    """
+    
+    def __init__(self, periodo, versao_balancete, saldos, total=0):
+        self.periodo = periodo
+        self.versao_balancete = versao_balancete
+        self._saldos = saldos
+        self._total = total
+        self._assinatura = None
+    
+    @classmethod
+    @Instrumentacao.etapa('carregar_saldos')
+    def carregar(cls, periodo, versao_balancete='1.0'):
+        """
+        Carrega os saldos de todas as contas do balancete do período
+        """
+        saldos = {}
+        total = 0
+        
+        for codigo_conta, saldo_final in Balancete.get_saldos_periodo(periodo, versao_balancete):
+            saldo = saldo_final or 0
+            total += saldo
+            
+            # Mantém a primeira linha da conta, como em Balancete.get_saldo_por_conta
+            if codigo_conta not in saldos:
+                saldos[codigo_conta] = saldo
+        
+        return cls(periodo, versao_balancete, saldos, total)
+    
+    @classmethod
+    @Instrumentacao.etapa('carregar_saldos')
+    def carregar_intervalo(cls, periodo_inicial, periodo_final, versao_balancete='1.0'):
+        """
+        Carrega em uma única consulta os saldos de todos os períodos do intervalo
+        (YYYY-MM, inclusive). Retorna um dicionário periodo -> SaldosPeriodo
+        contendo apenas os períodos que possuem balancete.
+        """
+        saldos_por_periodo = {}
+        totais = {}
+        
+        for periodo, codigo_conta, saldo_final in Balancete.get_saldos_intervalo(periodo_inicial, periodo_final, versao_balancete):
+            saldo = saldo_final or 0
+            saldos = saldos_por_periodo.setdefault(periodo, {})
+            totais[periodo] = totais.get(periodo, 0) + saldo
+            
+            if codigo_conta not in saldos:
+                saldos[codigo_conta] = saldo
+        
+        return {
+            periodo: cls(periodo, versao_balancete, saldos, totais[periodo])
+            for periodo, saldos in saldos_por_periodo.items()
+        }
+    
+    def get_saldo(self, codigo_conta):
+        """Saldo final da conta no período, em centavos (0 se a conta não consta do balancete)"""
+        return self._saldos.get(codigo_conta, 0)
+    
+    def verificar_totalizador_zero(self):
+        """Verifica se o somatório de todos os saldos finais é zero (exato, sem tolerância)"""
+        return self._total == 0
+    
+    def diferencas(self, novos):
+        """
+        Contas cujo saldo mudou deste balancete para o balancete novos (mesmo
+        período, outra importação): codigo_conta -> (saldo anterior, saldo novo)
+        """
+        alteradas = {}
+        for codigo_conta, saldo in self._saldos.items():
+            saldo_novo = novos.get_saldo(codigo_conta)
+            if saldo_novo != saldo:
+                alteradas[codigo_conta] = (saldo, saldo_novo)
+        for codigo_conta, saldo_novo in novos.items():
+            if codigo_conta not in self._saldos and saldo_novo != 0:
+                alteradas[codigo_conta] = (0, saldo_novo)
+        return alteradas
+    
+    @property
+    def total(self):
+        """Somatório dos saldos finais de todas as linhas do balancete, em centavos"""
+        return self._total
+    
+    def assinatura(self):
+        """
+        Hash (SHA-256) do conteúdo do balancete que entra nos cálculos: as contas,
+        seus saldos na ordem de importação e o somatório de todas as linhas
+        """
+        if self._assinatura is None:
+            conteudo = json.dumps([self.periodo, self.versao_balancete, list(self._saldos.items()), self._total])
+            self._assinatura = hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+        return self._assinatura
+    
+    def items(self):
+        return self._saldos.items()
+    
+    def __contains__(self, codigo_conta):
+        return codigo_conta in self._saldos
+    
+    def __len__(self):
+        return len(self._saldos)
@@ -0,0 +1,98 @@
+from src.models.user import db
+from datetime import datetime
+import json
+
+class Tarefa(db.Model):
+    """
+    Tarefa da fila de processamento em segundo plano (geração de demonstrações,
+    importações). A fila fica no próprio banco: os trabalhadores reservam a próxima
+    tarefa pendente com um UPDATE condicional, sem broker externo.
+    """
+    __tablename__ = 'tarefa'
+    __table_args__ = (
+        # Busca da próxima tarefa pendente (status + ordem de chegada)
+        db.Index('ix_tarefa_status_id', 'status', 'id'),
+    )
+    
+    PENDENTE = 'pendente'
+    EXECUTANDO = 'executando'
+    CONCLUIDA = 'concluida'
+    ERRO = 'erro'
+    CANCELADA = 'cancelada'
+    
+    FINALIZADAS = (CONCLUIDA, ERRO, CANCELADA)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)
+    parametros_json = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default=PENDENTE)
+    progresso = db.Column(db.Float, default=0.0)  # 0 a 100
+    mensagem = db.Column(db.String(255))
+    resultado_json = db.Column(db.Text)
+    cancelamento_solicitado = db.Column(db.Boolean, default=False)
+    trabalhador = db.Column(db.String(100))  # host:pid do processo que executa a tarefa
+    tentativas = db.Column(db.Integer, default=0)
+    data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
+    data_inicio = db.Column(db.DateTime)
+    data_fim = db.Column(db.DateTime)
+    data_atualizacao = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Tarefa {self.id} - {self.tipo} ({self.status})>'
+    
+    def to_dict(self, incluir_resultado=True):
+        dados = {
+            'id': self.id,
+            'tipo': self.tipo,
+            'parametros': self.get_parametros(),
+            'status': self.status,
+            'progresso': round(self.progresso or 0.0, 1),
+            'mensagem': self.mensagem,
+            'cancelamento_solicitado': bool(self.cancelamento_solicitado),
+            'tentativas': self.tentativas or 0,
+            'data_criacao': self.data_criacao.isoformat() if self.data_criacao else None,
+            'data_inicio': self.data_inicio.isoformat() if self.data_inicio else None,
+            'data_fim': self.data_fim.isoformat() if self.data_fim else None,
+            'data_atualizacao': self.data_atualizacao.isoformat() if self.data_atualizacao else None
+        }
+        if incluir_resultado:
+            dados['resultado'] = json.loads(self.resultado_json) if self.resultado_json else None
+        return dados
+    
+    def get_parametros(self):
+        return json.loads(self.parametros_json) if self.parametros_json else {}
+    
+    @property
+    def finalizada(self):
+        return self.status in Tarefa.FINALIZADAS
+    
+    @classmethod
+    def reservar_proxima(cls, trabalhador, tipos=None):
+        """
+        Reserva a tarefa pendente mais antiga para o trabalhador e a retorna
+        (ou None se a fila está vazia). O UPDATE só tem efeito se a tarefa ainda
+        estiver pendente, de modo que dois trabalhadores nunca pegam a mesma.
+        """
+        while True:
+            consulta = db.session.query(cls.id).filter(cls.status == cls.PENDENTE)
+            if tipos:
+                consulta = consulta.filter(cls.tipo.in_(tipos))
+            candidata = consulta.order_by(cls.id).first()
+            
+            if candidata is None:
+                db.session.commit()
+                return None
+            
+            agora = datetime.utcnow()
+            reservadas = cls.query.filter(cls.id == candidata.id, cls.status == cls.PENDENTE).update({
+                cls.status: cls.EXECUTANDO,
+                cls.trabalhador: trabalhador,
+                cls.tentativas: cls.tentativas + 1,
+                cls.data_inicio: agora,
+                cls.data_atualizacao: agora
+            }, synchronize_session=False)
+            db.session.commit()
+            
+            if reservadas == 1:
+                return db.session.get(cls, candidata.id)
+            # Outro trabalhador reservou a mesma tarefa: tentar a próxima
@@ -0,0 +1,488 @@
+from src.models.tarefa import Tarefa
+from src.models.user import db
+from src.services.balanco_patrimonial import BalancoPatrimonialService
+from src.services.demonstracoes_service import DemonstracoesService
+from src.services.dfc import DFCService
+from src.services.dmpl import DMPLService
+from src.services.dra import DRAService
+from src.services.dre import DREService
+from src.services.dva import DVAService
+from src.services.importacao_paralela import ImportacaoParalelaService
+from src.services.importacao_service import ImportacaoBalanceteService
+from sqlalchemy import select, update
+from sqlalchemy.exc import OperationalError
+from datetime import datetime
+import json
+import os
+import socket
+import time
+
+
+class TarefaCancelada(Exception):
+    """Levantada pelo callback de progresso quando o cancelamento foi solicitado"""
+
+
+class ProgressoTarefa:
+    """
+    Callback de progresso entregue aos serviços executados por uma tarefa. Grava
+    percentual e mensagem (no máximo uma vez por INTERVALO segundos) em uma conexão
+    própria, para não confirmar a transação em andamento do serviço, e levanta
+    TarefaCancelada quando o cancelamento da tarefa foi solicitado.
+    """
+    
+    INTERVALO = 1.0
+    
+    def __init__(self, tarefa_id):
+        self.tarefa_id = tarefa_id
+        self._ultima_gravacao = 0.0
+    
+    def __call__(self, percentual=None, mensagem=None):
+        agora = time.monotonic()
+        if agora - self._ultima_gravacao < ProgressoTarefa.INTERVALO:
+            return
+        self._ultima_gravacao = agora
+        
+        if TarefaService.registrar_progresso(self.tarefa_id, percentual, mensagem):
+            raise TarefaCancelada('Tarefa cancelada')
+
+
+class TarefaService:
+    """
+    Fila de tarefas em segundo plano gravada no banco da aplicação. As rotas
+    enfileiram a tarefa e devolvem seu id; os trabalhadores
+    (src.services.trabalhador_tarefas) reservam e executam as tarefas pendentes,
+    gravando progresso e resultado, que a interface consulta periodicamente.
+    """
+    
+    # Tentativas de execução de uma tarefa interrompida pela queda do trabalhador
+    MAX_TENTATIVAS = 3
+    
+    LIMITE_LISTAGEM = 200
+    
+    # Parâmetros obrigatórios de cada tipo de tarefa (ver EXECUTORES)
+    PARAMETROS_OBRIGATORIOS = {
+        'gerar_demonstracao': ('tipo',),
+        'gerar_todas': ('periodo_inicial', 'periodo_final'),
+        'gerar_lote': ('periodo_inicial', 'periodo_final'),
+        'importar_balancete': ('caminho', 'periodo'),
+        'importar_balancetes': ('arquivos',)
+    }
+    
+    @staticmethod
+    def enfileirar(tipo, parametros=None):
+        """Grava uma tarefa pendente e a retorna"""
+        try:
+            parametros = parametros or {}
+            
+            if tipo not in TarefaService.EXECUTORES:
+                return {
+                    'success': False,
+                    'message': f'Tipo de tarefa não suportado: {tipo}. Use {", ".join(sorted(TarefaService.EXECUTORES))}'
+                }
+            
+            if not isinstance(parametros, dict):
+                return {
+                    'success': False,
+                    'message': 'Os parâmetros da tarefa devem ser um objeto'
+                }
+            
+            faltantes = [nome for nome in TarefaService.PARAMETROS_OBRIGATORIOS[tipo] if not parametros.get(nome)]
+            if faltantes:
+                return {
+                    'success': False,
+                    'message': f'Parâmetros obrigatórios ausentes: {", ".join(faltantes)}'
+                }
+            
+            tarefa = Tarefa(
+                tipo=tipo,
+                parametros_json=json.dumps(parametros, ensure_ascii=False),
+                status=Tarefa.PENDENTE,
+                mensagem='Aguardando execução'
+            )
+            db.session.add(tarefa)
+            db.session.commit()
+            
+            return {
+                'success': True,
+                'data': tarefa.to_dict(),
+                'message': f'Tarefa {tarefa.id} enfileirada'
+            }
+            
+        except Exception as e:
+            db.session.rollback()
+            return {
+                'success': False,
+                'message': f'Erro ao enfileirar tarefa: {str(e)}'
+            }
+    
+    @staticmethod
+    def obter(tarefa_id):
+        try:
+            tarefa = db.session.get(Tarefa, tarefa_id)
+            if not tarefa:
+                return {
+                    'success': False,
+                    'message': 'Tarefa não encontrada'
+                }
+            
+            return {
+                'success': True,
+                'data': tarefa.to_dict()
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'message': f'Erro ao obter tarefa: {str(e)}'
+            }
+    
+    @staticmethod
+    def listar(status=None, tipo=None, limite=50):
+        """Tarefas mais recentes (sem o resultado), filtradas por status e tipo"""
+        try:
+            consulta = Tarefa.query
+            if status:
+                consulta = consulta.filter(Tarefa.status == status)
+            if tipo:
+                consulta = consulta.filter(Tarefa.tipo == tipo)
+            
+            tarefas = consulta.order_by(Tarefa.id.desc()).limit(
+                max(1, min(limite, TarefaService.LIMITE_LISTAGEM))
+            ).all()
+            
+            return {
+                'success': True,
+                'data': [tarefa.to_dict(incluir_resultado=False) for tarefa in tarefas]
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'message': f'Erro ao listar tarefas: {str(e)}'
+            }
+    
+    @staticmethod
+    def cancelar(tarefa_id):
+        """
+        Cancela a tarefa. Uma tarefa pendente é cancelada imediatamente; em uma
+        tarefa em execução o cancelamento é sinalizado e atendido pelo trabalhador
+        na próxima atualização de progresso (a transação em andamento é desfeita).
+        No SQLite o sinal só pode ser gravado fora das transações de escrita da
+        tarefa (ex.: durante o cálculo das demonstrações, não durante a gravação
+        de um balancete).
+        """
+        try:
+            tarefa = db.session.get(Tarefa, tarefa_id)
+            if not tarefa:
+                return {
+                    'success': False,
+                    'message': 'Tarefa não encontrada'
+                }
+            
+            if tarefa.finalizada:
+                return {
+                    'success': False,
+                    'message': f'Tarefa já finalizada ({tarefa.status})'
+                }
+            
+            agora = datetime.utcnow()
+            canceladas = Tarefa.query.filter(
+                Tarefa.id == tarefa_id, Tarefa.status == Tarefa.PENDENTE
+            ).update({
+                Tarefa.status: Tarefa.CANCELADA,
+                Tarefa.cancelamento_solicitado: True,
+                Tarefa.mensagem: 'Tarefa cancelada antes da execução',
+                Tarefa.data_fim: agora,
+                Tarefa.data_atualizacao: agora
+            }, synchronize_session=False)
+            
+            if not canceladas:
+                # Já reservada por um trabalhador
+                Tarefa.query.filter(Tarefa.id == tarefa_id).update({
+                    Tarefa.cancelamento_solicitado: True,
+                    Tarefa.data_atualizacao: agora
+                }, synchronize_session=False)
+            
+            db.session.commit()
+            db.session.refresh(tarefa)
+            
+            if canceladas:
+                TarefaService._remover_arquivos(tarefa.tipo, tarefa.get_parametros())
+            
+            return {
+                'success': True,
+                'data': tarefa.to_dict(incluir_resultado=False),
+                'message': 'Tarefa cancelada' if canceladas else 'Cancelamento solicitado'
+            }
+            
+        except OperationalError:
+            # SQLite admite um único escritor: uma importação em andamento mantém o
+            # banco bloqueado até o fim da sua transação
+            db.session.rollback()
+            return {
+                'success': False,
+                'message': 'Banco de dados ocupado pela tarefa em execução; tente cancelar novamente em instantes'
+            }
+        except Exception as e:
+            db.session.rollback()
+            return {
+                'success': False,
+                'message': f'Erro ao cancelar tarefa: {str(e)}'
+            }
+    
+    @staticmethod
+    def executar_proxima(trabalhador, tipos=None):
+        """Reserva e executa a próxima tarefa pendente. Retorna o id executado ou None"""
+        tarefa = Tarefa.reservar_proxima(trabalhador, tipos)
+        if tarefa is None:
+            return None
+        
+        TarefaService.executar(tarefa)
+        return tarefa.id
+    
+    @staticmethod
+    def executar(tarefa):
+        """Executa uma tarefa já reservada e grava o resultado"""
+        tarefa_id = tarefa.id
+        parametros = tarefa.get_parametros()
+        progresso = ProgressoTarefa(tarefa_id)
+        
+        try:
+            if tarefa.cancelamento_solicitado:
+                raise TarefaCancelada('Tarefa cancelada')
+            resultado = TarefaService.EXECUTORES[tarefa.tipo](parametros, progresso)
+        except TarefaCancelada as e:
+            db.session.rollback()
+            resultado = {'success': False, 'message': str(e)}
+        except Exception as e:
+            db.session.rollback()
+            resultado = {'success': False, 'message': f'Erro ao executar tarefa: {str(e)}'}
+        finally:
+            TarefaService._remover_arquivos(tarefa.tipo, parametros)
+        
+        TarefaService._finalizar(tarefa_id, resultado)
+    
+    @staticmethod
+    def registrar_progresso(tarefa_id, percentual=None, mensagem=None):
+        """
+        Grava o progresso da tarefa em uma conexão separada da sessão e retorna se o
+        cancelamento foi solicitado. No SQLite, enquanto outra transação mantém o
+        banco bloqueado para escrita, a gravação é ignorada (o progresso é
+        informativo) e apenas o pedido de cancelamento é lido.
+        """
+        valores = {'data_atualizacao': datetime.utcnow()}
+        if percentual is not None:
+            valores['progresso'] = max(0.0, min(100.0, float(percentual)))
+        if mensagem:
+            valores['mensagem'] = mensagem[:255]
+        
+        tabela = Tarefa.__table__
+        
+        # SQLite em memória compartilha a conexão da sessão: gravar aqui confirmaria
+        # a transação do serviço
+        if db.engine.dialect.name == 'sqlite' and db.engine.url.database in (None, '', ':memory:'):
+            return False
+        
+        try:
+            with db.engine.connect() as conexao:
+                sqlite = conexao.dialect.name == 'sqlite'
+                if sqlite:
+                    espera_original = conexao.exec_driver_sql('PRAGMA busy_timeout').scalar()
+                    conexao.exec_driver_sql('PRAGMA busy_timeout = 100')
+                try:
+                    try:
+                        conexao.execute(update(tabela).where(tabela.c.id == tarefa_id).values(**valores))
+                        conexao.commit()
+                    except OperationalError:
+                        conexao.rollback()
+                    
+                    cancelar = conexao.execute(
+                        select(tabela.c.cancelamento_solicitado).where(tabela.c.id == tarefa_id)
+                    ).scalar()
+                    conexao.rollback()
+                    return bool(cancelar)
+                finally:
+                    if sqlite:
+                        conexao.exec_driver_sql(f'PRAGMA busy_timeout = {int(espera_original)}')
+        except OperationalError:
+            return False
+    
+    @staticmethod
+    def recuperar_interrompidas(host=None):
+        """
+        Devolve à fila as tarefas em execução por trabalhadores deste host cujo
+        processo não existe mais (ex.: reinício do servidor). Após MAX_TENTATIVAS
+        a tarefa é encerrada com erro. Retorna a quantidade de tarefas recuperadas.
+        """
+        host = host or socket.gethostname()
+        recuperadas = 0
+        
+        try:
+            tarefas = Tarefa.query.filter(
+                Tarefa.status == Tarefa.EXECUTANDO,
+                Tarefa.trabalhador.like(f'{host}:%')
+            ).all()
+            
+            for tarefa in tarefas:
+                pid = tarefa.trabalhador.rsplit(':', 1)[1]
+                if pid.isdigit() and TarefaService._processo_ativo(int(pid)):
+                    continue
+                
+                tarefa.data_atualizacao = datetime.utcnow()
+                if (tarefa.tentativas or 0) >= TarefaService.MAX_TENTATIVAS:
+                    tarefa.status = Tarefa.ERRO
+                    tarefa.mensagem = f'Trabalhador interrompido após {tarefa.tentativas} tentativas'
+                    tarefa.data_fim = tarefa.data_atualizacao
+                    TarefaService._remover_arquivos(tarefa.tipo, tarefa.get_parametros())
+                else:
+                    tarefa.status = Tarefa.PENDENTE
+                    tarefa.trabalhador = None
+                    tarefa.progresso = 0.0
+                    tarefa.mensagem = 'Trabalhador interrompido; tarefa devolvida à fila'
+                recuperadas += 1
+            
+            db.session.commit()
+            return recuperadas
+            
+        except Exception:
+            db.session.rollback()
+            raise
+    
+    @staticmethod
+    def _finalizar(tarefa_id, resultado):
+        tarefa = db.session.get(Tarefa, tarefa_id)
+        db.session.refresh(tarefa)
+        
+        if resultado.get('success'):
+            tarefa.status = Tarefa.CONCLUIDA
+            tarefa.progresso = 100.0
+        elif tarefa.cancelamento_solicitado:
+            tarefa.status = Tarefa.CANCELADA
+            resultado['message'] = 'Tarefa cancelada durante a execução; alterações desfeitas'
+        else:
+            tarefa.status = Tarefa.ERRO
+        
+        tarefa.mensagem = (resultado.get('message') or '')[:255] or None
+        tarefa.resultado_json = json.dumps(resultado, ensure_ascii=False, default=str)
+        tarefa.data_fim = datetime.utcnow()
+        tarefa.data_atualizacao = tarefa.data_fim
+        db.session.commit()
+    
+    @staticmethod
+    def _processo_ativo(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+    
+    @staticmethod
+    def _remover_arquivos(tipo, parametros):
+        """Remove os arquivos enviados para tarefas de importação (remover_arquivos=True)"""
+        if not parametros.get('remover_arquivos'):
+            return
+        
+        if tipo == 'importar_balancete':
+            caminhos = [parametros.get('caminho')]
+        elif tipo == 'importar_balancetes':
+            caminhos = [arquivo.get('caminho') for arquivo in parametros.get('arquivos', [])]
+        else:
+            return
+        
+        for caminho in caminhos:
+            if caminho and os.path.exists(caminho):
+                os.remove(caminho)
+        
+        diretorio = os.path.dirname(caminhos[0] or '')
+        if diretorio and os.path.isdir(diretorio) and not os.listdir(diretorio):
+            os.rmdir(diretorio)
+    
+    # Executores: (parametros, progresso) -> resultado {'success', 'data', 'message'}
+    
+    @staticmethod
+    def _gerar_demonstracao(parametros, progresso):
+        tipo = parametros['tipo']
+        versao_balancete = parametros.get('versao_balancete', '1.0')
+        versao_plano_contas = parametros.get('versao_plano_contas', '1.0')
+        
+        progresso(0.0, f'Gerando {tipo}')
+        
+        if tipo in ('DRE', 'BP', 'DRA', 'DVA'):
+            if not parametros.get('periodo'):
+                return {'success': False, 'message': 'Período é obrigatório'}
+            gerar = {
+                'DRE': DREService.gerar_dre,
+                'BP': BalancoPatrimonialService.gerar_balanco_patrimonial,
+                'DRA': DRAService.gerar_dra,
+                'DVA': DVAService.gerar_dva
+            }[tipo]
+            return gerar(parametros['periodo'], versao_balancete, versao_plano_contas)
+        
+        if tipo in ('DFC', 'DMPL'):
+            if not parametros.get('periodo_inicial') or not parametros.get('periodo_final'):
+                return {'success': False, 'message': 'Período inicial e período final são obrigatórios'}
+            if tipo == 'DFC':
+                return DFCService.gerar_dfc(
+                    parametros['periodo_inicial'], parametros['periodo_final'],
+                    parametros.get('metodo', 'indireto'), versao_balancete, versao_plano_contas
+                )
+            return DMPLService.gerar_dmpl(
+                parametros['periodo_inicial'], parametros['periodo_final'], versao_balancete, versao_plano_contas
+            )
+        
+        return {'success': False, 'message': f'Demonstração não suportada: {tipo}'}
+    
+    @staticmethod
+    def _gerar_todas(parametros, progresso):
+        progresso(0.0, 'Gerando demonstrações')
+        return DemonstracoesService.gerar_todas(
+            parametros['periodo_inicial'],
+            parametros['periodo_final'],
+            parametros.get('versao_balancete', '1.0'),
+            parametros.get('versao_plano_contas', '1.0'),
+            parametros.get('metodo_dfc', 'indireto')
+        )
+    
+    @staticmethod
+    def _gerar_lote(parametros, progresso):
+        return DemonstracoesService.gerar_lote(
+            parametros['periodo_inicial'],
+            parametros['periodo_final'],
+            tuple(parametros.get('tipos') or ('DRE', 'BP')),
+            parametros.get('versao_balancete', '1.0'),
+            parametros.get('versao_plano_contas', '1.0'),
+            progresso
+        )
+    
+    @staticmethod
+    def _importar_balancete(parametros, progresso):
+        return ImportacaoBalanceteService.importar_arquivo(
+            parametros['caminho'],
+            parametros.get('nome_arquivo') or os.path.basename(parametros['caminho']),
+            parametros['periodo'],
+            parametros.get('versao_balancete', '1.0'),
+            parametros.get('versao_plano_contas', '1.0'),
+            bool(parametros.get('ignorar_zeros')),
+            progresso
+        )
+    
+    @staticmethod
+    def _importar_balancetes(parametros, progresso):
+        return ImportacaoParalelaService.importar_arquivos(
+            parametros['arquivos'],
+            parametros.get('versao_plano_contas', '1.0'),
+            bool(parametros.get('ignorar_zeros')),
+            parametros.get('processos'),
+            progresso
+        )
+
+
+TarefaService.EXECUTORES = {
+    'gerar_demonstracao': TarefaService._gerar_demonstracao,
+    'gerar_todas': TarefaService._gerar_todas,
+    'gerar_lote': TarefaService._gerar_lote,
+    'importar_balancete': TarefaService._importar_balancete,
+    'importar_balancetes': TarefaService._importar_balancetes
+}
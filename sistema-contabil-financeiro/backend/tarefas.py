@@ -0,0 +1,234 @@
+from flask import Blueprint, current_app, jsonify, request
+from src.services.tarefa_service import TarefaService
+from src.services.importacao_paralela import ImportacaoParalelaService
+from werkzeug.utils import secure_filename
+import os
+import shutil
+import tempfile
+
+tarefas_bp = Blueprint('tarefas', __name__)
+
+def _diretorio_arquivos():
+    """
+    Diretório onde os arquivos enviados aguardam o trabalhador (configuração
+    DIRETORIO_TAREFAS; deve ser acessível pelos processos trabalhadores)
+    """
+    base = current_app.config.get('DIRETORIO_TAREFAS') or os.path.join(tempfile.gettempdir(), 'indicium360_tarefas')
+    os.makedirs(base, exist_ok=True)
+    return tempfile.mkdtemp(prefix='tarefa_', dir=base)
+
+def _remover_diretorio(diretorio):
+    """Descarta os arquivos enviados de uma tarefa que não foi enfileirada"""
+    shutil.rmtree(diretorio, ignore_errors=True)
+
+def _booleano(valor):
+    return (valor or 'false').lower() in ('1', 'true', 'sim', 'on')
+
+def _resposta_enfileirada(resultado):
+    return jsonify(resultado), 202 if resultado['success'] else 400
+
+@tarefas_bp.route('/tarefas', methods=['POST'])
+def criar_tarefa():
+    """
+    Enfileira uma tarefa. JSON: tipo (gerar_demonstracao, gerar_todas, gerar_lote)
+    e parametros, os mesmos das rotas síncronas correspondentes. Retorna a tarefa
+    (id e status) para acompanhamento em GET /tarefas/<id>.
+    """
+    try:
+        data = request.get_json() or {}
+        tipo = data.get('tipo')
+        
+        if not tipo:
+            return jsonify({
+                'success': False,
+                'message': 'Tipo da tarefa é obrigatório'
+            }), 400
+        
+        # Tarefas de importação recebem arquivos: usar as rotas de upload abaixo
+        if tipo.startswith('importar_'):
+            return jsonify({
+                'success': False,
+                'message': 'Use /tarefas/importacoes/balancete ou /tarefas/importacoes/balancetes/lote para importar arquivos'
+            }), 400
+        
+        return _resposta_enfileirada(TarefaService.enfileirar(tipo, data.get('parametros') or {}))
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao criar tarefa: {str(e)}'
+        }), 500
+
+@tarefas_bp.route('/tarefas/importacoes/balancete', methods=['POST'])
+def enfileirar_importacao_balancete():
+    """
+    Enfileira a importação de um balancete. Formulário multipart igual ao de
+    /importacoes/balancete: arquivo, periodo, versao_balancete,
+    versao_plano_contas e ignorar_zeros.
+    """
+    try:
+        arquivo = request.files.get('arquivo')
+        periodo = request.form.get('periodo')
+        
+        if not arquivo or not arquivo.filename:
+            return jsonify({
+                'success': False,
+                'message': 'Arquivo do balancete é obrigatório'
+            }), 400
+        
+        if not periodo:
+            return jsonify({
+                'success': False,
+                'message': 'Período é obrigatório'
+            }), 400
+        
+        diretorio = _diretorio_arquivos()
+        try:
+            caminho = os.path.join(diretorio, secure_filename(arquivo.filename) or 'arquivo')
+            arquivo.save(caminho)
+            
+            resultado = TarefaService.enfileirar('importar_balancete', {
+                'caminho': caminho,
+                'nome_arquivo': arquivo.filename,
+                'periodo': periodo,
+                'versao_balancete': request.form.get('versao_balancete', '1.0'),
+                'versao_plano_contas': request.form.get('versao_plano_contas', '1.0'),
+                'ignorar_zeros': _booleano(request.form.get('ignorar_zeros')),
+                'remover_arquivos': True
+            })
+        except Exception:
+            _remover_diretorio(diretorio)
+            raise
+        
+        if not resultado['success']:
+            _remover_diretorio(diretorio)
+        
+        return _resposta_enfileirada(resultado)
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao enfileirar importação: {str(e)}'
+        }), 500
+
+@tarefas_bp.route('/tarefas/importacoes/balancetes/lote', methods=['POST'])
+def enfileirar_importacao_lote():
+    """
+    Enfileira a importação de vários balancetes. Formulário multipart igual ao de
+    /importacoes/balancetes/lote.
+    """
+    try:
+        arquivos = [arquivo for arquivo in request.files.getlist('arquivos') if arquivo and arquivo.filename]
+        
+        if not arquivos:
+            return jsonify({
+                'success': False,
+                'message': 'Envie ao menos um arquivo de balancete'
+            }), 400
+        
+        periodos = request.form.getlist('periodos') or [None] * len(arquivos)
+        versoes = request.form.getlist('versoes_balancete') or [request.form.get('versao_balancete', '1.0')] * len(arquivos)
+        
+        if len(periodos) != len(arquivos) or len(versoes) != len(arquivos):
+            return jsonify({
+                'success': False,
+                'message': 'Informe um período e uma versão para cada arquivo (ou nenhum)'
+            }), 400
+        
+        if len(arquivos) > ImportacaoParalelaService.LIMITE_ARQUIVOS:
+            return jsonify({
+                'success': False,
+                'message': f'O lote aceita no máximo {ImportacaoParalelaService.LIMITE_ARQUIVOS} arquivos'
+            }), 400
+        
+        processos = request.form.get('processos')
+        if processos:
+            try:
+                processos = int(processos)
+            except ValueError:
+                processos = 0
+            if processos < 1:
+                return jsonify({
+                    'success': False,
+                    'message': 'processos deve ser um número inteiro maior que zero'
+                }), 400
+        
+        diretorio = _diretorio_arquivos()
+        try:
+            lote = []
+            for indice, (arquivo, periodo, versao) in enumerate(zip(arquivos, periodos, versoes)):
+                caminho = os.path.join(diretorio, f'{indice:02d}_{secure_filename(arquivo.filename) or "arquivo"}')
+                arquivo.save(caminho)
+                lote.append({
+                    'caminho': caminho,
+                    'nome': arquivo.filename,
+                    'periodo': periodo or None,
+                    'versao_balancete': versao or '1.0'
+                })
+            
+            resultado = TarefaService.enfileirar('importar_balancetes', {
+                'arquivos': lote,
+                'versao_plano_contas': request.form.get('versao_plano_contas', '1.0'),
+                'ignorar_zeros': _booleano(request.form.get('ignorar_zeros')),
+                'processos': processos or None,
+                'remover_arquivos': True
+            })
+        except Exception:
+            _remover_diretorio(diretorio)
+            raise
+        
+        if not resultado['success']:
+            _remover_diretorio(diretorio)
+        
+        return _resposta_enfileirada(resultado)
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao enfileirar importação: {str(e)}'
+        }), 500
+
+@tarefas_bp.route('/tarefas', methods=['GET'])
+def listar_tarefas():
+    """Tarefas mais recentes. Filtros: status, tipo e limite"""
+    try:
+        resultado = TarefaService.listar(
+            request.args.get('status'),
+            request.args.get('tipo'),
+            request.args.get('limite', 50, type=int)
+        )
+        
+        return jsonify(resultado), 200 if resultado['success'] else 400
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao listar tarefas: {str(e)}'
+        }), 500
+
+@tarefas_bp.route('/tarefas/<int:tarefa_id>', methods=['GET'])
+def obter_tarefa(tarefa_id):
+    """Status, progresso e, quando finalizada, resultado da tarefa"""
+    try:
+        resultado = TarefaService.obter(tarefa_id)
+        
+        return jsonify(resultado), 200 if resultado['success'] else 404
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao obter tarefa: {str(e)}'
+        }), 500
+
+@tarefas_bp.route('/tarefas/<int:tarefa_id>/cancelar', methods=['POST'])
+def cancelar_tarefa(tarefa_id):
+    try:
+        resultado = TarefaService.cancelar(tarefa_id)
+        
+        return jsonify(resultado), 200 if resultado['success'] else 400
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erro ao cancelar tarefa: {str(e)}'
+        }), 500
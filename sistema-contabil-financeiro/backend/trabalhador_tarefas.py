@@ -0,0 +1,94 @@
+"""
+Trabalhadores da fila de tarefas (TarefaService). Cada processo reserva a
+próxima tarefa pendente no banco, executa e grava o resultado; sem tarefas,
+aguarda o intervalo de consulta. Não há broker externo: basta apontar os
+trabalhadores para o mesmo banco da aplicação.
+
+Uso pela linha de comando:
+    python -m src.services.trabalhador_tarefas --uri sqlite:///caminho/app.db --processos 2
+"""
+from src.models.user import db
+from src.models.perfil_banco import criar_app
+from src.services.tarefa_service import TarefaService
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+
+
+def nome_trabalhador():
+    """Identificação gravada na tarefa reservada (host:pid)"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def executar_trabalhador(uri, intervalo=1.0, tipos=None, parar=None):
+    """Laço de um trabalhador: executa tarefas até parar ser sinalizado"""
+    parar = parar or multiprocessing.Event()
+    
+    # O processo principal encerra os trabalhadores pelo evento; a tarefa em
+    # andamento termina antes da saída
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *args: parar.set())
+    
+    app = criar_app(uri)
+    with app.app_context():
+        trabalhador = nome_trabalhador()
+        while not parar.is_set():
+            try:
+                executada = TarefaService.executar_proxima(trabalhador, tipos)
+            except Exception as e:
+                db.session.rollback()
+                print(f'[{trabalhador}] erro ao reservar tarefa: {str(e)}', flush=True)
+                executada = None
+            
+            if executada is None:
+                parar.wait(intervalo)
+        
+        db.session.remove()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Trabalhadores da fila de tarefas em segundo plano')
+    parser.add_argument('--uri', required=True, help='URI do banco de dados da aplicação')
+    parser.add_argument('--processos', type=int, default=1, help='Quantidade de processos trabalhadores')
+    parser.add_argument('--intervalo', type=float, default=1.0, help='Segundos entre consultas com a fila vazia')
+    parser.add_argument('--tipos', help='Tipos de tarefa atendidos, separados por vírgula (padrão: todos)')
+    args = parser.parse_args()
+    
+    tipos = args.tipos.split(',') if args.tipos else None
+    
+    app = criar_app(args.uri)
+    with app.app_context():
+        db.create_all()
+        recuperadas = TarefaService.recuperar_interrompidas()
+        if recuperadas:
+            print(f'{recuperadas} tarefas interrompidas devolvidas à fila', flush=True)
+        db.session.remove()
+        db.engine.dispose()
+    
+    parar = multiprocessing.Event()
+    processos = [
+        multiprocessing.Process(
+            target=executar_trabalhador,
+            args=(args.uri, args.intervalo, tipos, parar),
+            name=f'trabalhador-{indice + 1}'
+        )
+        for indice in range(max(1, args.processos))
+    ]
+    for processo in processos:
+        processo.start()
+    
+    def encerrar(*args):
+        parar.set()
+    
+    signal.signal(signal.SIGINT, encerrar)
+    signal.signal(signal.SIGTERM, encerrar)
+    print(f'{len(processos)} trabalhadores em execução (Ctrl+C para encerrar)', flush=True)
+    
+    for processo in processos:
+        processo.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,17 @@
 from flask_sqlalchemy import SQLAlchemy
+from src.models.roteamento import SessaoRoteada
 
-db = SQLAlchemy()
+# Sessão com roteamento de leitura/escrita (ver src.models.roteamento)
+db = SQLAlchemy(session_options={'class_': SessaoRoteada})
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-
+    
     def __repr__(self):
         return f'<User {self.username}>'
-
+    
     def to_dict(self):
         return {
             'id': self.id,
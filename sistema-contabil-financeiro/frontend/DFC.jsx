@@ -7,6 +7,7 @@ import { Alert, AlertDescription } from '@/components/ui/alert.jsx'
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/components/ui/select.jsx'
 import { Badge } from '@/components/ui/badge.jsx'
 import { Calculator, AlertCircle, CheckCircle, ArrowRight, TrendingUp, TrendingDown } from 'lucide-react'
+import { executarTarefa } from './tarefas.js'
 
 function DFC() {
   const [periodoInicial, setPeriodoInicial] = useState('')
@@ -30,22 +31,15 @@ function DFC() {
       setError(null)
       setSuccess(null)
 
-      const response = await fetch('/api/demonstracoes/dfc/gerar', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          periodo_inicial: periodoInicial,
-          periodo_final: periodoFinal,
-          metodo: metodo,
-          versao_balancete: versaoBalancete,
-          versao_plano_contas: versaoPlanoContas
-        })
+      const data = await executarTarefa('gerar_demonstracao', {
+        tipo: 'DFC',
+        periodo_inicial: periodoInicial,
+        periodo_final: periodoFinal,
+        metodo: metodo,
+        versao_balancete: versaoBalancete,
+        versao_plano_contas: versaoPlanoContas
       })
 
-      const data = await response.json()
-
       if (data.success) {
         setDfc(data.data)
         setSuccess(data.message)
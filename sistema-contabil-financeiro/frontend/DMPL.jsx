@@ -6,6 +6,7 @@ import { Label } from '@/components/ui/label.jsx'
 import { Alert, AlertDescription } from '@/components/ui/alert.jsx'
 import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from '@/components/ui/table.jsx'
 import { Calculator, AlertCircle, CheckCircle, ArrowRight } from 'lucide-react'
+import { executarTarefa } from './tarefas.js'
 
 function DMPL() {
   const [periodoInicial, setPeriodoInicial] = useState('')
@@ -28,21 +29,14 @@ function DMPL() {
       setError(null)
       setSuccess(null)
 
-      const response = await fetch('/api/demonstracoes/dmpl/gerar', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          periodo_inicial: periodoInicial,
-          periodo_final: periodoFinal,
-          versao_balancete: versaoBalancete,
-          versao_plano_contas: versaoPlanoContas
-        })
+      const data = await executarTarefa('gerar_demonstracao', {
+        tipo: 'DMPL',
+        periodo_inicial: periodoInicial,
+        periodo_final: periodoFinal,
+        versao_balancete: versaoBalancete,
+        versao_plano_contas: versaoPlanoContas
       })
 
-      const data = await response.json()
-
       if (data.success) {
         setDmpl(data.data)
         setSuccess(data.message)
@@ -6,6 +6,7 @@ import { Label } from '@/components/ui/label.jsx'
 import { Alert, AlertDescription } from '@/components/ui/alert.jsx'
 import { Badge } from '@/components/ui/badge.jsx'
 import { TrendingUp, Calculator, AlertCircle, CheckCircle } from 'lucide-react'
+import { executarTarefa } from './tarefas.js'
 
 function DRA() {
   const [periodo, setPeriodo] = useState('')
@@ -27,20 +28,13 @@ function DRA() {
       setError(null)
       setSuccess(null)
 
-      const response = await fetch('/api/demonstracoes/dra/gerar', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          periodo,
-          versao_balancete: versaoBalancete,
-          versao_plano_contas: versaoPlanoContas
-        })
+      const data = await executarTarefa('gerar_demonstracao', {
+        tipo: 'DRA',
+        periodo,
+        versao_balancete: versaoBalancete,
+        versao_plano_contas: versaoPlanoContas
       })
 
-      const data = await response.json()
-
       if (data.success) {
         setDra(data.data)
         setSuccess(data.message)
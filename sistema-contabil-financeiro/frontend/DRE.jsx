@@ -7,6 +7,7 @@ import { Alert, AlertDescription } from '@/components/ui/alert.jsx'
 import { Separator } from '@/components/ui/separator.jsx'
 import { Badge } from '@/components/ui/badge.jsx'
 import { TrendingUp, Calculator, AlertCircle, CheckCircle } from 'lucide-react'
+import { executarTarefa } from './tarefas.js'
 
 function DRE() {
   const [periodo, setPeriodo] = useState('')
@@ -28,20 +29,13 @@ function DRE() {
       setError(null)
       setSuccess(null)
 
-      const response = await fetch('/api/demonstracoes/dre/gerar', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          periodo,
-          versao_balancete: versaoBalancete,
-          versao_plano_contas: versaoPlanoContas
-        })
+      const data = await executarTarefa('gerar_demonstracao', {
+        tipo: 'DRE',
+        periodo,
+        versao_balancete: versaoBalancete,
+        versao_plano_contas: versaoPlanoContas
       })
 
-      const data = await response.json()
-
       if (data.success) {
         setDre(data.data)
         setSuccess(data.message)
@@ -7,6 +7,7 @@ import { Alert, AlertDescription } from '@/components/ui/alert.jsx'
 import { Badge } from '@/components/ui/badge.jsx'
 import { Progress } from '@/components/ui/progress.jsx'
 import { Calculator, AlertCircle, CheckCircle, PieChart, Users, Building, DollarSign } from 'lucide-react'
+import { executarTarefa } from './tarefas.js'
 
 function DVA() {
   const [periodo, setPeriodo] = useState('')
@@ -28,20 +29,13 @@ function DVA() {
       setError(null)
       setSuccess(null)
 
-      const response = await fetch('/api/demonstracoes/dva/gerar', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          periodo,
-          versao_balancete: versaoBalancete,
-          versao_plano_contas: versaoPlanoContas
-        })
+      const data = await executarTarefa('gerar_demonstracao', {
+        tipo: 'DVA',
+        periodo,
+        versao_balancete: versaoBalancete,
+        versao_plano_contas: versaoPlanoContas
       })
 
-      const data = await response.json()
-
       if (data.success) {
         setDva(data.data)
         setSuccess(data.message)
@@ -7,28 +7,45 @@ import { FileText, Calendar, Clock } from 'lucide-react'
 function DemonstracoesList() {
   const [demonstracoes, setDemonstracoes] = useState([])
   const [loading, setLoading] = useState(true)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [error, setError] = useState(null)
+  const [proximoCursor, setProximoCursor] = useState(null)
+
+  const TAMANHO_PAGINA = 30
 
   useEffect(() => {
     fetchDemonstracoes()
   }, [])
 
+  // A listagem é paginada e traz apenas os metadados (sem os dados das demonstrações)
+  const fetchPagina = async (cursor) => {
+    const params = new URLSearchParams({ limite: TAMANHO_PAGINA })
+    if (cursor) {
+      params.set('cursor', cursor)
+    }
+    
+    const response = await fetch(`/api/demonstracoes?${params.toString()}`)
+    
+    if (!response.ok) {
+      throw new Error('Erro ao carregar demonstrações')
+    }
+    
+    const data = await response.json()
+    
+    if (!data.success) {
+      throw new Error(data.message)
+    }
+    
+    return data
+  }
+
   const fetchDemonstracoes = async () => {
     try {
       setLoading(true)
-      const response = await fetch('/api/demonstracoes/listar')
-      
-      if (!response.ok) {
-        throw new Error('Erro ao carregar demonstrações')
-      }
-      
-      const data = await response.json()
-      
-      if (data.success) {
-        setDemonstracoes(data.data)
-      } else {
-        setError(data.message)
-      }
+      setError(null)
+      const data = await fetchPagina(null)
+      setDemonstracoes(data.data)
+      setProximoCursor(data.paginacao?.proximo_cursor || null)
     } catch (err) {
       setError(err.message)
     } finally {
@@ -36,6 +53,19 @@ function DemonstracoesList() {
     }
   }
 
+  const fetchMais = async () => {
+    try {
+      setLoadingMore(true)
+      const data = await fetchPagina(proximoCursor)
+      setDemonstracoes((atuais) => [...atuais, ...data.data])
+      setProximoCursor(data.paginacao?.proximo_cursor || null)
+    } catch (err) {
+      setError(err.message)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   const formatDate = (dateString) => {
     if (!dateString) return 'N/A'
     return new Date(dateString).toLocaleString('pt-BR')
@@ -172,6 +202,14 @@ function DemonstracoesList() {
           ))}
         </div>
       )}
+
+      {proximoCursor && (
+        <div className="flex justify-center">
+          <Button variant="outline" onClick={fetchMais} disabled={loadingMore}>
+            {loadingMore ? 'Carregando...' : 'Carregar mais'}
+          </Button>
+        </div>
+      )}
     </div>
   )
 }
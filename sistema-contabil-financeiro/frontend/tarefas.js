@@ -0,0 +1,49 @@
+// Cálculos demorados pela fila de tarefas do backend: a tarefa é enfileirada em
+// POST /api/tarefas e acompanhada em GET /api/tarefas/<id>, sem manter uma
+// requisição aberta durante o cálculo (sujeita ao timeout do proxy)
+
+const INTERVALO_CONSULTA_MS = 1000
+const STATUS_FINAIS = ['concluida', 'erro', 'cancelada']
+
+const esperar = (ms) => new Promise((resolve) => setTimeout(resolve, ms))
+
+// Aguarda o fim da tarefa e retorna o resultado do serviço ({ success, data, message })
+export async function acompanharTarefa(tarefaId) {
+  while (true) {
+    await esperar(INTERVALO_CONSULTA_MS)
+
+    const response = await fetch(`/api/tarefas/${tarefaId}`)
+    const data = await response.json()
+
+    if (!data.success) {
+      return data
+    }
+
+    const tarefa = data.data
+    if (STATUS_FINAIS.includes(tarefa.status)) {
+      return tarefa.resultado || {
+        success: tarefa.status === 'concluida',
+        message: tarefa.mensagem
+      }
+    }
+  }
+}
+
+// Enfileira a tarefa (tipo e parâmetros de POST /api/tarefas) e aguarda o resultado
+export async function executarTarefa(tipo, parametros) {
+  const response = await fetch('/api/tarefas', {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({ tipo, parametros })
+  })
+
+  const data = await response.json()
+
+  if (!data.success) {
+    return data
+  }
+
+  return acompanharTarefa(data.data.id)
+}